@@ -1,5 +1,5 @@
+import sys
 import time
-import pickle
 import ncudp
 
 def main():
@@ -7,55 +7,95 @@ def main():
     Main flow control logic for the network coded client.
     """
     args = ncudp.arguments() # Get arguments at execution
+    if args.output_file == "-": # Received data is written to stdout, so progress and statistics go to stderr
+        sys.stdout = sys.stderr
     c = ncudp.Client(args) # Instantiate ncUDP client object
     c.connection() # Initialise network socket
-    data_out = bytearray() # Initialise array for received data
+
+    c.benchmark() # Measure decode speed per field before joining, reported to the server for field selection
 
     print("\nClient initialised, awaiting connection...")
 
-    # Engineering phase: Client listens and responds to server advertisement
+    # Engineering phase: Client listens for the server announcement and joins until the server acknowledges it
     while True:
         type, addr = c.receive()
-        if type == 1:
-            c.transmit(c.create_packet(1), addr)
-            print(f"> Connected to server: {addr[0]}:{addr[1]}\n-------------------------------------")
+        if c.carousel: # A carousel is listened to without joining
+            print(f"> Listening to carousel from server: {c.server[0]}:{c.server[1]}\n-------------------------------------")
+            break
+        if type != 8 and c.server: # Join with loss and decode speed for field selection, again until acknowledged
+            for packet in c.signature_packets(): # Signatures of the basis for a delta transfer, ahead of the join
+                c.transmit(packet, c.server)
+            c.transmit(c.create_packet(1, c.capabilities()), c.server)
+        elif type == 8: # Join acknowledged
+            print(f"> Connected to server: {c.server[0]}:{c.server[1]} as client {c.hostname:08x}\n-------------------------------------")
             break
+    c.open_file() # Start writing decoded generations to the output file
 
     start = time.time() + 0.1 # Start timer for measuring decode time
 
-    # Loop for each generation in the file to be received
-    for x in range(c.num_gens):
-        # Receive data packets and respond with any missing
-        while True:
+    if c.carousel:
+        # Decode symbols of every generation as they come round, writing each generation once it is decoded
+        while len(c.done) < c.num_gens:
             type, addr = c.receive()
-            if type == 3: # Received end generation control packet
-                if c.decoder.is_complete(): # If all packets received, respond complete
-                    c.transmit(c.create_packet(4), addr)
-                    break
-                else: # Otherwise return number of missing packets
-                    res = pickle.dumps(c.missing)
-                    c.transmit(c.create_packet(3, res), addr)
-        # When generation complete, wait for all other clients to complete before moving to next generation.        
-        while True:
-            type, addr = c.receive()  
-            if type == 5: # Server signals all clients complete
-                c.progressBar(x+1, c.num_gens, 'Rx') # Increment receive progress
-                data_out.extend(c.data) # Append data to data array
-                c.next_gen() # Set the next generation for receiving
+            if type == 3 and c.collect_generation(c.rx_gen): # End of a generation, with its layout
+                c.progressBar(len(c.done), c.num_gens, 'Rx') # Increment receive progress
+            elif type == 6: # The carousel stopped before the whole file was decoded
+                print(f"\nCarousel stopped with {len(c.done)} of {c.num_gens} generations decoded")
                 break
-    # When last generation complete, wait for file transfer complete confirmation from server        
-    while True:
-        type, addr = c.receive()
-        if type == 6: # All clients finished receiving file
-            c.save_file(data_out) # Save data to file
-            break
+    else:
+        # Loop for each generation in the file to be received, skipping generations a delta transfer takes from the basis
+        # (the generation number echoed in feedback moves on as generations are completed or skipped)
+        while c.gen_number < c.num_gens:
+            # Receive data packets and respond with any missing
+            while c.gen_number < c.num_gens:
+                type, addr = c.receive()
+                x = c.gen_number
+                if type == 3 and c.rx_gen == x: # Received end generation control packet
+                    if args.peer_repair and not c.is_complete(x):
+                        c.request_peers() # Ask peers for the missing degrees of freedom first
+                    if c.is_complete(x): # If all packets received, respond complete
+                        c.transmit(c.create_packet(4), c.server)
+                        break
+                    else: # Otherwise return number of missing packets
+                        c.transmit(c.create_packet(3, c.nack(x)), c.server)
+                elif type == 5 and c.gen_number > x: # Playout deadline passed, the generation was delivered as it stood
+                    c.progressBar(x+1, c.num_gens, 'Rx') # Increment receive progress
+            if c.gen_number == c.num_gens: # The rest of the file was skipped, unchanged from the basis
+                break
+            # When generation complete, wait for all other clients to complete before moving to next generation.        
+            while True:
+                type, addr = c.receive()  
+                if type == 5 and c.rx_gen == x: # Server signals all clients complete
+                    c.progressBar(x+1, c.num_gens, 'Rx') # Increment receive progress
+                    c.flush_generation(x) # Write the decoded generation to the output file in the background
+                    c.gen_number = x + 1 # Ignore any late packets of the completed generation
+                    break
+                elif type == 3 and c.rx_gen == x: # Server missed the generation complete packet, re-send it
+                    c.transmit(c.create_packet(4), c.server)
+        # When last generation complete, wait for file transfer complete confirmation from server        
+        while type != 6: # All clients finished receiving file
+            type, addr = c.receive()
+    c.save_file() # Wait for the remaining data to be written
+    c.pool.shutdown() # Stop the decoding workers
 
     delta = time.time() - start # Calculate total decode time
 
     # Print statistics to terminal
     print("\nFile transfer complete!\n-------------------------------------")
     print(f"Decode Rate: {round((c.total_bytes / delta)/1e6, 2)} MBytes/s")
-    print(f"Erasure Rate: {round(((c.erased)/(c.total_rx)) * 100, 1)}%\n")
+    print(f"Erasure Rate: {round(((c.erased)/max(c.total_rx, 1)) * 100, 1)}%")
+    if c.tree:
+        print(f"Files written: {c.writer.completed}")
+    print(f"Coding efficiency: {c.innovative} innovative, {c.wasted} wasted ({round((c.innovative / max(c.innovative + c.wasted, 1)) * 100, 1)}% innovative)")
+    if c.expired:
+        print(f"Generations expired: {c.expired} (delivered as zeros)")
+    if c.basis:
+        print(f"Generations from basis: {c.from_basis}/{c.num_gens}")
+    if c.layers > 1:
+        print(f"Layers: {len(c.socks)}/{c.layers} at the end, {c.joins} joined, {c.leaves} left")
+    if c.carousel:
+        print(f"Carousel cycles: {round(c.cycles(), 2)} (expected {round(ncudp.expected_cycles(c.erasure / 100, c.num_gens, c.gen_size), 2)} at {round(c.erasure, 1)}% loss)")
+    print(f"Peer repairs sent: {c.peer_tx}\n")
     print(f"Run-time: {delta}")
     c.sock.close() # Close the socket
 
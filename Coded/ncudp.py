@@ -1,4 +1,6 @@
 import argparse
+import bisect
+import concurrent.futures
 import kodo
 import os
 from os import path
@@ -7,11 +9,248 @@ import struct
 import select
 import sys
 import random
+import queue
 import hashlib
+import json
+from collections import Counter
+import threading
+import time
+import math
+import zlib
+from collections import OrderedDict
+try:
+    import zstandard
+except ImportError: # Only needed for zstd compression
+    zstandard = None
 
 MCAST_GRP = "224.1.1.1"
 MCAST_PORT = 5007
 
+DEFAULT_MTU = 1500 # Assumed MTU when it cannot be discovered from the outgoing interface
+IP_MTU = getattr(socket, 'IP_MTU', 14) # Linux socket option, not exposed by every Python build
+IP_MULTICAST_ALL = getattr(socket, 'IP_MULTICAST_ALL', 49) # Linux socket option, off so a socket only receives the groups it joined
+IP_UDP_HEADERS = 28 # Bytes of IPv4 and UDP header in every datagram
+MAX_DATAGRAM = 65507 # Largest UDP payload over IPv4
+LOSS_GAIN = 0.25 # Weight of the newest sample in the per client loss estimate
+RTT_ALPHA = 0.125 # Weight of the newest sample in the smoothed round trip time
+RTT_BETA = 0.25 # Weight of the newest sample in the round trip time variation
+INITIAL_RTO = 0.1 # Time to wait for a reply before any round trip time has been measured, in seconds
+MIN_RTO = 0.005 # Shortest time to wait for a reply, in seconds
+MAX_RTO = 1.0 # Longest time to wait for a reply, including back-off, in seconds
+FRAME_OVERHEAD = 100e-6 # Approximate per frame air time of WiFi preamble, inter-frame spacing and acknowledgement, in seconds
+
+FIELDS = {
+    "binary": kodo.FiniteField.binary,
+    "binary4": kodo.FiniteField.binary4,
+    "binary8": kodo.FiniteField.binary8,
+    "binary16": kodo.FiniteField.binary16,
+}
+FIELD_ORDERS = {"binary": 2, "binary4": 16, "binary8": 256, "binary16": 65536}
+FIELD_BITS = {FIELDS[name].value: int(math.log2(order)) for name, order in FIELD_ORDERS.items()} # Bits per coefficient
+DENSE = 255 # Header density value of uniformly random coefficients, lower values are sparse with density / DENSE non-zero
+GEN_SIZES = (16, 32, 64, 128, 256) # Candidate generation sizes for automatic selection
+BENCH_GEN_SIZE = 32 # Generation size used by clients to measure decode speed
+
+VERSION = 8 # Wire format version, packets of any other version are dropped
+FLAG_REPAIR = 0x01 # Set on coded packets sent in a repair round
+FLAG_PEER = 0x02 # Set on coded packets sent by a peer client rather than the server
+FLAG_CAROUSEL = 0x04 # Set on engineering packets of a carousel, whose seed is the cycle number
+FLAG_EXPIRED = 0x08 # Set on next generation packets sent once the playout deadline of the generation has passed
+
+PEER_BACKOFF = 0.01 # Upper bound of the random delay before a peer answers a repair request, in seconds
+PEER_WINDOW = 0.03 # Time a client waits for peer repairs before reporting missing packets to the server, in seconds
+PEER_HISTORY = 4 # Number of completed generations a client keeps to answer peers that are behind it
+IOV_MAX = 1024 # Most buffers written by a single writev call
+TREE_FDS = 64 # Most files of a directory tree the server holds open at once
+ZLIB_LEVEL = 6 # zlib compression level of generations
+ZSTD_LEVEL = 3 # zstd compression level of generations
+COMPRESS_SAMPLE = 4 # Generations spread through the file that are compressed to decide whether compression pays
+SIGNATURE_BYTES = 16 # Bytes of the hash of each generation a client reports from its existing copy of the file
+MAX_CYCLES = 1000 # Most carousel cycles summed by the expected cycles metric
+RLM_WINDOW = 0.25 # Time over which a client measures its loss rate before deciding to join or leave a layer, in seconds
+RLM_LOSS = 0.05 # Rise in the loss rate over the loss before the last join that a client takes as congestion
+RLM_JOIN = 0.5 # Time a client waits before trying to join a layer for the first time, in seconds
+RLM_MAX_JOIN = 8.0 # Longest time a client waits before trying again to join a layer it had to leave, in seconds
+CAPACITY_BURST = 0.05 # Time of data at the simulated link capacity a client can take in a burst, in seconds
+
+CODECS = {"none": 0, "zlib": 1, "zstd": 2} # Generation compression codecs, advertised by number
+
+# Header of every server packet: version, packet_type, flags, session, generation, seed, density
+SERVER_HEADER = struct.Struct('<BBBHIIB')
+# Header of every client packet: version, packet_type, session, hostname, generation
+CLIENT_HEADER = struct.Struct('<BBHII')
+# Transfer parameters, carried only by engineering packets: total_bytes, packet_bytes, gen_size, field, codec, tree (1 when a
+# directory tree is sent), layers (the number of multi-cast layers of a carousel)
+ENGINEERING = struct.Struct('<QHIBBBB')
+# Capabilities a client joins with: peer_repair, loss (its erasure rate from 0 to 1), and the generation size in bytes its basis
+# was signed with, 0 without a basis
+CAPABILITIES = struct.Struct('<?fI')
+# Decode speed of a finite field a client reports after its capabilities, once per field: field value, speed in MB/s
+FIELD_SPEED = struct.Struct('<Bf')
+# Length of the manifest at the start of a directory tree transfer, which follows it as JSON
+MANIFEST = struct.Struct('<I')
+# Layout of a generation, carried by end generation control packets: packets, codec, compressed length
+LAYOUT = struct.Struct('<IBI')
+# First generation skipped by a delta transfer before the generation of a control packet (after the layout of end
+# generation packets, or the payload of file complete packets), equal to that generation if none were skipped
+SKIPPED = struct.Struct('<I')
+# Payload of a peer repair request: the number of degrees of freedom the requesting client is missing
+PEER_COUNT = struct.Struct('<I')
+# Payload of missing packets feedback: the number of degrees of freedom the client is missing from its generation
+MISSING = struct.Struct('<I')
+
+
+
+def compress(codec, data):
+    """
+    Compresses data with a codec
+
+    Parameters
+    ----------
+    codec : int
+        The codec, a value of CODECS other than none
+    data : bytes
+        The bytes-like data to compress
+
+    Returns
+    -------
+    The compressed bytes
+    """
+    if codec == CODECS["zstd"]:
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return zlib.compress(data, ZLIB_LEVEL)
+
+
+def decompress(codec, data):
+    """
+    Decompresses data compressed by compress()
+
+    Parameters
+    ----------
+    codec : int
+        The codec the data was compressed with
+    data : bytes
+        The compressed bytes
+
+    Returns
+    -------
+    The decompressed bytes
+    """
+    if codec == CODECS["zstd"]:
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+def signature(data, block_bytes):
+    """
+    Returns the signature of a generation: a hash of its data, padded with zeros to the generation size as it is sent
+
+    Parameters
+    ----------
+    data : bytes
+        The bytes of the generation read from a file, fewer than block_bytes at the end of the file
+    block_bytes : int
+        The number of bytes in one generation
+
+    Returns
+    -------
+    A digest of SIGNATURE_BYTES bytes
+    """
+    digest = hashlib.blake2b(data, digest_size=SIGNATURE_BYTES)
+    digest.update(bytes(block_bytes - len(data)))
+    return digest.digest()
+
+
+def binomial_tail(n, q, need):
+    """
+    Returns the probability that at least need of n packets arrive, each arriving independently with probability q
+
+    Parameters
+    ----------
+    n : int
+        The number of packets sent
+    q : float
+        The probability that a packet arrives
+    need : int
+        The number of packets needed
+
+    Returns
+    -------
+    The probability as a float
+    """
+    if need <= 0:
+        return 1.0
+    if need > n or q <= 0:
+        return 0.0
+    if q >= 1:
+        return 1.0
+    log_q, log_p = math.log(q), math.log1p(-q)
+    terms = (math.lgamma(n + 1) - math.lgamma(i + 1) - math.lgamma(n - i + 1) + i * log_q + (n - i) * log_p for i in range(need, n + 1))
+    return min(sum(math.exp(t) for t in terms), 1.0)
+
+
+def expected_cycles(loss, gens, k):
+    """
+    Returns the expected number of carousel cycles a client needs to decode every generation of the file at a packet loss
+    rate, counted in whole cycles from the start of a cycle. Each cycle sends k new coded symbols of every generation, and
+    a generation decodes once any k of them have arrived, taking every symbol as innovative as in a large field.
+    Generations are taken at their full size, as if uncompressed.
+
+    Parameters
+    ----------
+    loss : float
+        The packet loss rate, from 0 to 1
+    gens : int
+        The number of generations in the file
+    k : int
+        The number of packets per generation
+
+    Returns
+    -------
+    The expected number of cycles as a float, infinite if nothing arrives
+    """
+    if loss >= 1:
+        return math.inf
+    expected = 0
+    for cycles in range(MAX_CYCLES):
+        remaining = 1 - binomial_tail(cycles * k, 1 - loss, k) ** gens # Chance the file is not yet decoded after this many cycles
+        expected += remaining
+        if remaining < 1e-9:
+            break
+    return expected
+
+
+def pack_generation(buf, length, codec, packet_bytes):
+    """
+    Compresses a generation in place when that sends it in fewer packets. Each generation is compressed on its own, so it
+    can be decompressed without any other generation.
+
+    Parameters
+    ----------
+    buf : bytearray
+        A buffer holding the generation, of the generation size in packets
+    length : int
+        The number of bytes of the buffer read from the file
+    codec : int
+        The codec, a value of CODECS
+    packet_bytes : int
+        The number of bytes per packet
+
+    Returns
+    -------
+    length : int
+        The number of bytes of the buffer to send
+    codec : int
+        The codec the buffer now holds, 0 if it was left as it was read
+    """
+    if not codec:
+        return length, 0
+    data = compress(codec, memoryview(buf)[:length])
+    if -(-len(data) // packet_bytes) >= len(buf) // packet_bytes: # Saves no packet, send as it is
+        return length, 0
+    buf[:len(data)] = data
+    buf[len(data):] = bytes(len(buf) - len(data))
+    return len(data), codec
 
 class ncUDP:
     """
@@ -29,9 +268,15 @@ class ncUDP:
         an Kodo constant setting the finite field size for the encoder/decoder
     gen_size : int
         an integer representing the configured generation size
+    session : int
+        an integer identifying the transfer, chosen by the server and echoed in every packet
 
     Methods
     -------
+    set_field(field)
+        Sets the finite field from a Kodo constant or its header value
+    layer_address(layer)
+        Returns the multi-cast group and port of a layer
     progressBar(self, iteration, total, prefix = '', suffix = '', decimals = 1, length = 50, fill = '█', printEnd = "\r")
         Prints a transmission progress bar to the terminal during transmission
     """
@@ -45,8 +290,35 @@ class ncUDP:
         self.args = args
         self.mcast_grp = args.ip
         self.mcast_port = args.port
-        self.field = kodo.FiniteField.binary16
+        self.field = FIELDS.get(args.field, kodo.FiniteField.binary8) # Placeholder until negotiated in auto mode
         self.gen_size = self.args.gen_size
+        self.session = None
+
+    def set_field(self, field):
+        """
+        Sets the finite field used by the encoder/decoder
+
+        Parameters
+        ----------
+        field : kodo.FiniteField or int
+            A Kodo finite field constant, or the field value carried in a packet header
+        """
+        if isinstance(field, int):
+            field = kodo.FiniteField(field)
+        self.field = field
+
+    def layer_address(self, layer):
+        """
+        Returns the multi-cast group and port of a layer of a carousel. Layer 0 is the multi-cast group and port given, and
+        each layer above it takes the next group address and port.
+
+        Parameters
+        ----------
+        layer : int
+            The layer number
+        """
+        group = struct.unpack('!I', socket.inet_aton(self.mcast_grp))[0] + layer
+        return socket.inet_ntoa(struct.pack('!I', group)), self.mcast_port + layer
 
     def progressBar (self, iteration, total, prefix = '', suffix = '', decimals = 1, length = 50, fill = '█', printEnd = "\r"):
         """
@@ -72,118 +344,2731 @@ class ncUDP:
             print()
 
 
-class Server(ncUDP):
+class CoefficientGenerator:
     """
-    A class to enable a server to reliably transmit network coded data via multi-cast UDP socket to a client
+    A generator of coding coefficients from a seed, at a density given per symbol. Dense coefficients are generated by the
+    Kodo uniform generator, while sparse coefficients set each coefficient non-zero with probability density / DENSE, so
+    the decoder eliminates over far fewer symbols.
     ...
     Attributes
     ----------
-    clients : dict
-        a dictionary storing client hostname keys with state values
-    address : tuple
-        a tuple containing the IP address and port information for the multi-cast group
-    total_bytes : int
-        an integer representing the total number of bytes of data in the target file
+    dense : Kodo generator
+        a Kodo uniform generator used for dense coefficients
+    bits : int
+        an integer representing the number of bits per coefficient in the finite field
+    symbols : int
+        an integer representing the number of symbols in a generation
+    max_coefficients_bytes : int
+        an integer representing the size of a coefficient vector in bytes
+
+    Methods
+    -------
+    configure(symbols)
+        Sets the number of symbols the coefficients are generated for
+    generate(coefficients, seed, density=DENSE)
+        Generates the coefficients of a seed at a density
+    """
+    def __init__(self, field):
+        self.dense = kodo.block.generator.RandomUniform(field)
+        self.bits = FIELD_BITS[field.value]
+        self.symbols = 0
+        self.max_coefficients_bytes = 0
+
+    def configure(self, symbols):
+        """
+        Sets the number of symbols the coefficients are generated for
+
+        Parameters
+        ----------
+        symbols : int
+            The number of symbols in a generation
+        """
+        self.dense.configure(symbols)
+        self.symbols = symbols
+        self.max_coefficients_bytes = self.dense.max_coefficients_bytes
+
+    def generate(self, coefficients, seed, density=DENSE):
+        """
+        Generates the coefficients of a seed at a density into a buffer, packed as the Kodo encoder and decoder expect
+
+        Parameters
+        ----------
+        coefficients : bytearray
+            A buffer of max_coefficients_bytes to hold the coefficients
+        seed : int
+            The seed the coefficients are generated from
+        density : int, default=DENSE
+            The density of the coefficients, from 1 to DENSE
+        """
+        if density >= DENSE:
+            self.dense.set_seed(seed)
+            self.dense.generate(coefficients)
+            return
+        rng = random.Random(seed)
+        skip = math.log(1 - density / DENSE)
+        vector = 0
+        index = -1
+        while True:
+            index += 1 + int(math.log(1 - rng.random()) / skip) # Geometric gap to the next non-zero coefficient
+            if index >= self.symbols:
+                break
+            vector |= rng.randrange(1, 1 << self.bits) << (index * self.bits)
+        if not vector: # A zero vector carries nothing, so always code at least one symbol
+            vector = rng.randrange(1, 1 << self.bits) << (rng.randrange(self.symbols) * self.bits)
+        coefficients[:] = vector.to_bytes(len(coefficients), 'little')
+
+
+class SymbolCache:
+    """
+    A bounded, thread-safe LRU cache of coded symbols keyed by generation number and seed.
+    Holds symbols pre-encoded ahead of the send path, and recently sent symbols so they can be re-sent to clients catching up
+    on a generation without encoding them again.
+    ...
+    Attributes
+    ----------
+    capacity : int
+        an integer representing the maximum number of symbols held
+    symbols : OrderedDict
+        an ordered dictionary of (generation, seed) keys with coded symbol values, least recently used first
+    lock : threading.Lock
+        a lock guarding the cache, as it is filled from the pre-encoding thread
+
+    Methods
+    -------
+    put(gen, seed, symbol)
+        Adds a symbol to the cache, evicting the least recently used symbol when full
+    get(gen, seed)
+        Returns a cached symbol, or None
+    generation(gen)
+        Returns all cached (seed, symbol) pairs of a generation
+    """
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.symbols = OrderedDict()
+        self.lock = threading.Lock()
+
+    def put(self, gen, seed, symbol):
+        """
+        Adds a coded symbol to the cache, evicting the least recently used symbol when full
+
+        Parameters
+        ----------
+        gen : int
+            The generation number of the symbol
+        seed : int
+            The seed its coefficients were generated from
+        symbol : bytearray
+            The coded symbol
+        """
+        if self.capacity <= 0:
+            return
+        with self.lock:
+            self.symbols[(gen, seed)] = symbol
+            self.symbols.move_to_end((gen, seed))
+            while len(self.symbols) > self.capacity:
+                self.symbols.popitem(last=False)
+
+    def get(self, gen, seed):
+        """
+        Returns a cached coded symbol, marking it as recently used
+
+        Parameters
+        ----------
+        gen : int
+            The generation number of the symbol
+        seed : int
+            The seed its coefficients were generated from
+
+        Returns
+        -------
+        The coded symbol, or None if it is not cached
+        """
+        with self.lock:
+            symbol = self.symbols.get((gen, seed))
+            if symbol is not None:
+                self.symbols.move_to_end((gen, seed))
+            return symbol
+
+    def generation(self, gen):
+        """
+        Returns all cached symbols of a generation, such as for a client catching up on a generation already sent
+
+        Parameters
+        ----------
+        gen : int
+            The generation number
+
+        Returns
+        -------
+        A list of (seed, symbol) tuples
+        """
+        with self.lock:
+            return [(key[1], symbol) for key, symbol in self.symbols.items() if key[0] == gen]
+
+
+def pread(f, size, offset):
+    """
+    Reads bytes of the target at an offset without moving its read position
+
+    Parameters
+    ----------
+    f : file or TreeReader
+        The open target file, or the directory tree being sent
+    size : int
+        The number of bytes to read
+    offset : int
+        The offset to read from
+
+    Returns
+    -------
+    The bytes read, fewer than size at the end of the target
+    """
+    if isinstance(f, TreeReader):
+        return f.pread(size, offset)
+    return os.pread(f.fileno(), size, offset)
+
+
+class ReadAhead:
+    """
+    Reads the target file a generation at a time on a background thread, into a bounded pool of reusable buffers, so the
+    send path takes generations that are already in memory rather than waiting on storage.
+    ...
+    Attributes
+    ----------
+    f : file
+        the open target file, read only by the read-ahead thread
+    block_bytes : int
+        an integer representing the number of bytes in one generation
+    blocks : list
+        a list of the generation numbers to read, in file order, so generations a delta transfer skips are never read
+    free : queue.Queue
+        a queue of buffers available to the read-ahead thread, bounding the memory used to depth + 1 generations
+    ready : queue.Queue
+        a queue of (buffer, length) pairs read ahead of the send path, in file order
+    depth : int
+        an integer representing the number of generations read ahead of the send path
+    reads : int
+        an integer storing the number of generations taken that were already read, rather than waited for
+    codec : int
+        an integer representing the codec generations are compressed with, 0 to send them as they are read
     packet_bytes : int
-        an integer representing the number of bytes per packet
-    total_packets : int
-        an integer representing the total number of packets of data to be transmitted
-    num_gens : int
-        an integer representing the total number of generations required to transmit the target file
-    tx : int
-        an integer storing the total number of data packets transmitted
-    current_gen : int
-        an integer storing the current generation number
-    
+        an integer representing the number of bytes per packet, as a generation is only compressed if it saves a packet
+    pool : concurrent.futures.ThreadPoolExecutor
+        the workers compressing generations ahead of the send path, None without compression
+    repeat : bool
+        a boolean set to read the generations again from the first once the last has been read, for a carousel
 
     Methods
     -------
-    connection()
-        Creates UDP network socket
-    open_file()
-        Opens target file for reading
-    set_encoder()
-        Configures the network coding encoder for the next generation
-    create_gen()
-        Reads next generation of data from target file and loads into encoder
-    create_packet(packet_type, seq=0, payload=b'')
-        Creates a packet with header and encoded packet data
-    transmit(packet)
-        Transmits packet via socket
-    receive()
-        Receives packets via socket
+    run()
+        Reads generations into free buffers until the whole file has been read
+    pack(buf, length)
+        Compresses a generation on a worker
+    next()
+        Returns the next generation of the file
+    release(buf)
+        Returns a buffer to the pool once the send path is finished with it
     """
+    def __init__(self, f, block_bytes, blocks, depth, codec=0, packet_bytes=0, repeat=False):
+        self.f = f
+        self.block_bytes = block_bytes
+        self.blocks = blocks
+        self.depth = max(depth, 1)
+        self.free = queue.Queue()
+        self.ready = queue.Queue()
+        self.reads = 0
+        self.codec = codec
+        self.packet_bytes = packet_bytes
+        self.pool = concurrent.futures.ThreadPoolExecutor(max_workers=min(self.depth, os.cpu_count() or 1)) if codec else None
+        self.repeat = repeat
+        for _ in range(self.depth + 1): # One more than is queued, for the generation being sent
+            self.free.put(bytearray(block_bytes))
+        if hasattr(os, 'posix_fadvise') and hasattr(self.f, 'fileno'): # Not available on every platform, or for a tree
+            os.posix_fadvise(self.f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        threading.Thread(target=self.run, daemon=True).start()
 
-    def __init__(self, args):
-        ncUDP.__init__(self, args)
-        self.clients = {}
-        self.address = (self.mcast_grp, self.mcast_port)
-        file_stats = os.stat(self.args.file_path)
-        self.total_bytes = file_stats.st_size
-        self.packet_bytes = self.args.packet_size
-        self.total_packets = self.total_bytes // self.packet_bytes + 1
-        if self.total_packets < self.gen_size:
-            self.gen_size = self.total_packets
-        self.num_gens = (-(-self.total_packets // self.gen_size))
-        self.encoder = kodo.block.Encoder(self.field)
-        self.generator = kodo.block.generator.RandomUniform(self.field)
-        self.set_encoder()
-        self.tx = 0
-        self.current_gen = 0
+    def run(self):
+        """
+        Runs on a background thread, reading each generation with a single large read into a free buffer. The kernel is
+        asked to start reading the generation after the queued ones, so storage stays busy while the thread waits for a buffer.
+        A carousel reads the file round and round, one cycle after another.
+        """
+        while True:
+            for i, block in enumerate(self.blocks):
+                buf = self.free.get() # Blocks while depth generations are queued ahead of the send path
+                if hasattr(os, 'posix_fadvise') and hasattr(self.f, 'fileno') and i + self.depth < len(self.blocks):
+                    os.posix_fadvise(self.f.fileno(), self.blocks[i + self.depth] * self.block_bytes, self.block_bytes, os.POSIX_FADV_WILLNEED)
+                self.f.seek(block * self.block_bytes)
+                length = self.f.readinto(buf)
+                buf[length:] = bytes(self.block_bytes - length) # Pad the final generation
+                if self.pool is not None: # Compressed by a worker, in file order as the send path takes the results in turn
+                    self.ready.put(self.pool.submit(self.pack, buf, length))
+                else:
+                    self.ready.put((buf, length, 0))
+            if not self.repeat:
+                break
 
-    def connection(self):
+    def pack(self, buf, length):
         """
-        Initialises a multi-cast UDP socket with the multi-cast IP and port provided
+        Runs on a worker of the compression pool, compressing a generation in place when it saves a packet
+
+        Parameters
+        ----------
+        buf : bytearray
+            A buffer holding the generation
+        length : int
+            The number of bytes of the buffer read from the file
+
+        Returns
+        -------
+        The buffer, the number of its bytes to send and the codec it holds
         """
-        self.sock = socket.socket(
-            family=socket.AF_INET, type=socket.SOCK_DGRAM, proto=socket.IPPROTO_UDP)
-        self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 2)
-        self.sock.setblocking(0)
-        return True
+        length, codec = pack_generation(buf, length, self.codec, self.packet_bytes)
+        return buf, length, codec
 
-    def open_file(self):
+    def next(self):
         """
-        Opens the target file to be read as bytes
+        Returns the next generation of the file, waiting for the read-ahead thread only if it has fallen behind
+
+        Returns
+        -------
+        buf : bytearray
+            A buffer of block_bytes holding the generation, padded with zeros after the end of the file
+        length : int
+            The number of bytes of the buffer read from the file, or of the compressed generation
+        codec : int
+            The codec the generation is compressed with, 0 if it is held as it was read
         """
-        if not os.path.isfile(self.args.file_path):
-            print(f"{self.args.file_path} is not a valid file.")
-            sys.exit(1)
-        else:
-            self.f = open(os.path.expanduser(self.args.file_path), 'rb')
-            enc_file = self.args.file_path.encode()
-            hash_obj = hashlib.sha1(enc_file)
-            self.hex_val = hash_obj.hexdigest()
-            return True
+        if not self.ready.empty():
+            self.reads += 1
+        item = self.ready.get()
+        if isinstance(item, concurrent.futures.Future):
+            item = item.result()
+        return item
 
-    def set_encoder(self):
+    def release(self, buf):
         """
-        Sets the Kodo RLNC block encoder using the correct parameters for packet size and generation size. Also sets the coefficients object to the correct size
+        Returns a buffer to the pool once the send path no longer needs it
+
+        Parameters
+        ----------
+        buf : bytearray
+            A buffer returned by next()
         """
-        self.encoder.configure(self.gen_size, self.packet_bytes)
-        self.symbol = bytearray(self.encoder.symbol_bytes)
-        self.generator.configure(self.encoder.symbols)
-        self.coefficients = bytearray(self.generator.max_coefficients_bytes)
+        self.free.put(buf)
 
-    def create_gen(self):
+
+class FileWriter:
+    """
+    Writes completed generations to the output file in order on a background thread, so received data reaches disk during
+    the transfer and the client does not hold the whole file in memory.
+    ...
+    Attributes
+    ----------
+    fd : int
+        the file descriptor of the output file
+    total_bytes : int
+        an integer representing the size of the file being received, beyond which padding is not written
+    fsync : str
+        a string setting when data is synced to disk: "none", "generation" or "end"
+    queue : queue.Queue
+        a queue of (generation, buffers, codec, length) items waiting to be written
+    pending : dict
+        a dictionary storing generation number keys with (buffers, codec, length) items that arrived before an earlier generation
+    next_gen : int
+        an integer storing the generation number to be written next
+    written : int
+        an integer storing the number of bytes written so far
+    error : Exception
+        the exception raised on the writer thread, re-raised when the file is closed
+
+    Methods
+    -------
+    write(gen, buffers, codec=0, length=0)
+        Queues the buffers of a completed generation for writing
+    run()
+        Writes queued generations in order, coalescing those already waiting into one writev call
+    open_output(path)
+        Opens the output file
+    sync()
+        Syncs the data written so far to disk
+    write_buffers(buffers)
+        Writes a list of buffers at the end of the output file
+    close()
+        Waits for all queued generations to be written and closes the output file
+    """
+    def __init__(self, path, total_bytes, fsync="none"):
+        self.fd = self.open_output(path)
+        self.total_bytes = total_bytes
+        self.fsync = fsync
+        self.queue = queue.Queue()
+        self.pending = {}
+        self.next_gen = 0
+        self.written = 0
+        self.error = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def write(self, gen, buffers, codec=0, length=0):
+        """
+        Queues the buffers of a completed generation for writing, returning straight away. Compressed generations are
+        decompressed on the writer thread.
+
+        Parameters
+        ----------
+        gen : int
+            The generation number
+        buffers : list
+            The bytes-like packets or decoded block of the generation, in order
+        codec : int, default=0
+            The codec the generation is compressed with, 0 if it is not compressed
+        length : int, default=0
+            The number of compressed bytes at the start of the buffers
+        """
+        self.queue.put((gen, buffers, codec, length))
+
+    def run(self):
+        """
+        Runs on a background thread, writing generations in generation order. Generations already waiting when the thread
+        wakes are gathered and written together, so a burst of completed generations costs one system call.
+        """
+        done = False
+        while not done:
+            items = [self.queue.get()]
+            while not self.queue.empty():
+                items.append(self.queue.get())
+            buffers = []
+            for item in items:
+                if item is None: # Sentinel from close()
+                    done = True
+                    continue
+                self.pending[item[0]] = item[1:]
+            try:
+                while self.next_gen in self.pending:
+                    gen_buffers, codec, length = self.pending.pop(self.next_gen)
+                    if codec:
+                        gen_buffers = [decompress(codec, b''.join(gen_buffers)[:length])]
+                    buffers.extend(gen_buffers)
+                    self.next_gen += 1
+            except Exception as e: # Corrupt compressed data, reported when the file is closed
+                if self.error is None:
+                    self.error = e
+            if self.error is None and buffers:
+                try:
+                    self.write_buffers(buffers)
+                    if self.fsync == "generation":
+                        self.sync()
+                except Exception as e: # Includes a malformed tree manifest, reported when the file is closed
+                    self.error = e
+
+    def open_output(self, path):
+        """
+        Opens the output file, truncating any existing file, or stdout for "-"
+
+        Parameters
+        ----------
+        path : str
+            The path of the output file
+
+        Returns
+        -------
+        The file descriptor of the output file
+        """
+        if path == "-":
+            return os.dup(1) # Still the real stdout once the client prints to stderr
+        return os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0), 0o644)
+
+    def sync(self):
         """
-        Reads a new generation of packets from the target file and loads them into the encoder ready to create coded packets.
+        Syncs the data written so far to disk
         """
-        self.data = bytearray(self.f.read(
-            self.encoder.block_bytes).ljust(self.encoder.block_bytes))
-        self.gen_size = (-(-len(self.data)//self.packet_bytes))
-        self.set_encoder()
-        self.encoder.set_symbols_storage(self.data)
+        os.fsync(self.fd)
+
+    def write_buffers(self, buffers):
+        """
+        Writes a list of buffers at the end of the output file with as few system calls as possible, dropping any padding past
+        the size of the file
+
+        Parameters
+        ----------
+        buffers : list
+            The bytes-like buffers to write, in order
+        """
+        views = []
+        offset = self.written
+        for buf in buffers:
+            view = memoryview(buf)[:max(self.total_bytes - offset, 0)]
+            if len(view):
+                views.append(view)
+                offset += len(view)
+        while views:
+            if hasattr(os, 'writev'): # Not available on every platform
+                batch = views[:IOV_MAX]
+                n = os.writev(self.fd, batch)
+            else:
+                batch = views[:1]
+                n = os.write(self.fd, batch[0])
+            self.written += n
+            for view in batch: # Drop what was written, keeping the rest of a partially written buffer
+                if n >= len(view):
+                    n -= len(view)
+                    views.pop(0)
+                else:
+                    views[0] = view[n:]
+                    break
+
+    def close(self):
+        """
+        Waits for all queued generations to be written, syncs them to disk if set, and closes the output file. As padding is
+        never written, the file ends at exactly total_bytes.
+        """
+        self.queue.put(None)
+        self.thread.join()
+        try:
+            if self.error is not None:
+                raise self.error
+            if self.fsync != "none":
+                os.fsync(self.fd)
+        finally:
+            os.close(self.fd)
+        return True
+
+
+class TreeReader:
+    """
+    Presents a directory tree to the send path as a single file: a manifest of the tree followed by the contents of its files
+    packed back to back, so small files share generations rather than each needing a transfer of its own.
+    ...
+    Attributes
+    ----------
+    root : str
+        the path of the directory being sent
+    segments : list
+        a list of the segments of the stream in order: the manifest as bytes, then the path of each file
+    sizes : list
+        a list of the number of bytes of each segment, as listed in the manifest
+    starts : list
+        a list of the offset of each segment in the stream
+    total_bytes : int
+        an integer representing the size of the stream, manifest included
+    files : int
+        an integer representing the number of files in the tree
+    position : int
+        an integer storing the offset of the stream read next by readinto()
+    fds : OrderedDict
+        an ordered dictionary storing the paths of recently read files with their file descriptors, at most TREE_FDS
+    lock : threading.Lock
+        a lock guarding the file descriptors, as the read-ahead thread and the send path read at once
+
+    Methods
+    -------
+    pread(size, offset)
+        Reads bytes of the stream at an offset
+    read_file(path, size, offset)
+        Reads bytes of a file of the tree, keeping it open for the next read
+    seek(offset)
+        Sets the offset of the stream read next
+    readinto(buf)
+        Reads into a buffer from the current offset
+    close()
+        Closes the open files
+    """
+    def __init__(self, root):
+        self.root = root
+        dirs = []
+        entries = []
+        paths = []
+        for path, subdirs, names in os.walk(root):
+            subdirs.sort() # Walked in a fixed order, so the stream only changes with the tree
+            rel = os.path.relpath(path, root).replace(os.sep, '/')
+            if not subdirs and not names and rel != '.':
+                dirs.append(rel) # Files create their own directories, so only empty ones are listed
+            for name in sorted(names):
+                full = os.path.join(path, name)
+                if not os.path.isfile(full):
+                    continue
+                stats = os.stat(full)
+                entries.append([os.path.relpath(full, root).replace(os.sep, '/'), stats.st_size, stats.st_mode & 0o777])
+                paths.append(full)
+        manifest = json.dumps({"dirs": dirs, "files": entries}).encode()
+        head = MANIFEST.pack(len(manifest)) + manifest
+        self.segments = [head] + paths
+        self.sizes = [len(head)] + [entry[1] for entry in entries]
+        self.starts = []
+        offset = 0
+        for size in self.sizes:
+            self.starts.append(offset)
+            offset += size
+        self.total_bytes = offset
+        self.files = len(entries)
+        self.position = 0
+        self.fds = OrderedDict()
+        self.lock = threading.Lock()
+
+    def pread(self, size, offset):
+        """
+        Reads bytes of the stream at an offset. A file that has shrunk since the manifest was made reads as zeros, so the
+        offsets of the files after it do not move.
+
+        Parameters
+        ----------
+        size : int
+            The number of bytes to read
+        offset : int
+            The offset in the stream to read from
+
+        Returns
+        -------
+        The bytes read, fewer than size at the end of the stream
+        """
+        data = bytearray()
+        i = bisect.bisect_right(self.starts, offset) - 1
+        while size > 0 and i < len(self.segments):
+            skip = offset - self.starts[i]
+            n = min(size, self.sizes[i] - skip)
+            if n > 0:
+                segment = self.segments[i]
+                if isinstance(segment, bytes):
+                    data += segment[skip:skip + n]
+                else:
+                    data += self.read_file(segment, n, skip).ljust(n, b'\0')
+                offset += n
+                size -= n
+            i += 1
+        return bytes(data)
+
+    def read_file(self, path, size, offset):
+        """
+        Reads bytes of a file of the tree, keeping the most recently read files open
+
+        Parameters
+        ----------
+        path : str
+            The path of the file
+        size : int
+            The number of bytes to read
+        offset : int
+            The offset in the file to read from
+        """
+        with self.lock: # Held while reading, as another thread may close the descriptor
+            if path in self.fds:
+                self.fds.move_to_end(path)
+            else:
+                self.fds[path] = os.open(path, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+                if len(self.fds) > TREE_FDS:
+                    os.close(self.fds.popitem(last=False)[1])
+            return os.pread(self.fds[path], size, offset)
+
+    def seek(self, offset):
+        """
+        Sets the offset of the stream read next by readinto()
+
+        Parameters
+        ----------
+        offset : int
+            The offset in the stream
+        """
+        self.position = offset
+
+    def readinto(self, buf):
+        """
+        Reads into a buffer from the current offset of the stream, moving the offset on
+
+        Parameters
+        ----------
+        buf : bytearray
+            The buffer to fill
+
+        Returns
+        -------
+        The number of bytes read, fewer than the buffer at the end of the stream
+        """
+        data = self.pread(len(buf), self.position)
+        buf[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+    def close(self):
+        """
+        Closes the files held open
+        """
+        with self.lock:
+            for fd in self.fds.values():
+                os.close(fd)
+            self.fds.clear()
+
+
+class TreeWriter(FileWriter):
+    """
+    Writes a directory tree transfer under the output directory. The stream of completed generations is split back into the
+    manifest and the files it lists, and each file is created as its byte range arrives and closed once it is complete.
+    ...
+    Attributes
+    ----------
+    root : str
+        the path of the output directory
+    head : bytearray
+        the start of the stream, held until the whole manifest has arrived
+    files : list
+        a list of [path, size, mode] entries from the manifest, in stream order, None until the manifest has arrived
+    index : int
+        an integer storing the position in files of the next file to create
+    fd : int
+        the file descriptor of the file being written, None between files
+    left : int
+        an integer storing the number of bytes of the file being written still to arrive
+    completed : int
+        an integer storing the number of files written
+
+    Methods
+    -------
+    open_output(path)
+        Creates the output directory
+    sync()
+        Syncs the file being written to disk
+    write_buffers(buffers)
+        Splits buffers of the stream between the manifest and the files of the tree
+    read_manifest(view)
+        Takes bytes of the manifest, creating the directories it lists once it is complete
+    check_manifest(manifest)
+        Checks the fields of a received manifest
+    next_file()
+        Creates the next file of the manifest that has data, creating empty files on the way
+    local(path)
+        Returns the path of a manifest entry under the output directory
+    close()
+        Waits for all queued generations to be written and closes the file being written
+    """
+    def __init__(self, path, total_bytes, fsync="none"):
+        self.root = path
+        self.head = bytearray()
+        self.files = None
+        self.index = 0
+        self.left = 0
+        self.completed = 0
+        FileWriter.__init__(self, path, total_bytes, fsync)
+
+    def open_output(self, path):
+        """
+        Creates the output directory. Files are opened as the stream reaches them.
+
+        Parameters
+        ----------
+        path : str
+            The path of the output directory
+        """
+        os.makedirs(path, exist_ok=True)
+        return None
+
+    def sync(self):
+        """
+        Syncs the file being written to disk. Completed files are synced as they are closed.
+        """
+        if self.fd is not None:
+            os.fsync(self.fd)
+
+    def write_buffers(self, buffers):
+        """
+        Splits a list of buffers of the stream between the manifest and the files of the tree, dropping any padding past the
+        end of the stream
+
+        Parameters
+        ----------
+        buffers : list
+            The bytes-like buffers to write, in order
+        """
+        for buf in buffers:
+            view = memoryview(buf)[:max(self.total_bytes - self.written, 0)]
+            while len(view):
+                if self.files is None:
+                    n = self.read_manifest(view)
+                elif self.fd is None: # Nothing left to write
+                    n = len(view)
+                else:
+                    n = os.write(self.fd, view[:self.left])
+                    self.left -= n
+                    if not self.left: # File complete
+                        if self.fsync != "none":
+                            os.fsync(self.fd)
+                        os.close(self.fd)
+                        self.fd = None
+                        self.completed += 1
+                        self.next_file()
+                view = view[n:]
+                self.written += n
+
+    def read_manifest(self, view):
+        """
+        Takes bytes of the manifest from the start of the stream. Once it is complete, the directories it lists are created
+        and the first file is opened.
+
+        Parameters
+        ----------
+        view : memoryview
+            The stream from the current offset
+
+        Returns
+        -------
+        The number of bytes taken
+        """
+        need = MANIFEST.size
+        if len(self.head) >= MANIFEST.size:
+            need += MANIFEST.unpack_from(self.head)[0]
+        n = min(len(view), need - len(self.head))
+        self.head += view[:n]
+        if len(self.head) == need and need > MANIFEST.size:
+            manifest = self.check_manifest(json.loads(bytes(self.head[MANIFEST.size:])))
+            for path in manifest["dirs"]:
+                os.makedirs(self.local(path), exist_ok=True)
+            self.files = manifest["files"]
+            self.next_file()
+        return n
+
+    def check_manifest(self, manifest):
+        """
+        Checks the fields of a received manifest: a list of directory paths, and a list of files each given as a path, a
+        size and a mode. A malformed manifest raises ValueError, which the writer reports when the file is closed.
+
+        Parameters
+        ----------
+        manifest : dict
+            The decoded manifest
+
+        Returns
+        -------
+        The manifest, once checked
+        """
+        if not isinstance(manifest, dict) or not isinstance(manifest.get("dirs"), list) or not isinstance(manifest.get("files"), list):
+            raise ValueError("Malformed tree manifest: no list of directories and files")
+        for path in manifest["dirs"]:
+            if not isinstance(path, str):
+                raise ValueError(f"Malformed tree manifest directory: {path!r}")
+        for entry in manifest["files"]:
+            if not isinstance(entry, list) or len(entry) != 3 or not isinstance(entry[0], str) \
+                    or not all(type(field) is int and field >= 0 for field in entry[1:]):
+                raise ValueError(f"Malformed tree manifest file: {entry!r}")
+        return manifest
+
+    def next_file(self):
+        """
+        Creates the next file of the manifest that has data and opens it for writing, creating any empty files before it
+        """
+        while self.index < len(self.files):
+            path, size, mode = self.files[self.index]
+            self.index += 1
+            local = self.local(path)
+            os.makedirs(os.path.dirname(local), exist_ok=True)
+            fd = os.open(local, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0), mode & 0o777 or 0o644)
+            if size:
+                self.fd, self.left = fd, size
+                return
+            os.close(fd)
+            self.completed += 1
+
+    def local(self, path):
+        """
+        Returns the path of a manifest entry under the output directory, refusing entries that would leave it
+
+        Parameters
+        ----------
+        path : str
+            The path of the entry relative to the root of the tree, with / separators
+        """
+        local = os.path.normpath(os.path.join(self.root, *path.split('/')))
+        if path.startswith('/') or os.path.relpath(local, self.root).split(os.sep)[0] == os.pardir:
+            raise ValueError(f"{path} is outside the output directory")
+        return local
+
+    def close(self):
+        """
+        Waits for all queued generations to be written and closes the file being written. Each file is synced to disk as it is
+        completed if syncing is set.
+        """
+        self.queue.put(None)
+        self.thread.join()
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+        if self.error is not None:
+            raise self.error
+        return True
+
+
+class RttEstimator:
+    """
+    A smoothed estimate of the time taken to hear back from the other end of the transfer, kept as in TCP (RFC 6298), from
+    which feedback deadlines and control packet re-transmissions are timed.
+    ...
+    Attributes
+    ----------
+    srtt : float
+        a float storing the smoothed round trip time in seconds, None until the first sample
+    rttvar : float
+        a float storing the smoothed round trip time variation in seconds
+
+    Methods
+    -------
+    update(sample)
+        Adds a round trip time sample to the estimate
+    timeout()
+        Returns the time to wait for a reply before re-sending
+    """
+    def __init__(self):
+        self.srtt = None
+        self.rttvar = None
+
+    def update(self, sample):
+        """
+        Adds a round trip time sample to the estimate
+
+        Parameters
+        ----------
+        sample : float
+            The time between sending a packet and receiving its reply, in seconds
+        """
+        if self.srtt is None:
+            self.srtt = sample
+            self.rttvar = sample / 2
+        else:
+            self.rttvar = (1 - RTT_BETA) * self.rttvar + RTT_BETA * abs(self.srtt - sample)
+            self.srtt = (1 - RTT_ALPHA) * self.srtt + RTT_ALPHA * sample
+
+    def timeout(self):
+        """
+        Returns the time to wait for a reply before re-sending, SRTT + 4 * RTTVAR bounded by MIN_RTO and MAX_RTO, or
+        INITIAL_RTO before the first sample
+        """
+        if self.srtt is None:
+            return INITIAL_RTO
+        return min(max(self.srtt + 4 * self.rttvar, MIN_RTO), MAX_RTO)
+
+
+class Server(ncUDP):
+    """
+    A class to enable a server to reliably transmit network coded data via multi-cast UDP socket to a client
+    ...
+    Attributes
+    ----------
+    clients : dict
+        a dictionary storing client hostname keys with state values
+    address : tuple
+        a tuple containing the IP address and port information for the multi-cast group
+    total_bytes : int
+        an integer representing the total number of bytes of data in the target file
+    packet_bytes : int
+        an integer representing the number of bytes per packet
+    total_packets : int
+        an integer representing the total number of packets of data to be transmitted
+    num_gens : int
+        an integer representing the total number of generations required to transmit the target file
+    tx : int
+        an integer storing the total number of data packets transmitted
+    mtu : int
+        an integer representing the path MTU the packet size is derived from
+    addresses : dict
+        a dictionary storing client hostname keys with the address their feedback was received from, for uni-cast repairs
+    repair_airtime : float
+        a float storing the estimated air time spent on repair packets in seconds
+    stragglers : dict
+        a dictionary storing the hostname keys of clients in the catch-up session with the generation each is on
+    loss : dict
+        a dictionary storing client hostname keys with a moving estimate of their packet loss
+    holdouts : dict
+        a dictionary storing client hostname keys with the number of consecutive generations they held the group back
+    catch_up_tx : int
+        an integer storing the number of data packets sent in the catch-up session
+    repair_rounds : int
+        an integer storing the number of repair rounds sent to the group
+    finished : bool
+        a boolean set once the group has received the whole file
+    cache : SymbolCache
+        a cache of pre-encoded and recently sent coded symbols
+    reader : ReadAhead
+        the read-ahead stage supplying generations of the target file, started with the first generation
+    coefficient_pool : list
+        a list of (seed, coefficients) tuples generated once per configuration and shared by all generations
+    density : int
+        an integer representing the density of the coefficients of the initial transmission, from 1 to DENSE
+    repair_density : int
+        an integer representing the density of the coefficients of repair packets, from 1 to DENSE
+    sent : int
+        an integer storing the number of coded symbols sent from the current generation
+    prefilled : int
+        an integer storing the number of coded symbols of the current generation the pre-encoding thread has reached
+    cache_hits : int
+        an integer storing the number of coded symbols sent without encoding on the send path
+    current_gen : int
+        an integer storing the current generation number
+    reports : dict
+        a dictionary storing client hostname keys with the capabilities, loss and decode speed reported when joining
+
+    rtts : dict
+        a dictionary storing client hostname keys with the RttEstimator of their feedback
+    backoff : int
+        an integer multiplying the feedback timeout, doubled each time the control packet is re-sent without feedback
+    control_time : float
+        a float storing when the current control packet was sent, None once it has been re-sent
+    sampled : set
+        a set of the hostnames whose feedback to the current control packet has been timed
+    control_resends : int
+        an integer storing the number of control packets re-sent after a feedback timeout
+    awaiting : bool
+        a boolean set while the server waits for feedback on the current generation
+    waited : float
+        a float storing the time spent waiting for feedback on the current generation, in seconds
+    gen_waits : list
+        a list of the time spent waiting for feedback on each generation, in seconds
+    codec : int
+        an integer representing the codec generations are compressed with, 0 if compression is off
+    layouts : dict
+        a dictionary storing generation number keys with (packets, codec, compressed length) values
+    plan : list
+        a list of the generation numbers to send in order, every generation unless a delta transfer skips unchanged ones
+    signatures : dict
+        a dictionary storing client hostname keys with dictionaries of generation number keys and the signature of the
+        generation in the client's existing copy of the file
+    tree : TreeReader
+        the directory tree being sent, None when sending a single file
+    cycle : int
+        an integer storing the number of the carousel cycle being sent
+    send_time : float
+        a float storing when the next data packet of the carousel is due
+    expiry : float
+        a float storing when the playout deadline of the current generation passes, None without --deadline
+    expired : int
+        an integer storing the number of generations moved on from at their playout deadline
+    layers : int
+        an integer representing the number of multi-cast layers a carousel is sent on
+    Methods
+    -------
+    discover_mtu()
+        Returns the MTU of the interface used to reach the multi-cast group
+    connection()
+        Creates UDP network socket
+    open_file()
+        Opens target file for reading
+    sample_compression()
+        Switches compression off if a sample of the file does not compress
+    add_signatures(hostname, first, payload)
+        Stores generation signatures reported by a client
+    plan_generations()
+        Selects the generations to send, skipping those every client already holds
+    skipped_from(gen)
+        Returns the first generation skipped before a generation
+    next_planned(gen)
+        Returns the next generation to send after a generation
+    set_encoder()
+        Configures the network coding encoder for the next generation
+    set_coding(field, gen_size)
+        Changes the finite field and generation size used for the transfer
+    negotiate()
+        Selects the field and generation size from the client reports
+    create_gen()
+        Takes the next generation of data from the read-ahead stage and loads into encoder
+    prefill()
+        Pre-encodes coded symbols of the current generation ahead of the send path, run on a background thread
+    next_symbol(density=None)
+        Returns the seed and coded symbol for the next data packet
+    create_packet(packet_type, seq=0, payload=b'')
+        Creates a packet with header and encoded packet data
+    airtime(rate)
+        Estimates the air time of one data packet at a link rate
+    pace()
+        Waits until the next data packet of the carousel is due
+    layer_share(layer)
+        Returns the number of coded symbols a layer carries for each symbol of the base layer
+    unicast_clients()
+        Returns the clients that can be reached by uni-cast
+    plan_repairs(requests)
+        Splits a repair round between multi-cast and uni-cast
+    record_loss(hostname, missing)
+        Updates the loss estimate of a client
+    is_healthy(hostname)
+        Returns whether a client keeps pace with the group
+    lagging()
+        Returns the clients to move to the catch-up session
+    note_round()
+        Records the clients holding the group back at a repair round
+    end_generation()
+        Updates per client lag counts at the end of a generation
+    start_deadline()
+        Starts the playout deadline of the current generation
+    is_expired()
+        Returns whether the playout deadline of the current generation has passed
+    expire()
+        Moves every client on from the current generation at its playout deadline
+    create_join_ack(hostname)
+        Creates a join acknowledgement for a client
+    read_capabilities(payload)
+        Returns the capabilities a client joined with
+    join(hostname, payload, rtt)
+        Adds a client and acknowledges its join
+    update_rtt(hostname, sample)
+        Adds a round trip time sample for a client
+    timeout()
+        Returns how long to wait for client feedback
+    transmit_control(resend=False)
+        Multi-casts the end generation control packet and times the feedback it prompts
+    demote(hostnames)
+        Moves clients to the catch-up session
+    catch_up_address(hostname)
+        Returns the address to send catch-up packets for a client to
+    prompt_stragglers()
+        Re-sends control packets to clients in the catch-up session
+    finish_catch_up(hostname)
+        Moves a client in the catch-up session on to its next generation
+    catch_up_encoder(gen)
+        Returns the encoder of a generation other than the current one
+    catch_up_symbol(gen)
+        Encodes a coded symbol of an earlier generation
+    layout(gen)
+        Returns the number of packets, codec and compressed length of a generation
+    missing_count(payload)
+        Decodes the number of degrees of freedom a client reports missing
+    catch_up(packet_type, payload, hostname)
+        Serves feedback from a client in the catch-up session
+    transmit(packet, address=None)
+        Transmits packet via socket
+    receive()
+        Receives packets via socket
+    """
+
+    def __init__(self, args):
+        ncUDP.__init__(self, args)
+        self.clients = {}
+        self.addresses = {}
+        self.repair_airtime = 0
+        self.stragglers = {}
+        self.loss = {}
+        self.holdouts = {}
+        self.reported = set()
+        self.round_holdouts = set()
+        self.catch_up_tx = 0
+        self.repair_rounds = 0
+        self.finished = False
+        self.catch_up_encoders = {}
+        self.address = (self.mcast_grp, self.mcast_port)
+        # A directory is sent as one stream of its manifest and files, and a single file as it is
+        self.tree = TreeReader(self.args.file_path) if os.path.isdir(self.args.file_path) else None
+        self.total_bytes = self.tree.total_bytes if self.tree else os.stat(self.args.file_path).st_size
+        self.mtu = min(self.args.mtu or self.discover_mtu(), MAX_DATAGRAM + IP_UDP_HEADERS)
+        # Payload fills the MTU after the IP, UDP and protocol headers, unless a packet size is given
+        self.packet_bytes = self.args.packet_size or self.mtu - IP_UDP_HEADERS - SERVER_HEADER.size
+        self.total_packets = self.total_bytes // self.packet_bytes + 1
+        if self.total_packets < self.gen_size:
+            self.gen_size = self.total_packets
+        self.num_gens = (-(-self.total_packets // self.gen_size))
+        self.encoder_lock = threading.Lock() # Guards the encoder between the send path and the pre-encoding thread
+        self.work = threading.Condition() # Signals the pre-encoding thread when symbols are sent or a generation is loaded
+        self.encoded_gen = None
+        self.sent = 0
+        self.prefilled = 0
+        self.pool_start = 0
+        self.cache_hits = 0
+        self.cache = SymbolCache(self.args.symbol_cache)
+        self.density = max(1, min(DENSE, round(self.args.density * DENSE)))
+        self.repair_density = max(1, min(DENSE, round(self.args.repair_density * DENSE)))
+        self.reader = None
+        self.data = None
+        self.set_coding(self.field, self.gen_size)
+        self.tx = 0
+        self.current_gen = 0
+        self.reports = {}
+        self.rtts = {}
+        self.backoff = 1
+        self.control_time = None
+        self.sampled = set()
+        self.control_resends = 0
+        self.awaiting = False
+        self.waited = 0
+        self.gen_waits = []
+        self.codec = CODECS[self.args.compress]
+        if self.codec == CODECS["zstd"] and zstandard is None:
+            print("zstd compression requires the zstandard package, which is not installed.")
+            sys.exit(1)
+        self.layouts = {}
+        self.plan = []
+        self.signatures = {}
+        self.cycle = 0
+        self.send_time = 0
+        self.expiry = None
+        self.expired = 0
+        self.layers = max(self.args.layers, 1)
+        if self.layers > 1 and not self.args.carousel:
+            print("Multi-cast layers (--layers) are only sent by a carousel (--carousel).")
+            sys.exit(1)
+        self.session = random.getrandbits(16)
+        if self.args.prefill > 0:
+            threading.Thread(target=self.prefill, daemon=True).start()
+
+    def discover_mtu(self):
+        """
+        Discovers the MTU of the interface the multi-cast group is routed through, which includes jumbo frames on LANs that use them.
+        Falls back to DEFAULT_MTU where the platform does not support the query.
+
+        Returns
+        -------
+        The MTU in bytes
+        """
+        probe = socket.socket(family=socket.AF_INET, type=socket.SOCK_DGRAM)
+        try:
+            probe.connect((self.mcast_grp, self.mcast_port)) # Connecting a UDP socket only selects the route
+            return probe.getsockopt(socket.IPPROTO_IP, IP_MTU)
+        except OSError:
+            return DEFAULT_MTU
+        finally:
+            probe.close()
+
+    def connection(self):
+        """
+        Initialises a multi-cast UDP socket with the multi-cast IP and port provided
+        """
+        self.sock = socket.socket(
+            family=socket.AF_INET, type=socket.SOCK_DGRAM, proto=socket.IPPROTO_UDP)
+        self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 2)
+        self.sock.setblocking(0)
+        return True
+
+    def open_file(self):
+        """
+        Opens the target file to be read as bytes
+        """
+        if self.tree is not None: # Directory tree, read through its manifest
+            self.f = self.tree
+        elif not os.path.isfile(self.args.file_path):
+            print(f"{self.args.file_path} is not a valid file.")
+            sys.exit(1)
+        else:
+            self.f = open(os.path.expanduser(self.args.file_path), 'rb')
+            enc_file = self.args.file_path.encode()
+            hash_obj = hashlib.sha1(enc_file)
+            self.hex_val = hash_obj.hexdigest()
+            return True
+
+    def sample_compression(self):
+        """
+        Compresses COMPRESS_SAMPLE generations spread through the target file, and switches compression off for the transfer if
+        none of them would be sent in fewer packets, so incompressible files are not compressed generation by generation.
+        Called once the generation size is settled.
+
+        Returns
+        -------
+        True if compression stays on
+        """
+        if not self.codec:
+            return False
+        block_bytes = self.encoder.block_bytes
+        for gen in sorted({self.num_gens * i // COMPRESS_SAMPLE for i in range(COMPRESS_SAMPLE)}):
+            data = pread(self.f, block_bytes, gen * block_bytes)
+            buf = bytearray(block_bytes)
+            buf[:len(data)] = data
+            if pack_generation(buf, len(data), self.codec, self.packet_bytes)[1]:
+                return True
+        self.codec = 0
+        return False
+
+    def add_signatures(self, hostname, first, payload):
+        """
+        Stores a run of generation signatures of a client's existing copy of the file, sent ahead of its join
+
+        Parameters
+        ----------
+        hostname : int
+            The ID of the client
+        first : int
+            The generation number of the first signature
+        payload : bytes
+            The signatures, SIGNATURE_BYTES each
+        """
+        signatures = self.signatures.setdefault(hostname, {})
+        for i in range(len(payload) // SIGNATURE_BYTES):
+            signatures[first + i] = bytes(payload[i * SIGNATURE_BYTES:(i + 1) * SIGNATURE_BYTES])
+        return True
+
+    def plan_generations(self):
+        """
+        Selects the generations to send once the generation size is settled. If every client joined with signatures of an
+        existing copy signed at this generation size, each generation of the target file is signed and only those whose
+        signature differs for at least one client are sent. Generations a client has no signature for count as changed.
+        Otherwise every generation is sent.
+
+        Returns
+        -------
+        The list of generation numbers to send
+        """
+        block_bytes = self.encoder.block_bytes
+        signed = [h for h in self.clients if self.reports[h].get("signatures") == block_bytes and h in self.signatures]
+        if not self.clients or len(signed) < len(self.clients):
+            self.plan = list(range(self.num_gens))
+            return self.plan
+        self.plan = []
+        for gen in range(self.num_gens):
+            digest = signature(pread(self.f, block_bytes, gen * block_bytes), block_bytes)
+            if any(self.signatures[h].get(gen) != digest for h in signed):
+                self.plan.append(gen)
+        return self.plan
+
+    def skipped_from(self, gen):
+        """
+        Returns the first generation skipped by a delta transfer before a generation, which is the generation itself if the
+        generation before it is sent
+
+        Parameters
+        ----------
+        gen : int
+            The generation number
+        """
+        i = bisect.bisect_left(self.plan, gen)
+        return self.plan[i - 1] + 1 if i else 0
+
+    def next_planned(self, gen):
+        """
+        Returns the next generation to send after a generation, or the number of generations if there is none
+
+        Parameters
+        ----------
+        gen : int
+            The generation number
+        """
+        i = bisect.bisect_right(self.plan, gen)
+        return self.plan[i] if i < len(self.plan) else self.num_gens
+
+    def set_encoder(self):
+        """
+        Sets the Kodo RLNC block encoder using the correct parameters for packet size and generation size. Also sets the coefficients object to the correct size
+        """
+        self.encoder.configure(self.gen_size, self.packet_bytes)
+        self.generator.configure(self.encoder.symbols)
+        self.coefficients = bytearray(self.generator.max_coefficients_bytes)
+
+    def set_coding(self, field, gen_size):
+        """
+        Changes the finite field and generation size used for the transfer and rebuilds the encoder and generator to match.
+        Must be called before the first generation is sent, as the parameters are advertised in the engineering packet.
+
+        Parameters
+        ----------
+        field : kodo.FiniteField
+            The finite field to code over
+        gen_size : int
+            The number of packets per generation
+        """
+        with self.encoder_lock:
+            self.field = field
+            self.gen_size = min(gen_size, self.total_packets)
+            self.num_gens = (-(-self.total_packets // self.gen_size))
+            self.encoder = kodo.block.Encoder(self.field)
+            self.generator = CoefficientGenerator(self.field)
+            self.set_encoder()
+            # Coefficients only depend on the seed, density, field and generation size, so they are generated once and reused by every generation
+            self.coefficient_pool = []
+            for _ in range(max(self.args.coefficient_pool, 2 * self.gen_size)):
+                seed = random.getrandbits(32)
+                self.generator.generate(self.coefficients, seed, self.density)
+                self.coefficient_pool.append((seed, bytearray(self.coefficients)))
+
+    def negotiate(self):
+        """
+        Selects the finite field and generation size expected to give the highest goodput, based on the number of clients,
+        the loss and decode speed they reported when joining, and the round trip time measured during the engineering phase.
+
+        For each candidate the time to deliver a generation is modelled as the larger of the transmission time and the decode
+        time of the slowest client, plus one feedback round trip per repair round. Smaller fields decode faster but send more
+        linearly dependent packets, and larger generations need fewer rounds per byte but cost quadratically more to decode.
+
+        Returns
+        -------
+        field : str
+            The name of the selected field
+        gen_size : int
+            The selected generation size
+        """
+        loss = max((r["loss"] for r in self.reports.values()), default=0)
+        loss = min(loss, 0.95)
+        rtt = max((r.srtt for r in self.rtts.values() if r.srtt is not None), default=0.01)
+        link_rate = self.args.link_rate * 1e6 / 8 # Bytes per second
+        best = None
+        for name, order in FIELD_ORDERS.items():
+            speeds = [r["decode"].get(FIELDS[name].value, 0) for r in self.reports.values()]
+            speed = min(speeds, default=0) * 1e6 # Slowest client decode speed at BENCH_GEN_SIZE in bytes per second
+            if self.reports and speed <= 0:
+                continue
+            # Expected number of linearly dependent packets received per generation
+            dependent = sum(1 / (order ** i - 1) for i in range(1, 16))
+            for gen_size in GEN_SIZES:
+                gen_size = min(gen_size, self.total_packets)
+                gen_bytes = gen_size * self.packet_bytes
+                packets = (gen_size + dependent) / (1 - loss)
+                tx_time = packets * (self.packet_bytes + SERVER_HEADER.size) / link_rate
+                # Decoding cost per byte grows linearly with generation size
+                decode_time = gen_bytes * gen_size / (speed * BENCH_GEN_SIZE) if speed else 0
+                # Repair rounds until the worst client is expected to be missing less than one packet
+                residual = len(self.clients) * (gen_size * loss + dependent)
+                if loss > 0 and residual > 1:
+                    rounds = 1 + math.ceil(math.log(residual) / -math.log(loss))
+                else:
+                    rounds = 1 + (residual > 0.5)
+                goodput = gen_bytes / (max(tx_time, decode_time) + rounds * rtt)
+                if best is None or goodput > best[0]:
+                    best = (goodput, name, gen_size)
+        return best[1], best[2]
+
+    def create_gen(self):
+        """
+        Takes a new generation of packets from the read-ahead stage and loads them into the encoder ready to create coded packets.
+        The buffer of the previous generation is returned to the read-ahead pool once the encoder has moved on. A compressed
+        generation keeps the generation size in the encoder, with zero symbols after its compressed data. Each cycle of a
+        carousel carries on through the coefficient pool of a generation where the last cycle stopped, so no coded symbol is
+        sent twice.
+        """
+        if self.reader is None: # Started here, as the generation size may change when negotiated
+            self.reader = ReadAhead(self.f, self.encoder.block_bytes, self.plan, self.args.read_ahead, self.codec, self.packet_bytes, self.args.carousel)
+        data, length, codec = self.reader.next()
+        self.layouts[self.current_gen] = (-(-length // self.packet_bytes) if codec else self.gen_size, codec, length)
+        with self.encoder_lock:
+            previous = self.data
+            self.data = data
+            self.gen_size = (-(-len(self.data)//self.packet_bytes))
+            self.set_encoder()
+            self.encoder.set_symbols_storage(self.data)
+            with self.work:
+                self.encoded_gen = self.current_gen
+                self.sent = self.cycle * self.layouts[self.current_gen][0] * 2 ** (self.layers - 1) if self.args.carousel else 0
+                self.prefilled = self.sent
+                if self.args.carousel: # The same start every cycle, so the cycles take successive vectors
+                    self.pool_start = self.current_gen % len(self.coefficient_pool)
+                else: # Vary which pooled vectors each generation starts with
+                    self.pool_start = random.randrange(len(self.coefficient_pool))
+                self.work.notify()
+        if previous is not None:
+            self.reader.release(previous)
+
+    def prefill(self):
+        """
+        Runs on a background thread, encoding up to --prefill coded symbols of the current generation ahead of the send path
+        into the symbol cache. Symbols for the initial transmission and repair rounds are then usually sent without encoding,
+        and the thread does its work while the server waits on client feedback.
+        """
+        while True:
+            with self.work:
+                self.work.wait_for(lambda: self.encoded_gen is not None
+                                   and max(self.prefilled, self.sent) < min(self.sent + self.args.prefill, len(self.coefficient_pool)))
+                gen = self.encoded_gen
+                index = max(self.prefilled, self.sent) # Never encode symbols the send path has already taken
+                self.prefilled = index + 1
+            seed, coefficients = self.coefficient_pool[(self.pool_start + index) % len(self.coefficient_pool)]
+            symbol = bytearray(self.encoder.symbol_bytes)
+            with self.encoder_lock:
+                if gen != self.encoded_gen: # Generation changed while waiting for the encoder
+                    continue
+                self.encoder.encode_symbol(symbol, coefficients)
+            self.cache.put(gen, seed, symbol)
+
+    def next_symbol(self, density=None):
+        """
+        Returns the seed and coded symbol for the next data packet of the current generation. Seeds are taken in turn from the
+        coefficient pool, using the pre-encoded symbol from the cache where available. Once the pool is exhausted for a generation,
+        fresh random seeds are used so every symbol sent stays unique.
+
+        Parameters
+        ----------
+        density : int, optional
+            The density of the coefficients. Defaults to the density of the coefficient pool, and symbols of any other density
+            are encoded on the send path with a fresh seed
+
+        Returns
+        -------
+        seed : int
+            The seed the coefficients of the symbol were generated from
+        symbol : bytearray
+            The coded symbol
+        """
+        if density is None or density == self.density:
+            with self.work:
+                index = self.sent
+                self.sent += 1
+                self.work.notify()
+        else:
+            index = len(self.coefficient_pool) # Not in the pool
+        if index < len(self.coefficient_pool):
+            seed, coefficients = self.coefficient_pool[(self.pool_start + index) % len(self.coefficient_pool)]
+            symbol = self.cache.get(self.current_gen, seed)
+            if symbol is not None:
+                self.cache_hits += 1
+                return seed, symbol
+        else:
+            seed = random.getrandbits(32) # Set a seed so clients generate same coefficients
+            self.generator.generate(self.coefficients, seed, density or self.density)
+            coefficients = self.coefficients
+        symbol = bytearray(self.encoder.symbol_bytes)
+        with self.encoder_lock:
+            self.encoder.encode_symbol(symbol, coefficients)
+        self.cache.put(self.current_gen, seed, symbol)
+        return seed, symbol
+
+
+    def create_packet(self, packet_type, flags=0, gen=None):
+        """
+        Creates a packet header containing:
+            version
+            packet_type
+            flags
+            session
+            current_gen
+            seed
+            density
+
+        Engineering packets carry the transfer parameters (total_bytes, packet_bytes, gen_size, field, codec, tree, layers) as their payload,
+        and the carousel cycle in the seed field.
+        End generation packets carry the layout of the generation, and with file complete packets, the first generation
+        skipped before them by a delta transfer. Data packets carry a coded symbol as their payload. Repair packets are coded at the repair density, and all other data
+        packets at the density of the initial transmission.
+
+        Parameters
+        ----------
+        packet_type : int
+            An integer to represent the packet type:
+                1: Engineering
+                2: Data
+                3: End generation
+                5: Moving to next generation
+                6: File transfer complete
+
+        flags : int, default=0
+            Bit flags for the packet, such as FLAG_REPAIR
+
+        gen : int, optional
+            The generation number, for packets to clients in the catch-up session. Defaults to the current generation
+
+        Returns
+        -------
+        A packet containing header and payload
+        """
+
+        if gen is None:
+            gen = self.current_gen
+        density = self.repair_density if flags & FLAG_REPAIR else self.density
+        if packet_type == 2 and gen == self.current_gen:
+            seed, symbol = self.next_symbol(density)
+        elif packet_type == 2:
+            seed, symbol = self.catch_up_symbol(gen, density)
+        else:
+            seed, density = self.cycle if packet_type == 1 else 0, DENSE
+
+        header_data = SERVER_HEADER.pack(
+            VERSION,
+            packet_type,
+            flags,
+            self.session,
+            gen,
+            seed,
+            density
+        )
+        if packet_type == 1:
+            packet = header_data + ENGINEERING.pack(self.total_bytes, self.packet_bytes, self.gen_size, self.field.value, self.codec, 1 if self.tree else 0, self.layers)
+        elif packet_type == 2:
+            packet = header_data + symbol
+        elif packet_type == 3:
+            packet = header_data + LAYOUT.pack(*self.layout(gen)) + SKIPPED.pack(self.skipped_from(gen))
+        elif packet_type == 6:
+            packet = header_data + SKIPPED.pack(self.skipped_from(self.num_gens))
+        else:
+            packet = header_data
+        return packet
+
+    def airtime(self, rate):
+        """
+        Estimates the air time of one data packet at a link rate, including a fixed per frame overhead
+
+        Parameters
+        ----------
+        rate : float
+            The link rate in Mbit/s
+
+        Returns
+        -------
+        The air time in seconds
+        """
+        return (self.packet_bytes + SERVER_HEADER.size + IP_UDP_HEADERS) * 8 / (rate * 1e6) + FRAME_OVERHEAD
+
+    def pace(self):
+        """
+        Waits until the next data packet of the carousel is due, spacing packets by their air time at the multi-cast rate
+        (--mcast-rate) so the carousel sends at a fixed rate. Each layer above the base layer doubles the rate, so packets
+        are spaced at the rate of all layers together. A server that falls behind does not burst to catch up.
+        """
+        now = time.time()
+        if self.send_time > now:
+            time.sleep(self.send_time - now)
+        self.send_time = max(self.send_time, now) + self.airtime(self.args.mcast_rate * 2 ** (self.layers - 1))
+        return True
+
+    def layer_share(self, layer):
+        """
+        Returns the number of coded symbols a layer carries for each symbol of the base layer. Layer i above the base layer
+        carries 2^(i-1), so a client on layers 0 to i receives at 2^i times the base rate.
+
+        Parameters
+        ----------
+        layer : int
+            The layer number
+        """
+        return 1 if layer == 0 else 2 ** (layer - 1)
+
+    def unicast_clients(self):
+        """
+        Returns the clients that can be reached by uni-cast. Clients sharing an address with another client, such as several
+        clients on a single PC, can only be reached by multi-cast.
+
+        Returns
+        -------
+        A set of client hostnames
+        """
+        counts = Counter(self.addresses.values())
+        return {hostname for hostname, addr in self.addresses.items() if counts[addr] == 1}
+
+    def plan_repairs(self, requests):
+        """
+        Decides how the coded packets of a repair round are sent. Any coded packet is useful to every client still missing
+        packets, so k packets are multi-cast to all clients and each client missing more than k is sent the rest by uni-cast.
+        Multi-cast is sent at the lowest basic rate, while uni-cast gets link-layer ARQ and higher rates, so k is chosen to
+        minimise the estimated air time. With --repair-mode multicast, k covers every client, and with unicast, k only covers
+        clients that cannot be reached by uni-cast.
+
+        Parameters
+        ----------
+        requests : dict
+            A dictionary of client hostname keys with the number of packets each client is missing
+
+        Returns
+        -------
+        multicast : int
+            The number of coded packets to multi-cast
+        unicast : dict
+            A dictionary of client hostname keys with the number of coded packets to uni-cast to that client
+        """
+        mcast_time = self.airtime(self.args.mcast_rate)
+        ucast_time = self.airtime(self.args.ucast_rate)
+        reachable = self.unicast_clients()
+        floor = max((m for h, m in requests.items() if h not in reachable), default=0) # Must be multi-cast
+        candidates = sorted({floor} | {m for m in requests.values() if m > floor})
+        if self.args.repair_mode == "multicast":
+            candidates = candidates[-1:]
+        elif self.args.repair_mode == "unicast":
+            candidates = candidates[:1]
+        cost = lambda k: k * mcast_time + sum(max(m - k, 0) for m in requests.values()) * ucast_time
+        multicast = min(candidates, key=cost)
+        self.repair_airtime += cost(multicast)
+        return multicast, {h: m - multicast for h, m in requests.items() if m > multicast}
+
+    def record_loss(self, hostname, missing):
+        """
+        Updates the loss estimate of a client from its first missing packet report of a generation
+
+        Parameters
+        ----------
+        hostname : int
+            The hostname of the client
+        missing : int
+            The number of packets the client reported missing
+        """
+        if hostname in self.reported:
+            return
+        self.reported.add(hostname)
+        sample = missing / self.gen_size
+        self.loss[hostname] = sample if hostname not in self.loss else (1 - LOSS_GAIN) * self.loss[hostname] + LOSS_GAIN * sample
+
+    def is_healthy(self, hostname):
+        """
+        Returns whether a client keeps pace with the group: its loss estimate is within --straggler-loss and it has not
+        held the group back for more than --max-lag consecutive generations
+        """
+        return self.loss.get(hostname, 0) <= self.args.straggler_loss \
+            and (self.args.max_lag <= 0 or self.holdouts.get(hostname, 0) <= self.args.max_lag)
+
+    def lagging(self):
+        """
+        Returns the clients to move to the catch-up session: those still incomplete once every healthy client has completed
+        the generation. If no client is healthy, the group waits for all clients as before. No client is moved with
+        --deadline, as the playout deadline already bounds how long the group waits.
+
+        Returns
+        -------
+        A list of client hostnames
+        """
+        if self.expiry is not None:
+            return []
+        healthy = [h for h in self.clients if self.is_healthy(h)]
+        if not healthy or any(self.clients[h] != 4 for h in healthy):
+            return []
+        return [h for h, v in self.clients.items() if v != 4]
+
+    def note_round(self):
+        """
+        Records the clients holding the group back at a repair round, those still incomplete while others have completed,
+        and counts the round
+        """
+        self.repair_rounds += 1
+        incomplete = {h for h, v in self.clients.items() if v != 4}
+        if len(incomplete) < len(self.clients):
+            self.round_holdouts |= incomplete
+
+    def end_generation(self):
+        """
+        Updates the consecutive generation counts of clients holding the group back and resets per generation state
+        """
+        for hostname in self.clients:
+            self.holdouts[hostname] = self.holdouts.get(hostname, 0) + 1 if hostname in self.round_holdouts else 0
+        self.round_holdouts.clear()
+        self.reported.clear()
+        self.gen_waits.append(self.waited)
+        self.waited = 0
+        self.awaiting = False
+        self.expiry = None
+
+    def start_deadline(self):
+        """
+        Starts the playout deadline of the current generation, --deadline seconds from the start of its turn
+        """
+        self.expiry = time.time() + self.args.deadline if self.args.deadline > 0 else None
+        return True
+
+    def is_expired(self):
+        """
+        Returns whether the playout deadline of the current generation has passed, always False without --deadline
+        """
+        return self.expiry is not None and time.time() >= self.expiry
+
+    def expire(self):
+        """
+        Moves every client on from the current generation once its playout deadline has passed, without repairing it further.
+        The next generation packet carries FLAG_EXPIRED and is sent three times, as clients that have not decoded the
+        generation wait for it to deliver the generation as a gap.
+        """
+        for _ in range(3):
+            self.transmit(self.create_packet(5, FLAG_EXPIRED))
+        self.expired += 1
+        return True
+
+    def create_join_ack(self, hostname):
+        """
+        Creates a join acknowledgement for a client, with the client ID in the index field of the header
+
+        Parameters
+        ----------
+        hostname : int
+            The ID of the joining client
+
+        Returns
+        -------
+        A packet containing the header only
+        """
+        return SERVER_HEADER.pack(VERSION, 8, 0, self.session, 0, hostname, DENSE)
+
+    def read_capabilities(self, payload):
+        """
+        Returns the capabilities a client joined with, from the fixed CAPABILITIES fields and the FIELD_SPEED pairs that
+        follow them. A truncated trailing pair is ignored.
+
+        Parameters
+        ----------
+        payload : bytes
+            The payload of the join packet
+
+        Returns
+        -------
+        A dictionary of the peer repair mode, erasure rate, signed generation size and decode speed per field value
+        """
+        peer_repair, loss, signatures = CAPABILITIES.unpack_from(payload)
+        speeds = payload[CAPABILITIES.size:]
+        speeds = speeds[:len(speeds) - len(speeds) % FIELD_SPEED.size]
+        return {"peer_repair": peer_repair, "loss": loss, "signatures": signatures, "decode": dict(FIELD_SPEED.iter_unpack(speeds))}
+
+    def join(self, hostname, payload, rtt):
+        """
+        Adds a client to the 'client state matrix' with the capabilities it joined with, and acknowledges the join. The
+        acknowledgement is multi-cast, as clients on one host share an address and port, and carries the client ID.
+
+        Parameters
+        ----------
+        hostname : int
+            The ID of the joining client
+        payload : bytes
+            The capabilities of the client, packed as CAPABILITIES followed by a FIELD_SPEED per field
+        rtt : float
+            The time from announcing the session to the join, in seconds
+        """
+        if len(payload) < CAPABILITIES.size: # Malformed join, dropped
+            return False
+        self.clients[hostname] = 1 # Adding client to state matrix by ID and default state of 1
+        self.reports[hostname] = self.read_capabilities(payload)
+        self.update_rtt(hostname, rtt) # Join round trip time
+        self.transmit(self.create_join_ack(hostname))
+        return True
+
+    def update_rtt(self, hostname, sample):
+        """
+        Adds a round trip time sample to the estimate for a client
+
+        Parameters
+        ----------
+        hostname : int
+            The hostname of the client
+        sample : float
+            The time from sending a packet to the client's reply, in seconds
+        """
+        self.rtts.setdefault(hostname, RttEstimator()).update(sample)
+
+    def timeout(self):
+        """
+        Returns how long to wait for client feedback: the longest retransmission timeout of the clients in the group, so the
+        slowest client is not taken for a lost packet, multiplied by the current back-off and bounded by MAX_RTO
+        """
+        group = [h for h in self.clients if h not in self.stragglers] or list(self.clients)
+        rto = max((self.rtts[h].timeout() for h in group if h in self.rtts), default=INITIAL_RTO)
+        return min(rto * self.backoff, MAX_RTO)
+
+    def transmit_control(self, resend=False):
+        """
+        Multi-casts the end generation control packet and times the feedback it prompts. A re-sent control packet doubles the
+        back-off, and feedback after it is not sampled as it may answer either copy (Karn's algorithm).
+
+        Parameters
+        ----------
+        resend : bool, default=False
+            Whether the control packet is re-sent because feedback did not arrive in time
+        """
+        self.transmit(self.create_packet(3))
+        self.awaiting = True
+        if resend:
+            self.control_resends += 1
+            self.control_time = None
+            if self.timeout() < MAX_RTO:
+                self.backoff *= 2
+        else:
+            self.control_time = time.time()
+            self.sampled.clear()
+        return True
+
+    def demote(self, hostnames):
+        """
+        Moves clients from the group to the uni-cast catch-up session at the current generation, so the group no longer waits for them
+
+        Parameters
+        ----------
+        hostnames : list
+            The hostnames of the clients to move
+        """
+        for hostname in hostnames:
+            del self.clients[hostname]
+            self.stragglers[hostname] = self.current_gen
+            self.transmit(self.create_packet(3, gen=self.current_gen), self.catch_up_address(hostname)) # Prompt for its missing packets
+
+    def catch_up_address(self, hostname):
+        """
+        Returns the address to send catch-up packets for a client to: the client itself, or the multi-cast group if it shares
+        its address with another client. Clients in the group ignore packets of generations they have already completed.
+
+        Parameters
+        ----------
+        hostname : int
+            The hostname of the client
+        """
+        return self.addresses[hostname] if hostname in self.unicast_clients() else None
+
+    def prompt_stragglers(self):
+        """
+        Re-sends the end generation control packet to every client in the catch-up session, in case it was lost
+        """
+        for hostname, gen in self.stragglers.items():
+            self.transmit(self.create_packet(3, gen=gen), self.catch_up_address(hostname))
+
+    def finish_catch_up(self, hostname):
+        """
+        Moves a client in the catch-up session on to its next generation once it reports its generation complete. Rejoins the group
+        when it reaches the current generation, or leaves the catch-up session once it has the whole file.
+
+        Parameters
+        ----------
+        hostname : int
+            The hostname of the client
+        """
+        addr = self.catch_up_address(hostname)
+        gen = self.stragglers[hostname]
+        self.transmit(self.create_packet(5, gen=gen), addr)
+        gen = self.next_planned(gen)
+        if gen >= self.num_gens:
+            del self.stragglers[hostname]
+            return
+        if gen == self.current_gen and not self.finished:
+            del self.stragglers[hostname]
+            self.clients[hostname] = 1
+            self.holdouts[hostname] = 0
+        else:
+            self.stragglers[hostname] = gen
+        self.transmit(self.create_packet(3, gen=gen), addr)
+
+    def catch_up_encoder(self, gen):
+        """
+        Returns the encoder of a generation other than the current one, configuring it the first time. The generation is read
+        from the file without moving the read position of the main transmission, and compressed as the read-ahead stage would.
+
+        Parameters
+        ----------
+        gen : int
+            The generation number
+
+        Returns
+        -------
+        encoder : Kodo encoder
+            The encoder holding the generation
+        generator : CoefficientGenerator
+            A generator configured for the encoder
+        data : bytearray
+            The symbol storage of the encoder
+        """
+        if gen not in self.catch_up_encoders:
+            encoder = kodo.block.Encoder(self.field)
+            encoder.configure(self.gen_size, self.packet_bytes)
+            read = pread(self.f, encoder.block_bytes, gen * encoder.block_bytes)
+            data = bytearray(encoder.block_bytes)
+            data[:len(read)] = read
+            length, codec = pack_generation(data, len(read), self.codec, self.packet_bytes)
+            self.layouts.setdefault(gen, (-(-length // self.packet_bytes) if codec else self.gen_size, codec, length))
+            encoder.set_symbols_storage(data)
+            generator = CoefficientGenerator(self.field)
+            generator.configure(encoder.symbols)
+            self.catch_up_encoders[gen] = (encoder, generator, data)
+        for old in [g for g in self.catch_up_encoders if g <= self.current_gen and g not in self.stragglers.values()]:
+            del self.catch_up_encoders[old] # Neither sent ahead nor needed by a client in the catch-up session
+        return self.catch_up_encoders[gen]
+
+    def catch_up_symbol(self, gen, density=DENSE):
+        """
+        Encodes a coded symbol of a generation other than the current one: an earlier generation for a client in the catch-up
+        session, or a later generation sent ahead when generations are interleaved.
+
+        Parameters
+        ----------
+        gen : int
+            The generation number
+        density : int, default=DENSE
+            The density of the coefficients
+
+        Returns
+        -------
+        seed : int
+            The seed the coefficients of the symbol were generated from
+        symbol : bytearray
+            The coded symbol
+        """
+        encoder, generator, data = self.catch_up_encoder(gen)
+        seed = random.getrandbits(32)
+        coefficients = bytearray(generator.max_coefficients_bytes)
+        generator.generate(coefficients, seed, density)
+        symbol = bytearray(encoder.symbol_bytes)
+        encoder.encode_symbol(symbol, coefficients)
+        return seed, symbol
+
+    def layout(self, gen):
+        """
+        Returns the layout of a generation. Generations other than the current one are read through their catch-up encoder.
+
+        Parameters
+        ----------
+        gen : int
+            The generation number
+
+        Returns
+        -------
+        packets : int
+            The number of symbols holding data, fewer than the generation size if it is compressed
+        codec : int
+            The codec the generation is compressed with, 0 if it is not compressed
+        length : int
+            The number of bytes of the generation as sent
+        """
+        if gen not in self.layouts:
+            self.catch_up_encoder(gen)
+        return self.layouts[gen]
+
+    def missing_count(self, payload):
+        """
+        Decodes the number of degrees of freedom a client reports missing, which is never more than the generation size
+
+        Parameters
+        ----------
+        payload : bytes
+            The payload of a missing packets packet, packed as MISSING
+
+        Returns
+        -------
+        The number of missing degrees of freedom
+        """
+        return min(MISSING.unpack_from(payload)[0], self.gen_size)
+
+    def catch_up(self, packet_type, payload, hostname):
+        """
+        Serves feedback from a client in the catch-up session by uni-cast, at the client's own pace
+
+        Parameters
+        ----------
+        packet_type : int
+            The type of feedback packet, 3 for missing packets or 4 for generation complete
+        payload : bytes
+            The number of missing packets of a type 3 packet, packed as MISSING
+        hostname : int
+            The hostname of the client
+        """
+        gen = self.stragglers[hostname]
+        addr = self.catch_up_address(hostname)
+        if packet_type == 3:
+            for _ in range(self.missing_count(payload)):
+                self.transmit(self.create_packet(2, FLAG_REPAIR, gen), addr)
+                self.tx += 1
+                self.catch_up_tx += 1
+            self.transmit(self.create_packet(3, gen=gen), addr)
+        elif packet_type == 4:
+            self.finish_catch_up(hostname)
+
+    def transmit(self, packet, address=None):
+        """
+        Transmits a coded packet via the multi-cast socket
+
+        Parameters
+        ----------
+        packet : bytes
+            Bytes representing a single packet from the create_packet method
+        address : tuple, optional
+            The address of a single client to uni-cast to. Defaults to the multi-cast group
+        """
+
+        while True:
+            ready = select.select([], [self.sock], [], 1)
+            if ready[1]:
+                self.sock.sendto(packet, address or self.address)
+                break
+        return True
+
+    def receive(self, timeout=None):
+        """
+        Receives and processes packets from clients
+
+        Returns
+        -------
+        packet_type : int
+            The type of packet received:
+                1: Engineering
+                3: Missing packets
+                4: Generation complete
+
+        symbol : bytes
+            The payload of the received packet
+
+        hostname : int
+            The hostname of the source client, for updating the client dictionary
+
+        Feedback from another session, or for a generation other than the one the client is expected to be on, is dropped.
+        The first feedback from each client to a control packet is timed for its round trip time estimate.
+
+        Parameters
+        ----------
+        timeout : float, optional
+            The time to wait for a packet in seconds. Defaults to the adaptive feedback timeout. The wait never runs past
+            the playout deadline of the current generation
+        """
+
+        start = time.time()
+        end = start + (self.timeout() if timeout is None else timeout)
+        if self.expiry is not None: # Return in time to move on at the playout deadline
+            end = min(end, max(self.expiry, start))
+        while True:
+            ready = select.select([self.sock], [], [], max(end - time.time(), 0))
+            if ready[0]:
+                packet, addr = self.sock.recvfrom(MAX_DATAGRAM)
+                if len(packet) < CLIENT_HEADER.size:
+                    continue
+                symbol = bytearray(packet[CLIENT_HEADER.size:])
+                version, packet_type, session, hostname, gen = CLIENT_HEADER.unpack_from(packet)
+                if version != VERSION or session != self.session:
+                    continue
+                self.addresses[hostname] = addr
+                self.rx_gen = gen
+                expected = self.stragglers.get(hostname, self.current_gen)
+                if packet_type in (3, 4) and gen != expected: # Stale feedback for another generation
+                    continue
+                if packet_type == 3 and len(symbol) < MISSING.size: # Truncated feedback
+                    continue
+                if packet_type == 9: # Signatures of the client's existing copy, sent ahead of its join
+                    self.add_signatures(hostname, gen, symbol)
+                    continue
+                if packet_type == 1 and hostname in self.clients: # Repeated join after a lost acknowledgement
+                    self.transmit(self.create_join_ack(hostname))
+                    continue
+                if packet_type in (3, 4) and hostname not in self.stragglers and hostname not in self.sampled:
+                    self.sampled.add(hostname)
+                    self.backoff = 1
+                    if self.control_time is not None:
+                        self.update_rtt(hostname, time.time() - self.control_time)
+                # Engineering type packet
+                if packet_type == 1:
+                    break
+                # Request for re-transmit
+                elif packet_type == 3:
+                    break
+                # No missing packets
+                elif packet_type == 4:
+                    break
+            else:
+                packet_type, symbol, hostname = 0, 0, 0
+                break
+        if self.awaiting:
+            self.waited += time.time() - start
+        return packet_type, symbol, hostname
+
+
+class Generation:
+    """
+    A class to hold the decoding state of a single generation of coded packets on the client.
+    ...
+    Attributes
+    ----------
+    decoder : Kodo decoder
+        a Kodo decoder object used to store coded packets and decode them
+    generator : CoefficientGenerator
+        a generator of the coefficients required to decode packets, at the density given in their header
+    coefficients : bytearray
+        a buffer for the coefficients generated from a packet seed
+    data : bytearray
+        the symbol storage of the decoder, holding the decoded generation
+    binary : bool
+        a boolean set when coding over the binary field, where innovation is checked on the coefficients before decoding
+    basis : dict
+        a dictionary of pivot bit keys with coefficient vector values, the row echelon basis of received binary coefficients
+    complete : bool
+        a boolean set once the generation is fully decoded, so further symbols are dropped without dispatching them
+    innovative : int
+        an integer storing the number of symbols that increased the decoder rank
+    wasted : int
+        an integer storing the number of linearly dependent symbols dropped
+    lock : threading.Lock
+        a lock serialising access to the decoder, as symbols of one generation may be dispatched to different workers
+    pending : list
+        a list of futures for symbols submitted to the worker pool that may not be decoded yet
+    truncated : bool
+        a boolean set once the zero symbols after the end of a compressed generation have been passed to the decoder
+
+    Methods
+    -------
+    decode(seed, density, symbol)
+        Generates the coefficients for a seed and passes the coded symbol to the decoder if it is innovative
+    truncate(packets)
+        Passes the zero symbols after the end of a compressed generation to the decoder
+    is_innovative(coefficients)
+        Checks binary coefficients against the received basis, adding them if they are linearly independent
+    remaining()
+        Returns the degrees of freedom still missing from the generation
+    """
+    def __init__(self, field, gen_size, packet_bytes):
+        self.decoder = kodo.block.Decoder(field)
+        self.decoder.configure(gen_size, packet_bytes)
+        self.generator = CoefficientGenerator(field)
+        self.generator.configure(self.decoder.symbols)
+        self.coefficients = bytearray(self.generator.max_coefficients_bytes)
+        self.data = bytearray(self.decoder.block_bytes)
+        self.decoder.set_symbols_storage(self.data)
+        self.binary = field == kodo.FiniteField.binary
+        self.basis = {}
+        self.complete = False
+        self.innovative = 0
+        self.wasted = 0
+        self.lock = threading.Lock()
+        self.pending = []
+        self.truncated = False
+
+    def decode(self, seed, density, symbol):
+        """
+        Decodes a single coded symbol. Runs on a worker thread of the client decode pool.
+
+        Parameters
+        ----------
+        seed : int
+            The seed used by the server to generate the coding coefficients of the symbol
+        density : int
+            The density of the coding coefficients, DENSE for uniformly random coefficients
+        symbol : bytearray
+            The coded symbol
+        """
+        with self.lock:
+            if self.complete: # Nothing left to learn from this generation
+                self.wasted += 1
+                return
+            self.generator.generate(self.coefficients, seed, density)
+            if self.binary and not self.is_innovative(self.coefficients):
+                self.wasted += 1 # Dependent symbol dropped before elimination over the symbol bytes
+                return
+            rank = self.decoder.rank
+            self.decoder.decode_symbol(symbol, self.coefficients) # Try to decode
+            if self.decoder.rank > rank:
+                self.innovative += 1
+            else:
+                self.wasted += 1
+            self.complete = self.decoder.is_complete()
+
+    def truncate(self, packets):
+        """
+        Passes the symbols after the end of a compressed generation to the decoder as systematic zero symbols, as the server
+        encodes them. The server only sends as many coded symbols as hold data, so the generation decodes from those alone.
+        Runs on a worker thread of the client decode pool.
+
+        Parameters
+        ----------
+        packets : int
+            The number of symbols of the generation holding compressed data
+        """
+        with self.lock:
+            if self.truncated or self.complete:
+                return
+            self.truncated = True
+            zero = bytearray(self.decoder.symbol_bytes)
+            for index in range(packets, self.decoder.symbols):
+                if self.binary and not self.is_innovative((1 << index).to_bytes(len(self.coefficients), 'little')):
+                    continue
+                self.decoder.decode_systematic_symbol(zero, index)
+            self.complete = self.decoder.is_complete()
+
+    def is_innovative(self, coefficients):
+        """
+        Checks whether a binary coefficient vector is linearly independent of those already received. Eliminating over the
+        coefficients alone, held as Python integers, is far cheaper than elimination over the full symbol in the decoder.
+        The vector is added to the basis if it is innovative.
+
+        Parameters
+        ----------
+        coefficients : bytearray
+            The packed binary coding coefficients of a symbol
+
+        Returns
+        -------
+        True if the vector increases the rank
+        """
+        row = int.from_bytes(coefficients, 'little') & ((1 << self.decoder.symbols) - 1)
+        while row:
+            pivot = row.bit_length() - 1
+            if pivot not in self.basis:
+                self.basis[pivot] = row
+                return True
+            row ^= self.basis[pivot]
+        return False
+
+    def remaining(self):
+        """
+        Returns the degrees of freedom still missing from the generation (generation size less decoder rank),
+        which is the number of innovative symbols needed to complete it
+        """
+        with self.lock:
+            return self.decoder.symbols - self.decoder.rank
+
+
+class Client(ncUDP):
+    """
+    A class to enable a client to reliably receive network coded data via multi-cast UDP sockets from a server.
+    ...
+    Attributes
+    ----------
+    generations : dict
+        a dictionary storing generation number keys with Generation values for the generations being decoded
+    pool : concurrent.futures.ThreadPoolExecutor
+        a pool of worker threads decoding received symbols, keeping decoding off the socket receive path
+    rx_gen : int
+        an integer storing the generation number of the last packet received
+    gen_number : int
+        an integer storing the generation number currently being received, echoed in feedback
+    server : tuple
+        the address of the server, learnt from the engineering packet
+    hostname : int
+        an integer ID identifying the client in feedback, random unless set with --hostname
+    erased : int
+        an integer to store the number of missed packets
+    total_rx : int
+        an integer to store the total number of received packets
+    erasure : float
+        a float representing the chance of packet erasure as a percentage
+    bad : bool
+        a boolean set while the burst loss model is in its bad state
+    innovative : int
+        an integer storing the number of received packets that increased the rank of their generation
+    wasted : int
+        an integer storing the number of received packets that were linearly dependent or arrived after their generation was decoded
+    speeds : dict
+        a dictionary storing finite field value keys with the measured decode speed in MB/s
+    address : tuple
+        a tuple containing the IP address and port information for the multi-cast group, for peer repair
+    completed : OrderedDict
+        an ordered dictionary storing the last PEER_HISTORY completed generations, kept in peer repair mode to answer peers
+    peer_timers : dict
+        a dictionary storing generation number keys with (deadline, count) values for peer repair requests this client will answer
+    peer_tx : int
+        an integer storing the number of repair packets sent to peers
+    writer : FileWriter
+        the writer stage flushing decoded generations to the output file
+
+    rtt : RttEstimator
+        the estimate of the time the server takes to answer feedback, from which the receive timeout is set
+    backoff : int
+        an integer multiplying the receive timeout, doubled each time nothing is received in time
+    feedback_time : float
+        a float storing when unanswered feedback was first sent to the server, None once answered
+    feedback_resent : bool
+        a boolean set when unanswered feedback is sent again, so its answer is not timed (Karn's algorithm)
+    layouts : dict
+        a dictionary storing generation number keys with the (packets, codec, compressed length) layout from their control packet
+    basis : file
+        the existing copy of the file generations unchanged by a delta transfer are taken from, None without --basis
+    basis_path : str
+        the path the basis was moved to when it is the output file itself, removed once the transfer is complete
+    digests : bytes
+        the signatures of the generations of the basis, computed once the generation size is known
+    from_basis : int
+        an integer storing the number of generations taken from the basis
+    tree : bool
+        a boolean set when the server sends a directory tree, written under the output path as a directory
+    carousel : bool
+        a boolean set when the server runs a carousel, which this client listens to without joining or sending feedback
+    done : set
+        a set of the generations of a carousel written to the output file
+    cycle_start : int
+        an integer storing the position in the carousel, in generations, of the first announcement received
+    cycle_position : int
+        an integer storing the position in the carousel, in generations, of the latest announcement received
+    expired : int
+        an integer storing the number of generations delivered as gaps at their playout deadline
+    layers : int
+        an integer representing the number of multi-cast layers the carousel is sent on
+    socks : list
+        a list of the sockets of the layers this client has joined, lowest first, the first being the base layer socket
+    join_timers : list
+        a list of the time to wait before next trying to join each layer, in seconds, doubled each time a join fails
+    next_join : float
+        a float storing when this client next tries to join a layer
+    experiment : int
+        an integer storing the layer joined on trial, None when no join is being judged
+    baseline : float
+        a float storing the loss rate measured before the last join, against which congestion is judged
+    window_start : float
+        a float storing when the current loss measurement window started
+    window_rx : int
+        an integer storing the number of packets received in the current loss measurement window
+    window_lost : int
+        an integer storing the number of packets lost in the current loss measurement window
+    joins : int
+        an integer storing the number of layers joined
+    leaves : int
+        an integer storing the number of layers left
+    tokens : float
+        a float storing the bytes the simulated link can take before it drops packets, with --capacity
+    token_time : float
+        a float storing when the simulated link was last refilled
+    Methods
+    -------
+    connection()
+        Creates UDP network socket
+    erase()
+        Returns whether a received packet is simulated as lost
+    congested(size)
+        Returns whether a received packet is dropped by the simulated link capacity
+    join_layer()
+        Joins the next layer of the carousel
+    leave_layer()
+        Leaves the top layer of the carousel
+    adapt()
+        Joins or leaves layers from the loss rate measured over the last window
+    benchmark()
+        Measures the decode speed of the client for each supported finite field
+    capabilities()
+        Returns the serialised capabilities this client joins with
+    get_generation(gen)
+        Returns the decoding state of a generation, creating it on first use
+    is_complete(gen)
+        Waits for outstanding symbols of a generation to be decoded and returns whether it is fully decoded
+    missing(gen)
+        Returns the degrees of freedom still missing from a generation
+    nack(gen)
+        Encodes the degrees of freedom still missing from a generation for missing packets feedback
+    set_layout(gen, packets, codec, length)
+        Sets the layout of a generation from its control packet
+    pop_generation(gen)
+        Returns the decoded data of a generation and releases its decoder
+    create_packet(packet_type, seq=0, payload=b'')
+        Creates a packet with header and data
+    signature_packets()
+        Returns the packets carrying the generation signatures of the basis
+    skip_to(gen)
+        Takes the generations skipped by a delta transfer from the basis
+    decoded_generation(gen)
+        Returns the decoding state of a generation if it is fully decoded
+    collect_generation(gen)
+        Writes a generation of a carousel once it is decoded
+    expire_generation(gen)
+        Delivers a generation once its playout deadline has passed, as a gap if it is not decoded
+    cycles()
+        Returns the number of carousel cycles listened to
+    create_peer_packet(packet_type, gen, seed, payload=b'', flags=0)
+        Creates a packet for peer clients with the server header layout
+    request_peers()
+        Multi-casts the missing degrees of freedom of the current generation to peers and receives their repairs
+    schedule_peer_repair(gen, count)
+        Schedules an answer to a peer repair request after a random backoff
+    answer_peers()
+        Re-encodes and sends the repairs for peer requests whose backoff has expired
+    open_file()
+        Opens the output file and starts the writer stage
+    flush_generation(gen)
+        Hands a decoded generation to the writer stage and releases its decoder
+    save_file()
+        Waits for all received data to be written and closes the output file
+    transmit(packet)
+        Transmits packet via socket
+    receive()
+        Receives packets via socket
+    """
+    def __init__(self, args):
+        ncUDP.__init__(self, args)
+        self.generations = {}
+        self.pool = concurrent.futures.ThreadPoolExecutor(max_workers=args.decode_workers)
+        self.rx_gen = 0
+        self.gen_number = 0
+        self.server = None
+        self.hostname = random.getrandbits(32) if args.hostname is None else args.hostname
+        self.erased = 0
+        self.total_rx = 0
+        self.erasure = random.uniform(args.erasurelow, args.erasurehigh)
+        self.bad = False
+        self.innovative = 0
+        self.wasted = 0
+        self.speeds = {}
+        self.address = (self.mcast_grp, self.mcast_port)
+        self.completed = OrderedDict()
+        self.peer_timers = {}
+        self.peer_tx = 0
+        self.writer = None
+        self.rtt = RttEstimator()
+        self.backoff = 1
+        self.feedback_time = None
+        self.feedback_resent = False
+        self.layouts = {}
+        self.basis = None
+        self.basis_path = None
+        self.digests = b''
+        self.from_basis = 0
+        self.tree = False
+        self.carousel = False
+        self.done = set()
+        self.cycle_start = None
+        self.cycle_position = 0
+        self.expired = 0
+        self.layers = 1
+        self.socks = []
+        self.join_timers = []
+        self.next_join = 0
+        self.experiment = None
+        self.baseline = 1.0
+        self.window_start = time.time()
+        self.window_rx = 0
+        self.window_lost = 0
+        self.joins = 0
+        self.leaves = 0
+        self.tokens = 0
+        self.token_time = time.time()
+        if args.basis:
+            if not os.path.isfile(args.basis):
+                print(f"{args.basis} is not a valid file.")
+                sys.exit(1)
+            path = args.basis
+            if os.path.abspath(path) == os.path.abspath(args.output_file): # Kept aside, as the output file is truncated
+                self.basis_path = path = args.output_file + ".basis"
+                os.replace(args.output_file, path)
+            self.basis = open(path, 'rb')
+        # Replaced by the advertised value on the engineering packet
+        self.packet_bytes = args.packet_size or DEFAULT_MTU - IP_UDP_HEADERS - SERVER_HEADER.size
+        if os.path.exists('output_file'):
+            os.remove('output_file')
+
+    def connection(self):
+        """
+        Initialises a multi-cast UDP socket with the multi-cast IP and port provided
+        """
+        self.sock = socket.socket(
+            family=socket.AF_INET, type=socket.SOCK_DGRAM, proto=socket.IPPROTO_UDP)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(('', self.mcast_port))
+        self.mreq = struct.pack('4sl', socket.inet_aton(
+            self.mcast_grp), socket.INADDR_ANY)
+        self.sock.setsockopt(
+            socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, self.mreq)
+        self.sock.setblocking(0)
+        self.socks = [self.sock]
+        return True
+
+    def erase(self):
+        """
+        Returns whether a received packet is simulated as lost. Losses are independent at the client's erasure rate, or with
+        --burst-length they follow a two-state Gilbert-Elliott model: every packet is lost in the bad state, which lasts
+        --burst-length packets on average, and the good state is left at the rate that keeps the mean loss at the erasure rate.
+        """
+        if self.args.burst_length <= 1:
+            return random.uniform(0, 100) <= self.erasure
+        loss = self.erasure / 100
+        if self.bad:
+            self.bad = random.random() >= 1 / self.args.burst_length
+        else:
+            self.bad = loss >= 1 or random.random() < loss / (self.args.burst_length * (1 - loss))
+        return self.bad
+
+    def congested(self, size):
+        """
+        Returns whether a received packet is dropped by the simulated link capacity (--capacity), a token bucket refilled at
+        the capacity that holds CAPACITY_BURST seconds of data. Packets arriving faster than the link takes them are dropped,
+        as on a link whose queue overflows.
+
+        Parameters
+        ----------
+        size : int
+            The size of the packet in bytes
+        """
+        if not self.args.capacity:
+            return False
+        now = time.time()
+        rate = self.args.capacity * 1e6 / 8
+        self.tokens = min(self.tokens + (now - self.token_time) * rate, rate * CAPACITY_BURST)
+        self.token_time = now
+        if self.tokens < size:
+            return True
+        self.tokens -= size
+        return False
+
+    def join_layer(self):
+        """
+        Joins the next layer of the carousel by opening a socket on its port and adding its multi-cast group membership
+        """
+        group, port = self.layer_address(len(self.socks))
+        sock = socket.socket(family=socket.AF_INET, type=socket.SOCK_DGRAM, proto=socket.IPPROTO_UDP)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            sock.setsockopt(socket.IPPROTO_IP, IP_MULTICAST_ALL, 0)
+        except OSError: # Not supported by the platform, where a socket only receives the groups it joined anyway
+            pass
+        sock.bind(('', port))
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, struct.pack('4sl', socket.inet_aton(group), socket.INADDR_ANY))
+        sock.setblocking(0)
+        self.socks.append(sock)
+        self.joins += 1
+        return True
+
+    def leave_layer(self):
+        """
+        Leaves the top layer of the carousel, dropping its multi-cast group membership and closing its socket
+        """
+        group, port = self.layer_address(len(self.socks) - 1)
+        sock = self.socks.pop()
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_DROP_MEMBERSHIP, struct.pack('4sl', socket.inet_aton(group), socket.INADDR_ANY))
+        sock.close()
+        self.leaves += 1
+        return True
+
+    def adapt(self):
+        """
+        Joins or leaves layers of the carousel from the loss rate measured over each RLM_WINDOW, as in receiver-driven layered
+        multi-cast. A client starts on the base layer and tries the next layer once its join timer expires. A join is kept if
+        the loss rate stays within RLM_LOSS of the loss before it, and otherwise the layer is left and its join timer doubled,
+        up to RLM_MAX_JOIN. A rise in loss outside a join leaves the top layer too.
+        """
+        now = time.time()
+        if self.layers <= 1 or now - self.window_start < RLM_WINDOW:
+            return False
+        loss = self.window_lost / max(self.window_rx + self.window_lost, 1)
+        self.window_start, self.window_rx, self.window_lost = now, 0, 0
+        if not self.join_timers:
+            self.join_timers = [RLM_JOIN] * self.layers
+            self.next_join = now + RLM_JOIN
+        if self.experiment is not None: # Judge the last join
+            layer, self.experiment = self.experiment, None
+            if loss > self.baseline + RLM_LOSS:
+                self.leave_layer()
+                self.join_timers[layer] = min(self.join_timers[layer] * 2, RLM_MAX_JOIN)
+            if len(self.socks) < self.layers:
+                self.next_join = now + self.join_timers[len(self.socks)]
+        elif loss > self.baseline + RLM_LOSS and len(self.socks) > 1: # Congestion since the last join
+            self.leave_layer()
+            self.baseline = 1.0
+            self.next_join = now + self.join_timers[len(self.socks)]
+        else:
+            self.baseline = min(self.baseline, loss)
+            if len(self.socks) < self.layers and now >= self.next_join:
+                self.baseline = loss
+                self.join_layer()
+                self.experiment = len(self.socks) - 1
+        return True
+
+    def benchmark(self):
+        """
+        Measures how fast this client decodes a generation of BENCH_GEN_SIZE packets in each supported finite field, for
+        reporting to the server when joining so the field and generation size can be chosen automatically.
+
+        Returns
+        -------
+        A dictionary of finite field value keys with decode speeds in MB/s
+        """
+        if self.speeds:
+            return self.speeds
+        block = bytearray(os.urandom(BENCH_GEN_SIZE * self.packet_bytes))
+        for field in FIELDS.values():
+            encoder = kodo.block.Encoder(field)
+            encoder.configure(BENCH_GEN_SIZE, self.packet_bytes)
+            encoder.set_symbols_storage(block)
+            generation = Generation(field, BENCH_GEN_SIZE, self.packet_bytes)
+            symbols = []
+            while len(symbols) < 4 * BENCH_GEN_SIZE: # Pre-encode, so only decoding is timed
+                seed = random.randint(0, 2 ** 32 - 1)
+                generation.generator.generate(generation.coefficients, seed)
+                symbol = bytearray(encoder.symbol_bytes)
+                encoder.encode_symbol(symbol, generation.coefficients)
+                symbols.append((seed, symbol))
+            start = time.perf_counter()
+            for seed, symbol in symbols:
+                generation.decode(seed, DENSE, symbol)
+                if generation.decoder.is_complete():
+                    break
+            delta = time.perf_counter() - start
+            self.speeds[field.value] = len(block) / max(delta, 1e-9) / 1e6
+        return self.speeds
+
+    def capabilities(self):
+        """
+        Returns the capabilities this client joins with: its peer repair mode, its erasure rate and decode speed per field
+        for field selection, and the generation size in bytes its basis was signed with, 0 without a basis
+
+        Returns
+        -------
+        The capabilities packed as CAPABILITIES followed by a FIELD_SPEED per field
+        """
+        capabilities = CAPABILITIES.pack(self.args.peer_repair, self.erasure / 100, self.gen_size * self.packet_bytes if self.basis and not self.tree else 0)
+        return capabilities + b''.join(FIELD_SPEED.pack(field, speed) for field, speed in self.benchmark().items())
+
+    def get_generation(self, gen, gen_size=None):
+        """
+        Returns the decoding state of a generation, configuring a new decoder and generator the first time the generation is seen
+
+        Parameters
+        ----------
+        gen : int
+            The generation number
+        gen_size : int, optional
+            The number of packets in the generation. Defaults to the generation size advertised in the engineering packet
+        """
+        if gen not in self.generations:
+            self.generations[gen] = Generation(self.field, gen_size or self.gen_size, self.packet_bytes)
+        return self.generations[gen]
+
+    def is_complete(self, gen):
+        """
+        Waits for all symbols of a generation already dispatched to the decode pool and checks whether the generation is fully decoded
+
+        Parameters
+        ----------
+        gen : int
+            The generation number
+
+        Returns
+        -------
+        True if all packets of the generation have been decoded
+        """
+        generation = self.get_generation(gen)
+        concurrent.futures.wait(generation.pending)
+        generation.pending.clear()
+        return generation.decoder.is_complete()
+
+    def missing(self, gen):
+        """
+        Waits for outstanding symbols of a generation to be decoded and returns the number of degrees of freedom still missing.
+        Unlike a count of received packets, this is not reduced by linearly dependent packets.
+
+        Parameters
+        ----------
+        gen : int
+            The generation number
+        """
+        self.is_complete(gen)
+        return self.get_generation(gen).remaining()
+
+    def nack(self, gen):
+        """
+        Encodes the number of degrees of freedom still missing from a generation
+
+        Parameters
+        ----------
+        gen : int
+            The generation number
+
+        Returns
+        -------
+        The count packed as MISSING, for the payload of a missing packets packet
+        """
+        return MISSING.pack(self.missing(gen))
+
+    def set_layout(self, gen, packets, codec, length):
+        """
+        Sets the layout of a generation from its control packet. A compressed generation is completed with zero symbols on the
+        decode pool, so the degrees of freedom it reports missing count only the symbols holding data.
+
+        Parameters
+        ----------
+        gen : int
+            The generation number
+        packets : int
+            The number of symbols of the generation holding data
+        codec : int
+            The codec the generation is compressed with, 0 if it is not compressed
+        length : int
+            The number of bytes of compressed data
+        """
+        self.layouts[gen] = (packets, codec, length)
+        generation = self.get_generation(gen)
+        if codec and not generation.truncated:
+            generation.pending.append(self.pool.submit(generation.truncate, packets))
+        return True
+
+    def pop_generation(self, gen):
+        """
+        Returns the decoded data of a completed generation and discards its decoding state
+
+        Parameters
+        ----------
+        gen : int
+            The generation number
 
+        Returns
+        -------
+        A bytearray holding the decoded generation
+        """
+        self.is_complete(gen)
+        generation = self.generations.pop(gen)
+        self.innovative += generation.innovative
+        self.wasted += generation.wasted
+        if self.args.peer_repair: # Keep recent generations to answer peers still receiving them
+            self.completed[gen] = generation
+            while len(self.completed) > PEER_HISTORY:
+                self.completed.popitem(last=False)
+        return generation.data
 
-    def create_packet(self, packet_type):
+    def create_packet(self, packet_type, payload=b''):
         """
         Creates a packet header containing:
+            version
             packet_type
-            seed,
-            field.value
-            total_bytes
-            packet_bytes
-            gen_size
+            session
+            hostname
+            gen_number
         
         If a payload (data) is included, this is appended to the header.
 
@@ -191,220 +3076,246 @@ class Server(ncUDP):
         ----------
         packet_type : int
             An integer to represent the packet type:
-                1: Engineering
-                2: Data
-                3: End generation
-                5: Moving to next generation
-                6: File transfer complete
+                1: Engineering ACK
+                3: Missing packets
+                4: Generation complete
+
+        payload : bytes, default=b''
+            A byte stream of data representing a serialised version of missing packets number. Default is empty if not a data packet
 
         Returns
         -------
         A packet containing header and payload
         """
 
-        header_data = bytearray(29)
-        if packet_type == 2:
-            seed = random.randint(0, 2 ** 64-1) # Set a seed so clients generate same coefficients
-            self.generator.set_seed(seed)
-            self.generator.generate(self.coefficients)
-            self.encoder.encode_symbol(self.symbol, self.coefficients)
-        else:
-            seed = 0
-
-        struct.pack_into(
-            '<HQQBIIH',
-            header_data,
-            0,
+        header = CLIENT_HEADER.pack(
+            VERSION,
             packet_type,
-            seed,
-            self.field.value,
-            self.field.value,
-            self.total_bytes,
-            self.packet_bytes,
-            self.gen_size
+            self.session,
+            self.hostname,
+            self.gen_number
         )
-        if packet_type == 2:
-            packet = header_data + self.symbol
-        else:
-            packet = header_data
+        packet = header + payload
         return packet
 
-    def transmit(self, packet):
+    def signature_packets(self):
         """
-        Transmits a coded packet via the multi-cast socket
+        Returns the packets carrying the signature of each generation of the basis, sent ahead of the join so the server
+        skips generations this client already holds. The basis is signed again only if the advertised generation size changes.
+
+        Returns
+        -------
+        A list of packets, with the first generation they sign in the generation field of the header
+        """
+        if self.basis is None or self.tree: # A tree is sent whole
+            return []
+        block_bytes = self.gen_size * self.packet_bytes
+        if len(self.digests) != self.num_gens * SIGNATURE_BYTES:
+            self.digests = b''.join(signature(os.pread(self.basis.fileno(), block_bytes, gen * block_bytes), block_bytes)
+                                    for gen in range(self.num_gens))
+        per_packet = self.packet_bytes // SIGNATURE_BYTES
+        return [CLIENT_HEADER.pack(VERSION, 9, self.session, self.hostname, first)
+                + self.digests[first * SIGNATURE_BYTES:(first + per_packet) * SIGNATURE_BYTES]
+                for first in range(0, self.num_gens, per_packet)]
+
+    def skip_to(self, gen):
+        """
+        Moves on to a later generation when the server has skipped the generations before it, as they are unchanged from
+        the basis. The skipped generations are read from the basis and handed to the writer stage.
 
         Parameters
         ----------
-        packet : bytes
-            Bytes representing a single packet from the create_packet method
+        gen : int
+            The generation the server moved on to, or the number of generations if it skipped the rest of the file
         """
-
-        while True:
-            ready = select.select([], [self.sock], [], 1)
-            if ready[1]:
-                self.sock.sendto(packet, self.address)
-                break
+        block_bytes = self.gen_size * self.packet_bytes
+        for skipped in range(self.gen_number, gen):
+            self.generations.pop(skipped, None)
+            self.writer.write(skipped, [os.pread(self.basis.fileno(), block_bytes, skipped * block_bytes).ljust(block_bytes, b'\0')])
+            self.from_basis += 1
+        self.gen_number = gen
         return True
 
-    def receive(self):
+    def decoded_generation(self, gen):
         """
-        Receives and processes packets from clients
+        Returns the decoding state of a generation if this client has fully decoded it, and so can answer peer repair requests for it
+
+        Parameters
+        ----------
+        gen : int
+            The generation number
 
         Returns
         -------
-        packet_type : int
-            The type of packet received:
-                1: Engineering
-                3: Missing packets
-                4: Generation complete
-
-        symbol : bytes
-            The payload of the received packet
-
-        hostname : str
-            The hostname of the source client, for updating the client dictionary
+        The Generation, or None if the generation is not fully decoded
         """
+        generation = self.completed.get(gen) or self.generations.get(gen)
+        if generation is not None and generation.complete:
+            return generation
+        return None
 
-        while True:
-            ready = select.select([self.sock], [], [], 1)
-            if ready[0]:
-                packet = self.sock.recv(self.packet_bytes + 6)
-                symbol = bytearray(packet[6:])
-                packet_type, hostname = struct.unpack_from('<HI', packet)
-                # Engineering type packet
-                if packet_type == 1:
-                    break
-                # Request for re-transmit
-                elif packet_type == 3:
-                    break
-                # No missing packets
-                elif packet_type == 4:
-                    break
-            else:
-                return 0, 0, 0
-        return packet_type, symbol, hostname
-
+    def collect_generation(self, gen):
+        """
+        Writes a generation of a carousel to the output file once it is decoded, checked at the end of the generation in any
+        cycle. A generation short of symbols gathers more in the next cycle, so generations complete in any order.
 
-class Client(ncUDP):
-    """
-    A class to enable a client to reliably receive network coded data via multi-cast UDP sockets from a server.
-    ...
-    Attributes
-    ----------
-    decoder : Kodo decoder
-        a Kodo decoder object used to store coded packets and decode them
-    generator : Kodo generator
-        a Kodo generator object used to generate coefficients required to decode packets
-    missing : int
-        an integer to store the number of missing packets
-    hostname : str
-        a string containing the client hostname
-    erased : int
-        an integer to store the number of missed packets
-    total_rx : int
-        an integer to store the total number of received packets
-    erasure : float
-        a float representing the chance of packet erasure as a percentage
+        Parameters
+        ----------
+        gen : int
+            The generation number
 
-    Methods
-    -------
-    connection()
-        Creates UDP network socket
-    next_gen()
-        Configures the decoder and generator in preparation for the next generation of coded packets
-    create_packet(packet_type, seq=0, payload=b'')
-        Creates a packet with header and data
-    save_file()
-        Opens the output file and writes all received data to it
-    transmit(packet)
-        Transmits packet via socket
-    receive()
-        Receives packets via socket
-    """
-    def __init__(self, args):
-        ncUDP.__init__(self, args)
-        self.decoder = kodo.block.Decoder(self.field)
-        self.generator = kodo.block.generator.RandomUniform(self.field)
-        self.missing = 0
-        self.hostname = args.hostname
-        self.erased = 0
-        self.total_rx = 0
-        self.erasure = random.uniform(args.erasurelow, args.erasurehigh)
-        if os.path.exists('output_file'):
-            os.remove('output_file')
+        Returns
+        -------
+        True if the generation was written
+        """
+        if gen in self.done or gen not in self.layouts or not self.is_complete(gen):
+            return False
+        self.flush_generation(gen)
+        self.done.add(gen)
+        return True
 
-    def connection(self):
+    def expire_generation(self, gen):
         """
-        Initialises a multi-cast UDP socket with the multi-cast IP and port provided
+        Delivers a generation once the server has moved on from it at its playout deadline. A generation short of degrees of
+        freedom cannot be partly decoded, as every coded symbol mixes the whole generation, so it is delivered as zeros at its
+        full size. The output keeps its length and later data stays in place.
+
+        Parameters
+        ----------
+        gen : int
+            The generation number
         """
-        self.sock = socket.socket(
-            family=socket.AF_INET, type=socket.SOCK_DGRAM, proto=socket.IPPROTO_UDP)
-        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.sock.bind(('', self.mcast_port))
-        self.mreq = struct.pack('4sl', socket.inet_aton(
-            self.mcast_grp), socket.INADDR_ANY)
-        self.sock.setsockopt(
-            socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, self.mreq)
-        self.sock.setblocking(0)
+        if self.is_complete(gen): # Decoded after its last report
+            self.flush_generation(gen)
+        else:
+            self.generations.pop(gen, None)
+            self.layouts.pop(gen, None)
+            self.writer.write(gen, [bytes(self.gen_size * self.packet_bytes)])
+            self.expired += 1
+        self.gen_number = gen + 1
         return True
 
-    def next_gen(self):
+    def cycles(self):
         """
-        Configure the decoder and generator in preparation to receive the next generation of coded packets
+        Returns the number of carousel cycles this client listened to, from the generation it joined at to the last
+        generation announced
+
+        Returns
+        -------
+        The number of cycles as a float
         """
-        self.decoder = kodo.block.Decoder(self.field)
-        self.decoder.configure(self.gen_size, self.packet_bytes)
-        self.generator.configure(self.decoder.symbols)
-        self.symbol = bytearray(self.decoder.symbol_bytes)
-        self.coefficients = bytearray(self.generator.max_coefficients_bytes)
-        self.data.clear()
-        self.data = bytearray(self.decoder.block_bytes)
-        self.decoder.set_symbols_storage(self.data)
-        self.missing = self.gen_size
+        return (self.cycle_position - self.cycle_start + 1) / max(self.num_gens, 1) if self.cycle_start is not None else 0
 
-    def create_packet(self, packet_type, payload=b''):
+    def create_peer_packet(self, packet_type, gen, seed, payload=b'', flags=0):
         """
-        Creates a packet header containing:
-            packet_type
-            hostname
-        
-        If a payload (data) is included, this is appended to the header.
+        Creates a packet for peer clients, using the same header layout as packets from the server so peers handle them alike
 
         Parameters
         ----------
         packet_type : int
             An integer to represent the packet type:
-                1: Engineering ACK
-                3: Missing packets
-                4: Generation complete
-
+                2: Data (peer repair)
+                7: Peer repair request
+        gen : int
+            The generation number
+        seed : int
+            The seed of the coding coefficients, or the hostname of the requesting client for a repair request
         payload : bytes, default=b''
-            A byte stream of data representing a serialised version of missing packets number. Default is empty if not a data packet
+            The coded symbol, or the number of missing degrees of freedom for a repair request
+        flags : int, default=0
+            Bit flags for the packet, such as FLAG_PEER
 
         Returns
         -------
         A packet containing header and payload
         """
+        return SERVER_HEADER.pack(VERSION, packet_type, flags, self.session, gen, seed, DENSE) + payload
 
-        header = bytearray(6)
-        struct.pack_into(
-            '<HI',
-            header,
-            0,
-            packet_type,
-            self.hostname
-        )
-        packet = header + payload
-        return packet
+    def request_peers(self):
+        """
+        Multi-casts the number of degrees of freedom missing from the current generation to peer clients, then receives their
+        repairs for up to PEER_WINDOW seconds, so only what no peer could supply is reported to the server
+        """
+        count = self.missing(self.gen_number)
+        self.transmit(self.create_peer_packet(7, self.gen_number, self.hostname, PEER_COUNT.pack(count)), self.address)
+        end = time.time() + PEER_WINDOW
+        while time.time() < end:
+            self.receive(end - time.time())
+        return True
+
+    def schedule_peer_repair(self, gen, count):
+        """
+        Schedules an answer to a peer repair request after a random backoff, keeping the largest count of any pending request
+        for the same generation. The answer is suppressed if another peer is heard repairing the generation first.
+
+        Parameters
+        ----------
+        gen : int
+            The generation number
+        count : int
+            The number of degrees of freedom the requesting peer is missing
+        """
+        if self.decoded_generation(gen) is None:
+            return
+        deadline, pending = self.peer_timers.get(gen, (time.time() + random.uniform(0, PEER_BACKOFF), 0))
+        self.peer_timers[gen] = (deadline, max(pending, count))
+
+    def answer_peers(self):
+        """
+        Multi-casts freshly coded symbols for every peer repair request whose backoff has expired. Any fully decoded generation
+        can be re-encoded with new random seeds, so the symbols are innovative for every peer missing the generation.
+        """
+        now = time.time()
+        for gen, (deadline, count) in list(self.peer_timers.items()):
+            if deadline > now:
+                continue
+            del self.peer_timers[gen]
+            generation = self.decoded_generation(gen)
+            if generation is None:
+                continue
+            encoder = kodo.block.Encoder(self.field)
+            encoder.configure(generation.decoder.symbols, self.packet_bytes)
+            encoder.set_symbols_storage(generation.data)
+            for _ in range(count):
+                seed = random.getrandbits(32)
+                with generation.lock:
+                    generation.generator.generate(generation.coefficients, seed)
+                    symbol = bytearray(encoder.symbol_bytes)
+                    encoder.encode_symbol(symbol, generation.coefficients)
+                self.transmit(self.create_peer_packet(2, gen, seed, symbol, FLAG_PEER | FLAG_REPAIR), self.address)
+                self.peer_tx += 1
+
+    def open_file(self):
+        """
+        Opens the output file, or the output directory of a tree, and starts the writer stage, once the file size is known
+        from the engineering packet
+        """
+        self.writer = (TreeWriter if self.tree else FileWriter)(self.args.output_file, self.total_bytes, self.args.fsync)
+        return True
+
+    def flush_generation(self, gen):
+        """
+        Hands the decoded data of a completed generation to the writer stage and releases its decoder
+
+        Parameters
+        ----------
+        gen : int
+            The generation number
+        """
+        packets, codec, length = self.layouts.pop(gen, (self.gen_size, 0, 0))
+        self.writer.write(gen, [self.pop_generation(gen)], codec, length)
+        return True
 
-    def save_file(self, data):
+    def save_file(self):
         """
-        Opens the output file for writing bytes and writes all received data to the file before closing.
+        Waits for the writer stage to write all received data and closes the output file. Padding after the end of the
+        file is never written, so files ending in whitespace or zeros are kept intact. A basis kept aside is removed.
         """
-        self.f = open(self.args.output_file, "wb")
-        self.f.write(data.strip())
-        #self.f.write(data)
-        self.f.close()
+        self.writer.close()
+        if self.basis is not None:
+            self.basis.close()
+            if self.basis_path:
+                os.remove(self.basis_path)
         enc_file = self.args.output_file.encode()
         hash_obj = hashlib.sha1(enc_file)
         self.hex_val = hash_obj.hexdigest()
@@ -412,22 +3323,34 @@ class Client(ncUDP):
 
     def transmit(self, packet, address):
         """
-        Transmits a packet via uni-cast to the server
+        Transmits a packet via uni-cast to the server. Feedback is timed until the server answers it.
 
         Parameters
         ----------
         packet : bytes
             Bytes representing a single packet from the create_packet method
         """
+        if address == self.server and CLIENT_HEADER.unpack_from(packet)[1] in (3, 4):
+            if self.feedback_time is None:
+                self.feedback_time = time.time()
+            else:
+                self.feedback_resent = True
 
         ready = select.select([], [self.sock], [], 1)
         if ready[1]:
             self.sock.sendto(packet, address)
         return True
 
-    def receive(self):
+    def receive(self, timeout=None):
         """
-        Receives and processes packets from the server
+        Receives and processes packets from the server, and from peer clients in peer repair mode. Data packets are only dispatched to the decode pool, so the socket is drained at the rate packets arrive rather than the rate they are decoded.
+        Pending peer repair answers are sent as their backoff expires.
+
+        Parameters
+        ----------
+        timeout : float, optional
+            The time to wait for a control packet in seconds. Defaults to the adaptive timeout, which backs off while nothing
+            is received
 
         Returns
         -------
@@ -441,50 +3364,105 @@ class Client(ncUDP):
 
         addr : str
             The hostname of the server, for uni-cast responses
+
+        Packets of another wire format version or session are dropped, as are all packets before the engineering packet.
         """
+        adaptive = timeout is None
+        if adaptive:
+            timeout = min(self.rtt.timeout() * self.backoff, MAX_RTO)
+        end = time.time() + timeout
         while True:
-            ready = select.select([self.sock], [], [], 1)
+            self.answer_peers()
+            wait = end - time.time()
+            if self.peer_timers:
+                wait = min(wait, min(d for d, _ in self.peer_timers.values()) - time.time())
+            if self.carousel:
+                self.adapt()
+            # Upper layers first, so symbols sent ahead of a control packet on the base layer are taken before it
+            ready = select.select(self.socks, [], [], max(wait, 0))
             if ready[0]:
-                packet, addr = self.sock.recvfrom(1429)
-                symbol = bytearray(packet[29:])
-                packet_type, seed, self.offset, field_byte, self.total_bytes, self.packet_bytes, self.gen_size = struct.unpack_from(
-                    '<HQQBIIH', packet)
-                self.total_packets = self.total_bytes // self.packet_bytes + 1
+                packet, addr = ready[0][-1].recvfrom(self.packet_bytes + SERVER_HEADER.size)
+                if len(packet) < SERVER_HEADER.size:
+                    continue
+                version, packet_type, flags, session, self.rx_gen, seed, density = SERVER_HEADER.unpack_from(packet)
+                if version != VERSION:
+                    continue
+                symbol = bytearray(packet[SERVER_HEADER.size:])
                 # Engineering packet
-                if packet_type == 1: # Initial configuration of the decoder and generator ready to receive the first generation
+                if packet_type == 1: # Initial (or negotiated) configuration of the transfer ready to receive the first generation
+                    self.session = session
+                    self.server = addr
+                    self.total_bytes, self.packet_bytes, self.gen_size, field_byte, codec, tree, self.layers = ENGINEERING.unpack_from(symbol)
+                    self.tree = bool(tree)
+                    self.carousel = bool(flags & FLAG_CAROUSEL)
+                    if codec == CODECS["zstd"] and zstandard is None:
+                        print("The server compresses with zstd, which requires the zstandard package.")
+                        sys.exit(1)
+                    self.set_field(field_byte)
+                    self.total_packets = self.total_bytes // self.packet_bytes + 1
                     self.num_gens = (-(-self.total_packets // self.gen_size))
-                    self.decoder.configure(self.gen_size, self.packet_bytes)
-                    self.generator.configure(self.decoder.symbols)
-                    self.symbol = bytearray(self.decoder.symbol_bytes)
-                    self.coefficients = bytearray(
-                        self.generator.max_coefficients_bytes)
-                    self.data = bytearray(self.decoder.block_bytes)
-                    self.decoder.set_symbols_storage(self.data)
-                    self.missing = self.gen_size
-                    self.full_gen = self.gen_size
+                    if self.carousel: # Position in the carousel, from the cycle and generation announced
+                        self.cycle_position = seed * self.num_gens + self.rx_gen
+                        if self.cycle_start is None:
+                            self.cycle_start = self.cycle_position
                     break
+                elif session != self.session:
+                    continue
+                self.backoff = 1
+                # Time the answer to feedback: a repair or control packet from the server for the generation
+                if self.feedback_time is not None and self.rx_gen == self.gen_number and not flags & FLAG_PEER \
+                        and (packet_type in (3, 5) or flags & FLAG_REPAIR):
+                    if not self.feedback_resent:
+                        self.rtt.update(time.time() - self.feedback_time)
+                    self.feedback_time = None
+                    self.feedback_resent = False
 
                 # Data received
-                elif packet_type == 2:
+                if packet_type == 2:
+                    if flags & FLAG_PEER:
+                        self.peer_timers.pop(self.rx_gen, None) # Another peer is repairing this generation
+                    if self.rx_gen < self.gen_number or self.rx_gen in self.done: # Packet for a generation already completed
+                        continue
                     self.total_rx += 1
-                    if random.uniform(0, 100) > self.erasure:
-                        if self.gen_size != self.full_gen:
-                            self.next_gen()
-                        self.generator.set_seed(seed)
-                        self.generator.generate(self.coefficients)
-                        self.decoder.decode_symbol(symbol, self.coefficients) # Try to decode
-                        self.missing -= 1
+                    if not self.congested(len(packet)) and not self.erase():
+                        generation = self.get_generation(self.rx_gen)
+                        if generation.complete: # Drop without dispatching once the generation is decoded
+                            self.wasted += 1
+                        else:
+                            generation.pending.append(self.pool.submit(generation.decode, seed, density, symbol))
+                        self.window_rx += 1
                     else:
                         self.erased += 1
+                        self.window_lost += 1
+                # Join acknowledgement
+                elif packet_type == 8:
+                    if seed == self.hostname:
+                        break
+                # Peer repair request
+                elif packet_type == 7:
+                    if self.args.peer_repair and seed != self.hostname:
+                        self.schedule_peer_repair(self.rx_gen, PEER_COUNT.unpack_from(symbol)[0])
                 # Initial send complete, request re-send
                 elif packet_type == 3:
+                    if self.basis and self.writer and self.gen_number < self.rx_gen \
+                            and SKIPPED.unpack_from(symbol, LAYOUT.size)[0] <= self.gen_number:
+                        self.skip_to(self.rx_gen) # Generations unchanged from the basis were skipped
+                    if (self.rx_gen not in self.done if self.carousel else self.rx_gen == self.gen_number) and len(symbol) >= LAYOUT.size:
+                        self.set_layout(self.rx_gen, *LAYOUT.unpack_from(symbol))
                     break
-                # File complete
+                # Generation complete, or its playout deadline passed before this client decoded it
                 elif packet_type == 5:
+                    if flags & FLAG_EXPIRED and self.writer and not self.carousel and self.rx_gen == self.gen_number:
+                        self.expire_generation(self.rx_gen)
                     break
                 elif packet_type == 6:
+                    if self.basis and self.writer and self.gen_number < self.num_gens \
+                            and SKIPPED.unpack_from(symbol)[0] <= self.gen_number:
+                        self.skip_to(self.num_gens)
                     break
-            else:
+            elif time.time() >= end:
+                if adaptive and timeout < MAX_RTO:
+                    self.backoff *= 2
                 return 0, 0
         return packet_type, addr
 
@@ -496,10 +3474,17 @@ def arguments():
     Parameters
     ----------
     --file-path : str
-        The path to the file which should be sent
+        The path to the file which should be sent, or a directory whose whole tree is sent. A tree is sent as a manifest
+        followed by its files packed back to back, so small files share generations
 
     --output-file : str
-        The path to where the received file should be saved
+        The path to where the received file should be saved, or the directory a tree is written to. A named pipe is
+        written as it is read, and "-" writes the received data to stdout, with progress and statistics on stderr
+
+    --basis : str
+        The path to an existing copy of the file, such as the previous version, for a delta transfer. Its generation
+        signatures are sent when joining, the server only sends generations that differ, and the others are taken from the
+        basis. It may be the output file itself. Not used if the server changes the generation size with --field auto
 
     --ip : str
         The multi-cast group IP address
@@ -508,14 +3493,23 @@ def arguments():
         The multi-cast port
 
     --packet-size : int
-        The desired packet size in bytes
+        The desired packet payload size in bytes
+        Default is derived from the MTU
+
+    --mtu : int
+        The path MTU in bytes
+        Default is discovered from the interface used to reach the multi-cast group
 
     --gen-size : int
         The desired number of packets per generation
 
-    --hostname : str
-        The hostname of the client
-        Default is the actual hostname, but in virtual environments a unique hostname must be assigned per client
+    --hostname : int
+        The 32-bit ID of the client
+        Default is a random ID chosen when the client starts
+
+    --expect-clients : int
+        The number of clients the server waits for before starting the transfer
+        Default is to start after a join window timed from the round trip times of the clients that joined
 
     --erasurelow : int
         The lower bound on erasure probability setting (%)
@@ -523,6 +3517,89 @@ def arguments():
     --erasurehigh : int
         The upper bound on erasure probability setting (%)
 
+    --burst-length : float
+        The mean number of packets lost in a row, following a Gilbert-Elliott model, or 0 for independent losses
+
+    --decode-workers : int
+        The number of worker threads decoding received generations on the client
+
+    --symbol-cache : int
+        The number of coded symbols held in the server symbol cache
+
+    --prefill : int
+        The number of coded symbols the server encodes ahead of the send path on a background thread, 0 to disable
+
+    --coefficient-pool : int
+        The number of coefficient vectors the server pre-generates, at least twice the generation size
+
+    --fsync : str
+        When received data is synced to disk: "none" (the default), after every "generation", or once at the "end"
+
+    --density : float
+        The fraction of non-zero coding coefficients in the initial transmission of a generation, 1 for dense coding
+
+    --repair-density : float
+        The fraction of non-zero coding coefficients in repair packets, usually higher than --density so the last
+        degrees of freedom are not lost to linearly dependent sparse packets
+
+    --read-ahead : int
+        The number of generations the server reads from the target file ahead of the send path
+
+    --interleave : int
+        The number of generations whose initial transmissions are interleaved packet by packet, so a burst of losses is
+        spread across them, 1 to send each generation in turn
+
+    --compress : str
+        The codec generations are compressed with: "none" (the default), "zlib", or "zstd" (requires the zstandard package).
+        Generations that would not be sent in fewer packets are sent as they are, and compression is switched off if a
+        sample of the file does not compress
+
+    --straggler-loss : float
+        The loss rate above which a client is moved to the catch-up session rather than holding the group back, 1 to disable
+
+    --max-lag : int
+        The number of consecutive generations a client may hold the group back before it is moved to the catch-up session, 0 to disable
+
+    --peer-repair : bool
+        Clients that have decoded a generation answer the repair requests of peer clients before they are sent to the server
+
+    --repair-mode : str
+        How repair packets are sent: multicast, unicast where possible, or auto to choose from the missing packet reports
+
+    --mcast-rate : float
+        The expected multi-cast (basic) link rate in Mbit/s, used when choosing how to send repairs, and the rate a carousel
+        sends at
+
+    --ucast-rate : float
+        The expected uni-cast link rate in Mbit/s, used when choosing how to send repairs
+
+    --carousel : bool
+        The server loops over the file at --mcast-rate without joins or feedback, and clients listen from any generation and
+        leave once they hold the whole file
+
+    --cycles : int
+        The number of cycles a carousel sends, 0 to send until interrupted
+
+    --carousel-loss : int
+        The packet loss rate (%) the expected number of carousel cycles is reported for
+
+    --deadline : float
+        The playout deadline of each generation in seconds from the start of its turn, after which it is no longer repaired
+        and clients that have not decoded it deliver it as zeros, 0 to repair every generation until every client holds it
+
+    --layers : int
+        The number of multi-cast layers a carousel is sent on, each on the next group address and port. The base layer sends
+        at --mcast-rate and each layer above doubles the rate, and clients join and leave layers from the loss they observe
+
+    --capacity : float
+        The link capacity in Mbit/s a client simulates, dropping packets that arrive faster, or 0 for no limit
+
+    --field : str
+        The finite field to code over (binary, binary4, binary8, binary16), or auto to select the field and generation size from the client reports
+
+    --link-rate : float
+        The expected multi-cast link rate in Mbit/s, used when selecting the field and generation size automatically
+
     Returns
     -------
     args : list
@@ -530,7 +3607,6 @@ def arguments():
     
     """
     parser = argparse.ArgumentParser()
-    ip = socket.gethostbyname(socket.gethostname())
 
     """The parser takes a path to a file as input."""
     parser.add_argument(
@@ -545,6 +3621,9 @@ def arguments():
         help="Path to the file which should be received.",
         default="output_file",
     )
+    parser.add_argument(
+        "--basis", type=str, help="Existing copy of the file for a delta transfer", default=None
+    )
     parser.add_argument(
         "--ip", type=str, help="The IP address to send to.", default=MCAST_GRP
     )
@@ -552,13 +3631,19 @@ def arguments():
         "--port", type=int, help="The port to send to.", default=MCAST_PORT
     )
     parser.add_argument(
-        "--packet-size", type=int, help="Packet size in bytes.", default=1400
+        "--packet-size", type=int, help="Packet payload size in bytes, derived from the MTU by default.", default=None
+    )
+    parser.add_argument(
+        "--mtu", type=int, help="Path MTU in bytes, discovered by default.", default=None
     )
     parser.add_argument(
         "--gen-size", type=int, help="Number of packets per generation.", default=20
     )
     parser.add_argument(
-        "--hostname", type=int, help="Client hostname", default=ip
+        "--hostname", type=int, help="Client ID, random by default", default=None
+    )
+    parser.add_argument(
+        "--expect-clients", type=int, help="Start as soon as this many clients have joined", default=0
     )
     parser.add_argument(
         "--erasurelow", type=int, help="Erasure low percentage", default=0
@@ -566,5 +3651,80 @@ def arguments():
     parser.add_argument(
         "--erasurehigh", type=int, help="Erasure high percentage", default=0
     )
+    parser.add_argument(
+        "--burst-length", type=float, help="Mean packets per loss burst, 0 for independent losses", default=0
+    )
+    parser.add_argument(
+        "--decode-workers", type=int, help="Number of client decoding threads", default=os.cpu_count()
+    )
+    parser.add_argument(
+        "--symbol-cache", type=int, help="Coded symbols held in the server cache", default=4096
+    )
+    parser.add_argument(
+        "--prefill", type=int, help="Coded symbols encoded ahead of sending", default=32
+    )
+    parser.add_argument(
+        "--coefficient-pool", type=int, help="Pre-generated coefficient vectors", default=0
+    )
+    parser.add_argument(
+        "--field", type=str, help="Finite field, or auto", default="binary16", choices=list(FIELDS) + ["auto"]
+    )
+    parser.add_argument(
+        "--link-rate", type=float, help="Expected link rate in Mbit/s", default=54
+    )
+    parser.add_argument(
+        "--fsync", type=str, help="When to sync received data to disk", default="none", choices=["none", "generation", "end"]
+    )
+    parser.add_argument(
+        "--density", type=float, help="Fraction of non-zero coefficients", default=1.0
+    )
+    parser.add_argument(
+        "--repair-density", type=float, help="Fraction of non-zero coefficients in repair packets", default=1.0
+    )
+    parser.add_argument(
+        "--read-ahead", type=int, help="Generations read ahead of sending", default=4
+    )
+    parser.add_argument(
+        "--interleave", type=int, help="Generations interleaved in the initial transmission", default=1
+    )
+    parser.add_argument(
+        "--compress", type=str, help="Generation compression", default="none", choices=list(CODECS)
+    )
+    parser.add_argument(
+        "--straggler-loss", type=float, help="Loss rate that moves a client to catch-up", default=0.2
+    )
+    parser.add_argument(
+        "--max-lag", type=int, help="Generations a client may hold the group back", default=3
+    )
+    parser.add_argument(
+        "--peer-repair", action="store_true", help="Clients repair each other before asking the server"
+    )
+    parser.add_argument(
+        "--repair-mode", type=str, help="Repair delivery", default="auto", choices=["multicast", "unicast", "auto"]
+    )
+    parser.add_argument(
+        "--mcast-rate", type=float, help="Multi-cast link rate in Mbit/s", default=6
+    )
+    parser.add_argument(
+        "--ucast-rate", type=float, help="Uni-cast link rate in Mbit/s", default=54
+    )
+    parser.add_argument(
+        "--carousel", action="store_true", help="Loop over the file without feedback"
+    )
+    parser.add_argument(
+        "--cycles", type=int, help="Carousel cycles, 0 until interrupted", default=0
+    )
+    parser.add_argument(
+        "--carousel-loss", type=int, help="Loss percentage for the expected carousel cycles", default=10
+    )
+    parser.add_argument(
+        "--deadline", type=float, help="Playout deadline per generation in seconds, 0 for none", default=0
+    )
+    parser.add_argument(
+        "--layers", type=int, help="Multi-cast layers of a carousel", default=1
+    )
+    parser.add_argument(
+        "--capacity", type=float, help="Simulated client link capacity in Mbit/s, 0 for none", default=0
+    )
     args = parser.parse_args()
     return args
@@ -1,5 +1,4 @@
 import time
-import pickle
 import ncudp
 
 def main():
@@ -10,79 +9,189 @@ def main():
     s = ncudp.Server(args) # Instantiate ncUDP server object
     s.connection() # Initialise network socket
     s.open_file() # Open the target file
-    missing = 0 # Initialise empty missing packet number to 0
+    if s.tree:
+        print(f"> Sending {s.tree.files} files in {s.total_bytes} bytes from {args.file_path}")
+
+    # Carousel mode: the file is sent round at a fixed rate with no joins, feedback or per client state, and clients listen
+    # from any generation and leave once they have decoded the whole file
+    if args.carousel:
+        if args.compress != "none" and not s.sample_compression():
+            print(f"> File does not compress with {args.compress}, sending uncompressed")
+        s.plan_generations() # Every generation, as no client reports signatures
+        print(f"\n> Carousel of {s.num_gens} generations at {args.mcast_rate} Mbit/s")
+        if s.layers > 1:
+            print(f"> {s.layers} layers up to {args.mcast_rate * 2 ** (s.layers - 1)} Mbit/s, from {s.layer_address(0)[0]}:{s.layer_address(0)[1]}")
+        print(f"> Expected cycles at {args.carousel_loss}% loss: {round(ncudp.expected_cycles(args.carousel_loss / 100, s.num_gens, s.gen_size), 2)}")
+        try:
+            while not args.cycles or s.cycle < args.cycles:
+                for x in s.plan:
+                    s.current_gen = x # Set generation number
+                    s.create_gen() # Load the generation into the encoder, carrying on from the coded symbols of the last cycle
+                    s.transmit(s.create_packet(1, ncudp.FLAG_CAROUSEL)) # Announce the session and position to new clients
+                    for _ in range(s.layout(x)[0]):
+                        for layer in range(s.layers): # Each layer carries its own coded symbols, at its share of the rate
+                            for _ in range(s.layer_share(layer)):
+                                s.pace() # Space packets at the carousel rate
+                                s.transmit(s.create_packet(2), s.layer_address(layer))
+                                s.tx += 1
+                    s.transmit(s.create_packet(3)) # Layout of the generation, which ends it for clients
+                s.cycle += 1
+                if args.cycles:
+                    s.progressBar(s.cycle, args.cycles, 'Tx') # Increment transmit progress
+        except KeyboardInterrupt: # A carousel without --cycles runs until stopped
+            pass
+        for _ in range(3):
+            s.transmit(s.create_packet(6))
+
+        # Print statistics to terminal
+        print('\nCarousel stopped\n-------------------------------------')
+        print(f'Cycles sent: {s.cycle}')
+        print(f'Packets sent: {s.tx}')
+        print(f'Pre-encoded symbols sent: {round((s.cache_hits / max(s.tx, 1))*100, 1)} %\n')
+        s.sock.close() # Close the socket
+        s.f.close() # Close the target file
+        return
+
+    missing = {} # Initialise empty dictionary of missing packet numbers per client
+    interleave = max(args.interleave, 1) # Generations sent in each interleaved initial transmission
 
     # Engineering phase: Server sends advertisement packets
+    sent = time.time()
     for _ in range(3):
         s.transmit(s.create_packet(1))
     print("\nSent engineering packet, awaiting response...")
+    print(f"> Packet size: {s.packet_bytes} bytes (MTU {s.mtu})")
 
-    # Wait for clients to respond and add them to the 'client state matrix'
-    timeout = time.time() + 0.1
-    while True:
-        type, symbol, hostname = s.receive()
+    # Join phase: clients join with their ID and capabilities and are acknowledged, until the expected number of clients
+    # have joined, or otherwise until twice the timeout of the slowest client has passed
+    timeout = sent + ncudp.INITIAL_RTO
+    while len(s.clients) < args.expect_clients if args.expect_clients else time.time() < timeout:
+        type, symbol, hostname = s.receive(None if args.expect_clients else timeout - time.time())
         if type == 1:
-            s.clients[hostname] = 1 # Adding client to state matrix by hostname and default state of 1
-        else:
-            if time.time() > timeout:
-                break
+            s.join(hostname, symbol, time.time() - sent)
+            timeout = sent + 2 * s.timeout()
+        elif type == 0: # Re-announce the session for clients still to join
+            s.transmit(s.create_packet(1))
 
     print(f"> Connected to {len(s.clients)} client(s)\n-------------------------------------")
 
+    # Auto mode: choose the field and generation size from the client reports and re-advertise them
+    if args.field == "auto":
+        field, gen_size = s.negotiate()
+        s.set_coding(ncudp.FIELDS[field], gen_size)
+        for _ in range(3):
+            s.transmit(s.create_packet(1))
+        print(f"> Selected field {field} with generation size {s.gen_size}\n-------------------------------------")
+
+    if args.compress != "none" and not s.sample_compression(): # Compression is skipped for files that do not compress
+        print(f"> File does not compress with {args.compress}, sending uncompressed")
+
+    # Delta transfer: skip the generations every client already holds, from the signatures they joined with
+    if len(s.plan_generations()) < s.num_gens:
+        print(f"> Delta transfer: sending {len(s.plan)} of {s.num_gens} generations")
+
     # Loop for each generation in the file to be transmitted 
-    for x in range(s.num_gens):
+    for i, x in enumerate(s.plan):
         s.current_gen = x # Set generation number
+        s.start_deadline() # Playout deadline of the generation, with --deadline
         s.create_gen() # Initialise encoder and create generation of coded packets
-        # Initial transmission of generation packets
-        for _ in range(s.gen_size):
-            s.transmit(s.create_packet(2))
-            s.tx += 1 # Track number of data packets sent for calculating re-transmission rate
-        for _ in range(1):
-            s.transmit(s.create_packet(3)) # Transmit end generation control packet
-
-        count = 0
+        # Initial transmission of generation packets, interleaved packet by packet across the next --interleave generations
+        # so a burst of losses is spread across them. Generations sent ahead go straight to feedback when their turn comes.
+        if i % interleave == 0:
+            window = s.plan[i:i + interleave]
+            counts = [s.layout(gen)[0] for gen in window] # Compressed generations need fewer symbols
+            for index in range(max(counts)):
+                for gen, count in zip(window, counts):
+                    if index >= count:
+                        continue
+                    s.transmit(s.create_packet(2, gen=gen))
+                    s.tx += 1 # Track number of data packets sent for calculating re-transmission rate
+        s.transmit_control() # Transmit end generation control packet
+
         while True:
             type, symbol, hostname = s.receive()
+            if type in (3, 4) and hostname in s.stragglers: # Feedback from a client in the catch-up session
+                s.catch_up(type, symbol, hostname)
+                continue
             if type == 3: # If missing, add to list and client state to 3
                 s.clients[hostname] = 3
-                res = pickle.loads(symbol)
-                if res > missing:
-                    missing = res            
+                missing[hostname] = s.missing_count(symbol) # Decode the number of missing degrees of freedom
+                s.record_loss(hostname, missing[hostname])
             elif type == 4: # If not missing, set client state to 4
                 s.clients[hostname] = 4
-            else: # Re-transmit end generation control packet for clients that missed it
-                if count == 3: 
-                    s.transmit(s.create_packet(3))
-                    count = 0
-                else:
-                    count += 1
+                s.record_loss(hostname, 0)
+            elif type == 0 and not s.is_expired(): # Feedback timed out, re-send the control packet for clients that missed it
+                s.transmit_control(resend=True)
+                s.prompt_stragglers()
+            # Move clients holding back the healthy clients to the catch-up session, so the group moves on without them
+            lagging = s.lagging()
+            if lagging:
+                s.demote(lagging)
+                for client in lagging:
+                    missing.pop(client, None)
             # If all clients have reported status, re-transmit new coded packets == to missing
             if all(v != 1 for v in s.clients.values()):
-                if missing != 0:
-                    for _ in range(missing):
-                        s.transmit(s.create_packet(2))
+                if missing:
+                    s.note_round() # Track clients holding the group back
+                    multicast, unicast = s.plan_repairs(missing) # Split repairs between multi-cast and uni-cast
+                    for _ in range(multicast):
+                        s.transmit(s.create_packet(2, ncudp.FLAG_REPAIR))
                         s.tx += 1 # Track number of data packets sent for calculating re-transmission rate
+                    for client, count in unicast.items():
+                        for _ in range(count):
+                            s.transmit(s.create_packet(2, ncudp.FLAG_REPAIR), s.addresses[client])
+                            s.tx += 1
                     for y in s.clients: # Reset clients state that were missing back to 1
                         if s.clients[y] == 3:
                             s.clients[y] = 1
-                    s.transmit(s.create_packet(3))
-                    missing = 0 # Set missing to 0 after re-transmissions complete
+                    s.transmit_control()
+                    missing.clear() # Clear missing after re-transmissions complete
                 # If all clients complete (state 4), send finished gen packet    
                 elif all(v == 4 for v in s.clients.values()):
                     s.transmit(s.create_packet(5))
                     break
+            # Playout deadline passed: stop repairing the generation, and clients that have not decoded it deliver a gap
+            if s.is_expired():
+                s.expire()
+                missing.clear()
+                break
 
-        s.progressBar(x+1, s.num_gens, 'Tx') # Increment transmit progress
+        s.progressBar(i+1, len(s.plan), 'Tx') # Increment transmit progress
+        s.end_generation() # Update how long each client has held the group back
         for client in s.clients: # Reset client states to 1
             s.clients[client] = 1
 
+    # Serve clients still in the catch-up session until they have the whole file
+    s.finished = True
+    while s.stragglers:
+        type, symbol, hostname = s.receive()
+        if type in (3, 4) and hostname in s.stragglers:
+            s.catch_up(type, symbol, hostname)
+        elif type == 0:
+            s.prompt_stragglers()
+
     # When last generation complete, transmit end file packet        
     for _ in range(1):
         s.transmit(s.create_packet(6))
 
     # Print statistics to terminal
     print('\nFile transfer complete!\n-------------------------------------')
-    print(f'Re-transmit rate: {round(((s.tx / s.total_packets) -1)*100, 1)} %\n')
+    # Packets the file was sent in, fewer than the file holds if compressed or skipped by a delta transfer
+    sent = sum(layout[0] for layout in s.layouts.values()) if s.codec or len(s.plan) < s.num_gens else s.total_packets
+    print(f'Re-transmit rate: {round(((s.tx / sent) -1)*100, 1) if sent else 0} %')
+    print(f'Repair rounds: {s.repair_rounds}')
+    if s.codec:
+        print(f'Compressed generations: {sum(1 for layout in s.layouts.values() if layout[1])}/{s.num_gens}')
+    print(f'Repair air time: {round(s.repair_airtime, 3)} s')
+    print(f'Catch-up packets: {s.catch_up_tx}')
+    if args.deadline:
+        print(f'Generations expired: {s.expired}/{len(s.plan)}')
+    if s.signatures:
+        print(f'Generations sent: {len(s.plan)}/{s.num_gens}')
+    print(f'Generations read ahead: {s.reader.reads if s.reader else 0}/{len(s.plan)}')
+    print(f'Feedback wait: {round(sum(s.gen_waits), 3)} s, {round(sum(s.gen_waits) / max(len(s.gen_waits), 1) * 1000, 1)} ms mean, {round(max(s.gen_waits, default=0) * 1000, 1)} ms max per generation')
+    print(f'Control re-sends: {s.control_resends}\n')
+    print(f'Pre-encoded symbols sent: {round((s.cache_hits / max(s.tx, 1))*100, 1)} %\n')
     print('File transfer complete.')
     s.sock.close() # Close the socket
     s.f.close() # Close the target file
@@ -0,0 +1,73 @@
+import sys
+import time
+import ltudp
+
+def main():
+    """
+    Main flow control logic for the LT fountain coded client.
+    """
+    args = ltudp.arguments() # Get arguments at execution
+    if args.output_file == "-": # Received data is written to stdout, so progress and statistics go to stderr
+        sys.stdout = sys.stderr
+    c = ltudp.Client(args) # Instantiate ltUDP client object
+    c.connection() # Initialise network socket
+
+    print("\nClient initialised, awaiting connection...")
+
+    # Engineering phase: Client listens for the server announcement and joins until the server acknowledges it
+    while True:
+        type, addr = c.receive()
+        if c.carousel: # A carousel is listened to without joining
+            print(f"> Listening to carousel from server: {c.server[0]}:{c.server[1]}\n-------------------------------------")
+            break
+        if type != 8 and c.server: # Join with loss, again until acknowledged
+            c.transmit(c.create_packet(1, c.capabilities()), c.server)
+        elif type == 8: # Join acknowledged
+            print(f"> Connected to server: {c.server[0]}:{c.server[1]} as client {c.hostname:08x}\n-------------------------------------")
+            break
+    c.open_file() # Start writing decoded blocks to the output file
+    start = time.time() # Start timer for measuring decode time
+
+    if c.carousel:
+        # Decode encoded symbols of every block as they come round, writing each block once it is decoded
+        while not c.is_complete():
+            type, addr = c.receive()
+            if type == 1: # Next block of the carousel
+                c.progressBar(len(c.completed), c.num_blocks, 'Rx') # Increment receive progress
+            elif type == 6: # The carousel stopped before the whole file was decoded
+                print(f"\nCarousel stopped with {len(c.completed)} of {c.num_blocks} blocks decoded")
+                break
+        c.progressBar(len(c.completed), c.num_blocks, 'Rx')
+        c.save_file() # Wait for the remaining data to be written
+    else:
+        # Receive encoded symbols of any block, decoding as they arrive, and report what is missing at the end of each round
+        while True:
+            type, addr = c.receive()
+            if type == 3: # Received end of round control packet
+                if c.is_complete(): # If all blocks decoded, respond complete
+                    c.transmit(c.create_packet(4), c.server)
+                else: # Otherwise return number of missing source symbols per block
+                    c.transmit(c.create_packet(3, c.nack()), c.server)
+                c.progressBar(len(c.completed), c.num_blocks, 'Rx') # Increment receive progress
+            elif type == 6: # All clients finished receiving file
+                c.save_file() # Wait for the remaining data to be written
+                break
+
+    delta = time.time() - start # Calculate total decode time
+
+    # Print statistics to terminal
+    print("\nFile transfer complete!\n-------------------------------------")
+    print(f"Decode Rate: {round((c.total_bytes / delta)/1e6, 2)} MBytes/s")
+    print(f"Erasure Rate: {round(((c.erased)/(c.total_rx)) * 100, 1)}%")
+    if c.tree:
+        print(f"Files written: {c.writer.completed}")
+    if c.carousel and c.layers > 1:
+        print(f"Layers: {len(c.socks)}/{c.layers} at the end, {c.joins} joined, {c.leaves} left")
+    if c.carousel:
+        print(f"Carousel cycles: {round(c.cycles(), 2)} (expected {round(ltudp.expected_cycles(c.erasure / 100, c.num_blocks, c.block_size, args.overhead), 2)} at {round(c.erasure, 1)}% loss)")
+    print(f"Coding efficiency: {c.innovative} innovative, {c.wasted} wasted ({round((c.innovative / max(c.innovative + c.wasted, 1)) * 100, 1)}% innovative)\n")
+    print(f"Run-time: {delta}")
+    c.sock.close() # Close the socket
+
+if __name__ == '__main__':
+    main()
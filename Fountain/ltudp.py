@@ -0,0 +1,2305 @@
+import argparse
+import bisect
+import math
+import multiprocessing
+import os
+import socket
+import sys
+import struct
+import random
+import queue
+import threading
+import select
+import hashlib
+import json
+import time
+from collections import OrderedDict
+
+MCAST_GRP = "224.1.1.1"
+MCAST_PORT = 5007
+
+DEFAULT_MTU = 1500 # Assumed MTU when it cannot be discovered from the outgoing interface
+IP_MTU = getattr(socket, 'IP_MTU', 14) # Linux socket option, not exposed by every Python build
+IP_MULTICAST_ALL = getattr(socket, 'IP_MULTICAST_ALL', 49) # Linux socket option, off so a socket only receives the groups it joined
+IP_UDP_HEADERS = 28 # Bytes of IPv4 and UDP header in every datagram
+MAX_DATAGRAM = 65507 # Largest UDP payload over IPv4
+RTT_ALPHA = 0.125 # Weight of the newest sample in the smoothed round trip time
+RTT_BETA = 0.25 # Weight of the newest sample in the round trip time variation
+INITIAL_RTO = 0.1 # Time to wait for a reply before any round trip time has been measured, in seconds
+MIN_RTO = 0.005 # Shortest time to wait for a reply, in seconds
+MAX_RTO = 1.0 # Longest time to wait for a reply, including back-off, in seconds
+IOV_MAX = 1024 # Most buffers written by a single writev call
+TREE_FDS = 64 # Most files of a directory tree the server holds open at once
+MAX_CYCLES = 1000 # Most carousel cycles summed by the expected cycles metric
+RLM_WINDOW = 0.25 # Time over which a client measures its loss rate before deciding to join or leave a layer, in seconds
+RLM_LOSS = 0.05 # Rise in the loss rate over the loss before the last join that a client takes as congestion
+RLM_JOIN = 0.5 # Time a client waits before trying to join a layer for the first time, in seconds
+RLM_MAX_JOIN = 8.0 # Longest time a client waits before trying again to join a layer it had to leave, in seconds
+CAPACITY_BURST = 0.05 # Time of data at the simulated link capacity a client can take in a burst, in seconds
+
+SOLITON_C = 0.03 # Robust soliton tuning constant, scaling the number of expected degree one symbols
+SOLITON_DELTA = 0.05 # Robust soliton bound on the probability that decoding fails after the expected number of symbols
+
+VERSION = 5 # Wire format version, packets of any other version are dropped
+FLAG_REPAIR = 0x01 # Set on encoded symbols sent in a repair round
+FLAG_CAROUSEL = 0x02 # Set on engineering packets of a carousel, whose seed is the cycle number
+
+# Header of every server packet: version, packet_type, flags, session, block (or round for control packets), seed
+SERVER_HEADER = struct.Struct('<BBBHII')
+# Header of every client packet: version, packet_type, session, hostname, round
+CLIENT_HEADER = struct.Struct('<BBHII')
+# Transfer parameters, carried only by engineering packets: total_bytes, packet_bytes, block_size, tree (1 when a directory
+# tree is sent), layers (the number of multi-cast layers of a carousel, or of groups the shards of a sharded server send on)
+ENGINEERING = struct.Struct('<QHIBB')
+# Capabilities a client joins with: loss (its erasure rate from 0 to 1)
+CAPABILITIES = struct.Struct('<f')
+# Source symbols a client is missing from a block, repeated for each block in missing feedback: block, missing
+MISSING = struct.Struct('<II')
+# Length of the manifest at the start of a directory tree transfer, which follows it as JSON
+MANIFEST = struct.Struct('<I')
+
+
+def soliton_weights(k):
+    """
+    Returns the robust soliton degree weights for a block of k source symbols, before they are normalised. Their sum is the
+    factor over k of the encoded symbols a block needs to decode with probability 1 - SOLITON_DELTA.
+
+    Parameters
+    ----------
+    k : int
+        The number of source symbols in the block
+
+    Returns
+    -------
+    A list whose entry d - 1 is the weight of degree d
+    """
+    r = SOLITON_C * math.log(k / SOLITON_DELTA) * math.sqrt(k)
+    spike = max(1, min(k, int(k / r))) if r > 0 else k
+    weights = [1 / k] + [1 / (d * (d - 1)) for d in range(2, k + 1)] # Ideal soliton
+    for d in range(1, spike):
+        weights[d - 1] += r / (d * k)
+    weights[spike - 1] += r * math.log(r / SOLITON_DELTA) / k if r > SOLITON_DELTA else 0
+    return weights
+
+
+def robust_soliton(k):
+    """
+    Returns the cumulative robust soliton degree distribution for a block of k source symbols
+
+    Parameters
+    ----------
+    k : int
+        The number of source symbols in the block
+
+    Returns
+    -------
+    A list whose entry d - 1 is the probability of a degree of at most d
+    """
+    weights = soliton_weights(k)
+    total = sum(weights)
+    cdf = []
+    acc = 0
+    for w in weights:
+        acc += w / total
+        cdf.append(acc)
+    cdf[-1] = 1.0
+    return cdf
+
+
+def binomial_tail(n, q, need):
+    """
+    Returns the probability that at least need of n packets arrive, each arriving independently with probability q
+
+    Parameters
+    ----------
+    n : int
+        The number of packets sent
+    q : float
+        The probability that a packet arrives
+    need : int
+        The number of packets needed
+
+    Returns
+    -------
+    The probability as a float
+    """
+    if need <= 0:
+        return 1.0
+    if need > n or q <= 0:
+        return 0.0
+    if q >= 1:
+        return 1.0
+    log_q, log_p = math.log(q), math.log1p(-q)
+    terms = (math.lgamma(n + 1) - math.lgamma(i + 1) - math.lgamma(n - i + 1) + i * log_q + (n - i) * log_p for i in range(need, n + 1))
+    return min(sum(math.exp(t) for t in terms), 1.0)
+
+
+def expected_cycles(loss, blocks, k, overhead):
+    """
+    Returns the expected number of carousel cycles a client needs to decode every block of the file at a packet loss rate,
+    counted in whole cycles from the start of a cycle. Each cycle sends k * (1 + overhead) new encoded symbols of every
+    block, and a block is taken to decode once the number of symbols the robust soliton distribution needs have arrived.
+    Blocks are taken at their full size.
+
+    Parameters
+    ----------
+    loss : float
+        The packet loss rate, from 0 to 1
+    blocks : int
+        The number of blocks in the file
+    k : int
+        The number of source symbols per block
+    overhead : float
+        The fraction of extra encoded symbols sent per block each cycle
+
+    Returns
+    -------
+    The expected number of cycles as a float, infinite if nothing arrives
+    """
+    if loss >= 1:
+        return math.inf
+    sent = math.ceil(k * (1 + overhead))
+    needed = max(k, math.ceil(k * sum(soliton_weights(k))))
+    expected = 0
+    for cycles in range(MAX_CYCLES):
+        remaining = 1 - binomial_tail(cycles * sent, 1 - loss, needed) ** blocks # Chance the file is not yet decoded after this many cycles
+        expected += remaining
+        if remaining < 1e-9:
+            break
+    return expected
+
+
+def neighbours(seed, k, cdf):
+    """
+    Returns the source symbols combined into an encoded symbol. Server and clients derive them from the seed alone.
+
+    Parameters
+    ----------
+    seed : int
+        The seed of the encoded symbol
+    k : int
+        The number of source symbols in the block
+    cdf : list
+        The cumulative degree distribution of the block
+
+    Returns
+    -------
+    A list of source symbol positions within the block
+    """
+    rng = random.Random(seed)
+    degree = min(bisect.bisect_left(cdf, rng.random()) + 1, k)
+    return rng.sample(range(k), degree)
+
+
+class ltUDP:
+    """
+    A class to enable the reliable transmission of data via multi-cast UDP sockets between a server and multiple clients using a rateless LT fountain code.
+    ...
+    Attributes
+    ----------
+    args : Array
+        an array of input arguments collected at runtime
+    mcast_grp : str
+        a string containing the multi-cast IP address
+    mcast_port : int
+        an integer representing the port used for multi-cast
+    packet_bytes : int
+        an integer representing the number of bytes per packet
+    block_size : int
+        an integer representing the number of source symbols per block, 0 for a single block over the whole file
+    total_packets : int
+        an integer representing the total number of source symbols in the file
+    num_blocks : int
+        an integer representing the number of blocks in the file
+    distributions : dict
+        a dictionary storing block size keys with their cumulative degree distribution
+    session : int
+        an integer identifying the transfer, chosen by the server and echoed in every packet
+
+    Methods
+    -------
+    set_blocks()
+        Sets the number of blocks from the file and block size
+    block_symbols(block)
+        Returns the number of source symbols in a block
+    distribution(k)
+        Returns the cumulative degree distribution for a block size
+    layer_address(layer)
+        Returns the multi-cast group and port of a layer or shard
+    progressBar(self, iteration, total, prefix = '', suffix = '', decimals = 1, length = 50, fill = '█', printEnd = "\r")
+        Prints a transmission progress bar to the terminal during transmission
+    """
+    def __init__(self, args):
+        """
+        Parameters
+        ----------
+        args : list
+            Arguments parsed in at runtime, used to initialise variables.
+        """
+        self.args = args
+        self.mcast_grp = args.ip
+        self.mcast_port = args.port
+        self.packet_bytes = 1400
+        self.block_size = args.block_size
+        self.total_bytes = 0
+        self.total_packets = 0
+        self.num_blocks = 0
+        self.distributions = {}
+        self.session = None
+
+    def set_blocks(self):
+        """
+        Sets the number of source symbols and blocks in the file from the file size, packet size and block size
+        """
+        self.total_packets = max(-(-self.total_bytes // self.packet_bytes), 1)
+        if self.block_size <= 0 or self.block_size > self.total_packets: # Code over the whole file
+            self.block_size = self.total_packets
+        self.num_blocks = -(-self.total_packets // self.block_size)
+        return True
+
+    def block_symbols(self, block):
+        """
+        Returns the number of source symbols in a block, fewer than the block size for the last block
+
+        Parameters
+        ----------
+        block : int
+            The block number
+        """
+        return min(self.block_size, self.total_packets - block * self.block_size)
+
+    def distribution(self, k):
+        """
+        Returns the cumulative degree distribution for a block of k source symbols, computed once per block size
+
+        Parameters
+        ----------
+        k : int
+            The number of source symbols in the block
+        """
+        if k not in self.distributions:
+            self.distributions[k] = robust_soliton(k)
+        return self.distributions[k]
+
+    def layer_address(self, layer):
+        """
+        Returns the multi-cast group and port of a layer of a carousel, or of a shard of a sharded server sent with
+        --shard-groups. Layer 0 is the multi-cast group and port given, and each layer above it takes the next group
+        address and port.
+
+        Parameters
+        ----------
+        layer : int
+            The layer number
+        """
+        group = struct.unpack('!I', socket.inet_aton(self.mcast_grp))[0] + layer
+        return socket.inet_ntoa(struct.pack('!I', group)), self.mcast_port + layer
+
+    def progressBar (self, iteration, total, prefix = '', suffix = '', decimals = 1, length = 50, fill = '█', printEnd = "\r"):
+        """
+        Call in a loop to create terminal progress bar.
+
+        Parameters
+        ----------
+            iteration : current iteration (Int)
+            total : total iterations (Int)
+            prefix : prefix string (Str), optional
+            decimals : positive number of decimals in percent complete (Int), optional
+            length : character length of bar (Int), optional
+            fill : bar fill character (Str), optional
+            printEnd : end character (e.g. "\r", "\r\n") (Str), optional
+        """
+
+        percent = ("{0:." + str(decimals) + "f}").format(100 * (iteration / float(total)))
+        filledLength = int(length * iteration // total)
+        bar = fill * filledLength + '-' * (length - filledLength)
+        print(f'\r{prefix} |{bar}| {percent}% {suffix}', end = printEnd)
+        # Print New Line on Complete
+        if iteration == total:
+            print()
+
+
+class RttEstimator:
+    """
+    A smoothed estimate of the time taken to hear back from the other end of the transfer, kept as in TCP (RFC 6298), from
+    which feedback deadlines and control packet re-transmissions are timed.
+    ...
+    Attributes
+    ----------
+    srtt : float
+        a float storing the smoothed round trip time in seconds, None until the first sample
+    rttvar : float
+        a float storing the smoothed round trip time variation in seconds
+
+    Methods
+    -------
+    update(sample)
+        Adds a round trip time sample to the estimate
+    timeout()
+        Returns the time to wait for a reply before re-sending
+    """
+    def __init__(self):
+        self.srtt = None
+        self.rttvar = None
+
+    def update(self, sample):
+        """
+        Adds a round trip time sample to the estimate
+
+        Parameters
+        ----------
+        sample : float
+            The time between sending a packet and receiving its reply, in seconds
+        """
+        if self.srtt is None:
+            self.srtt = sample
+            self.rttvar = sample / 2
+        else:
+            self.rttvar = (1 - RTT_BETA) * self.rttvar + RTT_BETA * abs(self.srtt - sample)
+            self.srtt = (1 - RTT_ALPHA) * self.srtt + RTT_ALPHA * sample
+
+    def timeout(self):
+        """
+        Returns the time to wait for a reply before re-sending, SRTT + 4 * RTTVAR bounded by MIN_RTO and MAX_RTO, or
+        INITIAL_RTO before the first sample
+        """
+        if self.srtt is None:
+            return INITIAL_RTO
+        return min(max(self.srtt + 4 * self.rttvar, MIN_RTO), MAX_RTO)
+
+
+def pread(f, size, offset):
+    """
+    Reads bytes of the target at an offset without moving its read position
+
+    Parameters
+    ----------
+    f : file or TreeReader
+        The open target file, or the directory tree being sent
+    size : int
+        The number of bytes to read
+    offset : int
+        The offset to read from
+
+    Returns
+    -------
+    The bytes read, fewer than size at the end of the target
+    """
+    if isinstance(f, TreeReader):
+        return f.pread(size, offset)
+    return os.pread(f.fileno(), size, offset)
+
+
+class FileWriter:
+    """
+    Writes completed blocks to the output file in order on a background thread, so received data reaches disk during
+    the transfer and the client does not hold the whole file in memory.
+    ...
+    Attributes
+    ----------
+    fd : int
+        the file descriptor of the output file
+    total_bytes : int
+        an integer representing the size of the file being received, beyond which padding is not written
+    fsync : str
+        a string setting when data is synced to disk: "none", "block" or "end"
+    queue : queue.Queue
+        a queue of (block, buffers) pairs waiting to be written
+    pending : dict
+        a dictionary storing block number keys with buffers that arrived before an earlier block
+    next_block : int
+        an integer storing the block number to be written next
+    written : int
+        an integer storing the number of bytes written so far
+    error : Exception
+        the exception raised on the writer thread, re-raised when the file is closed
+
+    Methods
+    -------
+    write(block, buffers)
+        Queues the buffers of a completed block for writing
+    run()
+        Writes queued blocks in order, coalescing those already waiting into one writev call
+    open_output(path)
+        Opens the output file
+    sync()
+        Syncs the data written so far to disk
+    write_buffers(buffers)
+        Writes a list of buffers at the end of the output file
+    close()
+        Waits for all queued blocks to be written and closes the output file
+    """
+    def __init__(self, path, total_bytes, fsync="none"):
+        self.fd = self.open_output(path)
+        self.total_bytes = total_bytes
+        self.fsync = fsync
+        self.queue = queue.Queue()
+        self.pending = {}
+        self.next_block = 0
+        self.written = 0
+        self.error = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def write(self, block, buffers):
+        """
+        Queues the buffers of a completed block for writing, returning straight away
+
+        Parameters
+        ----------
+        block : int
+            The block number
+        buffers : list
+            The bytes-like packets or decoded block of the block, in order
+        """
+        self.queue.put((block, buffers))
+
+    def run(self):
+        """
+        Runs on a background thread, writing blocks in block order. Blocks already waiting when the thread
+        wakes are gathered and written together, so a burst of completed blocks costs one system call.
+        """
+        done = False
+        while not done:
+            items = [self.queue.get()]
+            while not self.queue.empty():
+                items.append(self.queue.get())
+            buffers = []
+            for item in items:
+                if item is None: # Sentinel from close()
+                    done = True
+                    continue
+                self.pending[item[0]] = item[1]
+            while self.next_block in self.pending:
+                buffers.extend(self.pending.pop(self.next_block))
+                self.next_block += 1
+            if self.error is None and buffers:
+                try:
+                    self.write_buffers(buffers)
+                    if self.fsync == "block":
+                        self.sync()
+                except Exception as e: # Includes a malformed tree manifest, reported when the file is closed
+                    self.error = e
+
+    def open_output(self, path):
+        """
+        Opens the output file, truncating any existing file, or stdout for "-"
+
+        Parameters
+        ----------
+        path : str
+            The path of the output file
+
+        Returns
+        -------
+        The file descriptor of the output file
+        """
+        if path == "-":
+            return os.dup(1) # Still the real stdout once the client prints to stderr
+        return os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0), 0o644)
+
+    def sync(self):
+        """
+        Syncs the data written so far to disk
+        """
+        os.fsync(self.fd)
+
+    def write_buffers(self, buffers):
+        """
+        Writes a list of buffers at the end of the output file with as few system calls as possible, dropping any padding past
+        the size of the file
+
+        Parameters
+        ----------
+        buffers : list
+            The bytes-like buffers to write, in order
+        """
+        views = []
+        offset = self.written
+        for buf in buffers:
+            view = memoryview(buf)[:max(self.total_bytes - offset, 0)]
+            if len(view):
+                views.append(view)
+                offset += len(view)
+        while views:
+            if hasattr(os, 'writev'): # Not available on every platform
+                batch = views[:IOV_MAX]
+                n = os.writev(self.fd, batch)
+            else:
+                batch = views[:1]
+                n = os.write(self.fd, batch[0])
+            self.written += n
+            for view in batch: # Drop what was written, keeping the rest of a partially written buffer
+                if n >= len(view):
+                    n -= len(view)
+                    views.pop(0)
+                else:
+                    views[0] = view[n:]
+                    break
+
+    def close(self):
+        """
+        Waits for all queued blocks to be written, syncs them to disk if set, and closes the output file. As padding is
+        never written, the file ends at exactly total_bytes.
+        """
+        self.queue.put(None)
+        self.thread.join()
+        try:
+            if self.error is not None:
+                raise self.error
+            if self.fsync != "none":
+                os.fsync(self.fd)
+        finally:
+            os.close(self.fd)
+        return True
+
+
+class TreeReader:
+    """
+    Presents a directory tree to the send path as a single file: a manifest of the tree followed by the contents of its files
+    packed back to back, so small files share blocks rather than each needing a transfer of its own.
+    ...
+    Attributes
+    ----------
+    root : str
+        the path of the directory being sent
+    segments : list
+        a list of the segments of the stream in order: the manifest as bytes, then the path of each file
+    sizes : list
+        a list of the number of bytes of each segment, as listed in the manifest
+    starts : list
+        a list of the offset of each segment in the stream
+    total_bytes : int
+        an integer representing the size of the stream, manifest included
+    files : int
+        an integer representing the number of files in the tree
+    position : int
+        an integer storing the offset of the stream read next by readinto()
+    fds : OrderedDict
+        an ordered dictionary storing the paths of recently read files with their file descriptors, at most TREE_FDS
+    lock : threading.Lock
+        a lock guarding the file descriptors
+
+    Methods
+    -------
+    pread(size, offset)
+        Reads bytes of the stream at an offset
+    read_file(path, size, offset)
+        Reads bytes of a file of the tree, keeping it open for the next read
+    seek(offset)
+        Sets the offset of the stream read next
+    readinto(buf)
+        Reads into a buffer from the current offset
+    close()
+        Closes the open files
+    """
+    def __init__(self, root):
+        self.root = root
+        dirs = []
+        entries = []
+        paths = []
+        for path, subdirs, names in os.walk(root):
+            subdirs.sort() # Walked in a fixed order, so the stream only changes with the tree
+            rel = os.path.relpath(path, root).replace(os.sep, '/')
+            if not subdirs and not names and rel != '.':
+                dirs.append(rel) # Files create their own directories, so only empty ones are listed
+            for name in sorted(names):
+                full = os.path.join(path, name)
+                if not os.path.isfile(full):
+                    continue
+                stats = os.stat(full)
+                entries.append([os.path.relpath(full, root).replace(os.sep, '/'), stats.st_size, stats.st_mode & 0o777])
+                paths.append(full)
+        manifest = json.dumps({"dirs": dirs, "files": entries}).encode()
+        head = MANIFEST.pack(len(manifest)) + manifest
+        self.segments = [head] + paths
+        self.sizes = [len(head)] + [entry[1] for entry in entries]
+        self.starts = []
+        offset = 0
+        for size in self.sizes:
+            self.starts.append(offset)
+            offset += size
+        self.total_bytes = offset
+        self.files = len(entries)
+        self.position = 0
+        self.fds = OrderedDict()
+        self.lock = threading.Lock()
+
+    def pread(self, size, offset):
+        """
+        Reads bytes of the stream at an offset. A file that has shrunk since the manifest was made reads as zeros, so the
+        offsets of the files after it do not move.
+
+        Parameters
+        ----------
+        size : int
+            The number of bytes to read
+        offset : int
+            The offset in the stream to read from
+
+        Returns
+        -------
+        The bytes read, fewer than size at the end of the stream
+        """
+        data = bytearray()
+        i = bisect.bisect_right(self.starts, offset) - 1
+        while size > 0 and i < len(self.segments):
+            skip = offset - self.starts[i]
+            n = min(size, self.sizes[i] - skip)
+            if n > 0:
+                segment = self.segments[i]
+                if isinstance(segment, bytes):
+                    data += segment[skip:skip + n]
+                else:
+                    data += self.read_file(segment, n, skip).ljust(n, b'\0')
+                offset += n
+                size -= n
+            i += 1
+        return bytes(data)
+
+    def read_file(self, path, size, offset):
+        """
+        Reads bytes of a file of the tree, keeping the most recently read files open
+
+        Parameters
+        ----------
+        path : str
+            The path of the file
+        size : int
+            The number of bytes to read
+        offset : int
+            The offset in the file to read from
+        """
+        with self.lock: # Held while reading, as another thread may close the descriptor
+            if path in self.fds:
+                self.fds.move_to_end(path)
+            else:
+                self.fds[path] = os.open(path, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+                if len(self.fds) > TREE_FDS:
+                    os.close(self.fds.popitem(last=False)[1])
+            return os.pread(self.fds[path], size, offset)
+
+    def seek(self, offset):
+        """
+        Sets the offset of the stream read next by readinto()
+
+        Parameters
+        ----------
+        offset : int
+            The offset in the stream
+        """
+        self.position = offset
+
+    def readinto(self, buf):
+        """
+        Reads into a buffer from the current offset of the stream, moving the offset on
+
+        Parameters
+        ----------
+        buf : bytearray
+            The buffer to fill
+
+        Returns
+        -------
+        The number of bytes read, fewer than the buffer at the end of the stream
+        """
+        data = self.pread(len(buf), self.position)
+        buf[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+    def close(self):
+        """
+        Closes the files held open
+        """
+        with self.lock:
+            for fd in self.fds.values():
+                os.close(fd)
+            self.fds.clear()
+
+
+class TreeWriter(FileWriter):
+    """
+    Writes a directory tree transfer under the output directory. The stream of completed blocks is split back into the
+    manifest and the files it lists, and each file is created as its byte range arrives and closed once it is complete.
+    ...
+    Attributes
+    ----------
+    root : str
+        the path of the output directory
+    head : bytearray
+        the start of the stream, held until the whole manifest has arrived
+    files : list
+        a list of [path, size, mode] entries from the manifest, in stream order, None until the manifest has arrived
+    index : int
+        an integer storing the position in files of the next file to create
+    fd : int
+        the file descriptor of the file being written, None between files
+    left : int
+        an integer storing the number of bytes of the file being written still to arrive
+    completed : int
+        an integer storing the number of files written
+
+    Methods
+    -------
+    open_output(path)
+        Creates the output directory
+    sync()
+        Syncs the file being written to disk
+    write_buffers(buffers)
+        Splits buffers of the stream between the manifest and the files of the tree
+    read_manifest(view)
+        Takes bytes of the manifest, creating the directories it lists once it is complete
+    check_manifest(manifest)
+        Checks the fields of a received manifest
+    next_file()
+        Creates the next file of the manifest that has data, creating empty files on the way
+    local(path)
+        Returns the path of a manifest entry under the output directory
+    close()
+        Waits for all queued blocks to be written and closes the file being written
+    """
+    def __init__(self, path, total_bytes, fsync="none"):
+        self.root = path
+        self.head = bytearray()
+        self.files = None
+        self.index = 0
+        self.left = 0
+        self.completed = 0
+        FileWriter.__init__(self, path, total_bytes, fsync)
+
+    def open_output(self, path):
+        """
+        Creates the output directory. Files are opened as the stream reaches them.
+
+        Parameters
+        ----------
+        path : str
+            The path of the output directory
+        """
+        os.makedirs(path, exist_ok=True)
+        return None
+
+    def sync(self):
+        """
+        Syncs the file being written to disk. Completed files are synced as they are closed.
+        """
+        if self.fd is not None:
+            os.fsync(self.fd)
+
+    def write_buffers(self, buffers):
+        """
+        Splits a list of buffers of the stream between the manifest and the files of the tree, dropping any padding past the
+        end of the stream
+
+        Parameters
+        ----------
+        buffers : list
+            The bytes-like buffers to write, in order
+        """
+        for buf in buffers:
+            view = memoryview(buf)[:max(self.total_bytes - self.written, 0)]
+            while len(view):
+                if self.files is None:
+                    n = self.read_manifest(view)
+                elif self.fd is None: # Nothing left to write
+                    n = len(view)
+                else:
+                    n = os.write(self.fd, view[:self.left])
+                    self.left -= n
+                    if not self.left: # File complete
+                        if self.fsync != "none":
+                            os.fsync(self.fd)
+                        os.close(self.fd)
+                        self.fd = None
+                        self.completed += 1
+                        self.next_file()
+                view = view[n:]
+                self.written += n
+
+    def read_manifest(self, view):
+        """
+        Takes bytes of the manifest from the start of the stream. Once it is complete, the directories it lists are created
+        and the first file is opened.
+
+        Parameters
+        ----------
+        view : memoryview
+            The stream from the current offset
+
+        Returns
+        -------
+        The number of bytes taken
+        """
+        need = MANIFEST.size
+        if len(self.head) >= MANIFEST.size:
+            need += MANIFEST.unpack_from(self.head)[0]
+        n = min(len(view), need - len(self.head))
+        self.head += view[:n]
+        if len(self.head) == need and need > MANIFEST.size:
+            manifest = self.check_manifest(json.loads(bytes(self.head[MANIFEST.size:])))
+            for path in manifest["dirs"]:
+                os.makedirs(self.local(path), exist_ok=True)
+            self.files = manifest["files"]
+            self.next_file()
+        return n
+
+    def check_manifest(self, manifest):
+        """
+        Checks the fields of a received manifest: a list of directory paths, and a list of files each given as a path, a
+        size and a mode. A malformed manifest raises ValueError, which the writer reports when the file is closed.
+
+        Parameters
+        ----------
+        manifest : dict
+            The decoded manifest
+
+        Returns
+        -------
+        The manifest, once checked
+        """
+        if not isinstance(manifest, dict) or not isinstance(manifest.get("dirs"), list) or not isinstance(manifest.get("files"), list):
+            raise ValueError("Malformed tree manifest: no list of directories and files")
+        for path in manifest["dirs"]:
+            if not isinstance(path, str):
+                raise ValueError(f"Malformed tree manifest directory: {path!r}")
+        for entry in manifest["files"]:
+            if not isinstance(entry, list) or len(entry) != 3 or not isinstance(entry[0], str) \
+                    or not all(type(field) is int and field >= 0 for field in entry[1:]):
+                raise ValueError(f"Malformed tree manifest file: {entry!r}")
+        return manifest
+
+    def next_file(self):
+        """
+        Creates the next file of the manifest that has data and opens it for writing, creating any empty files before it
+        """
+        while self.index < len(self.files):
+            path, size, mode = self.files[self.index]
+            self.index += 1
+            local = self.local(path)
+            os.makedirs(os.path.dirname(local), exist_ok=True)
+            fd = os.open(local, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0), mode & 0o777 or 0o644)
+            if size:
+                self.fd, self.left = fd, size
+                return
+            os.close(fd)
+            self.completed += 1
+
+    def local(self, path):
+        """
+        Returns the path of a manifest entry under the output directory, refusing entries that would leave it
+
+        Parameters
+        ----------
+        path : str
+            The path of the entry relative to the root of the tree, with / separators
+        """
+        local = os.path.normpath(os.path.join(self.root, *path.split('/')))
+        if path.startswith('/') or os.path.relpath(local, self.root).split(os.sep)[0] == os.pardir:
+            raise ValueError(f"{path} is outside the output directory")
+        return local
+
+    def close(self):
+        """
+        Waits for all queued blocks to be written and closes the file being written. Each file is synced to disk as it is
+        completed if syncing is set.
+        """
+        self.queue.put(None)
+        self.thread.join()
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+        if self.error is not None:
+            raise self.error
+        return True
+
+
+class Server(ltUDP):
+    """
+    A class to enable a server to reliably transmit data via multi-cast UDP socket to clients with a rateless LT fountain code.
+    Every encoded symbol is the XOR of a random set of source symbols of its block, chosen from a seed carried in the header.
+    ...
+    Attributes
+    ----------
+    clients : dict
+        a dictionary storing client hostname keys with state values
+    address : tuple
+        a tuple containing the IP address and port information for the multi-cast group
+    addresses : dict
+        a dictionary storing client hostname keys with the address their feedback was received from
+    reports : dict
+        a dictionary storing client hostname keys with the capabilities each client joined with
+    total_bytes : int
+        an integer representing the total number of bytes of data in the target file
+    mtu : int
+        an integer representing the path MTU the packet size is derived from
+    blocks : OrderedDict
+        an ordered dictionary storing block number keys with the source symbols of recently used blocks, least recently used first
+    tx : int
+        an integer storing the total number of encoded symbols transmitted
+    round : int
+        an integer storing the number of the current feedback round, echoed in client feedback
+    rtts : dict
+        a dictionary storing client hostname keys with the RttEstimator of their feedback
+    backoff : int
+        an integer multiplying the feedback timeout, doubled each time the control packet is re-sent without feedback
+    control_time : float
+        a float storing when the current control packet was sent, None once it has been re-sent
+    sampled : set
+        a set of the hostnames whose feedback to the current control packet has been timed
+    control_resends : int
+        an integer storing the number of control packets re-sent after a feedback timeout
+    waited : float
+        a float storing the time spent waiting for feedback in the current round, in seconds
+    round_waits : list
+        a list of the time spent waiting for feedback in each round, in seconds
+    tree : TreeReader
+        the directory tree being sent, None when sending a single file
+    cycle : int
+        an integer storing the number of the carousel cycle being sent
+    send_time : float
+        a float storing when the next data packet of the carousel is due
+    layers : int
+        an integer representing the number of multi-cast layers a carousel is sent on, or of groups the shards send on
+    shards : int
+        an integer representing the number of worker processes the blocks of the file are sent from
+    workers : list
+        a list of the worker processes of the shards
+    tasks : list
+        a list of the queues of encoded symbols to send per block, one per shard
+    results : multiprocessing.Queue
+        a queue of the shard and number of encoded symbols sent for each task a worker finishes
+
+    Methods
+    -------
+    discover_mtu()
+        Returns the MTU of the interface used to reach the multi-cast group
+    connection()
+        Creates UDP network socket
+    open_file()
+        Opens target file for reading
+    get_block(block)
+        Returns the source symbols of a block
+    encode(block)
+        Returns the seed and payload of a new encoded symbol of a block
+    create_packet(packet_type, block=0, flags=0)
+        Creates a packet with header and data
+    pace()
+        Waits until the next data packet of the carousel is due
+    layer_share(layer)
+        Returns the number of encoded symbols a layer carries for each symbol of the base layer
+    missing_symbols(payload)
+        Decodes the missing source symbols per block reported by a client
+    plan_repairs(needs)
+        Returns the number of encoded symbols to send per block in a repair round
+    start_shards()
+        Starts a worker process per shard
+    send_shards(counts, flags=0)
+        Sends encoded symbols of blocks from the worker processes of their shards
+    stop_shards()
+        Stops the worker processes
+    create_join_ack(hostname)
+        Creates a join acknowledgement for a client
+    join(hostname, payload, rtt)
+        Adds a client and acknowledges its join
+    update_rtt(hostname, sample)
+        Adds a round trip time sample for a client
+    timeout()
+        Returns how long to wait for client feedback
+    transmit_control(resend=False)
+        Multi-casts the end of round control packet and times the feedback it prompts
+    end_round()
+        Records the time spent waiting for feedback in a round
+    transmit(packet, address=None)
+        Transmits packet via socket
+    receive(timeout=None)
+        Receives packets via socket
+    """
+    def __init__(self, args):
+        ltUDP.__init__(self, args)
+        self.clients = {}
+        self.address = (self.mcast_grp, self.mcast_port)
+        self.addresses = {}
+        self.reports = {}
+        # A directory is sent as one stream of its manifest and files, and a single file as it is
+        self.tree = TreeReader(self.args.file_path) if os.path.isdir(self.args.file_path) else None
+        self.total_bytes = self.tree.total_bytes if self.tree else os.stat(self.args.file_path).st_size
+        self.mtu = min(self.args.mtu or self.discover_mtu(), MAX_DATAGRAM + IP_UDP_HEADERS)
+        # Payload fills the MTU after the IP, UDP and protocol headers, unless a packet size is given
+        self.packet_bytes = self.args.packet_size or self.mtu - IP_UDP_HEADERS - SERVER_HEADER.size
+        self.set_blocks()
+        self.blocks = OrderedDict()
+        self.tx = 0
+        self.round = 0
+        self.rtts = {}
+        self.backoff = 1
+        self.control_time = None
+        self.sampled = set()
+        self.control_resends = 0
+        self.waited = 0
+        self.round_waits = []
+        self.cycle = 0
+        self.send_time = 0
+        self.layers = max(self.args.layers, 1)
+        if self.layers > 1 and not self.args.carousel:
+            print("Multi-cast layers (--layers) are only sent by a carousel (--carousel).")
+            sys.exit(1)
+        self.shards = max(self.args.shards, 1)
+        if self.shards > 1 and self.args.carousel:
+            print("A carousel (--carousel) is sent from a single process, without --shards.")
+            sys.exit(1)
+        if self.args.shard_groups: # Each shard sends on its own group and port, which clients join as they would layers
+            self.layers = self.shards
+        self.workers = []
+        self.tasks = []
+        self.results = None
+        self.session = random.getrandbits(16)
+
+    def discover_mtu(self):
+        """
+        Discovers the MTU of the interface the multi-cast group is routed through, which includes jumbo frames on LANs that use them.
+        Falls back to DEFAULT_MTU where the platform does not support the query.
+
+        Returns
+        -------
+        The MTU in bytes
+        """
+        probe = socket.socket(family=socket.AF_INET, type=socket.SOCK_DGRAM)
+        try:
+            probe.connect((self.mcast_grp, self.mcast_port)) # Connecting a UDP socket only selects the route
+            return probe.getsockopt(socket.IPPROTO_IP, IP_MTU)
+        except OSError:
+            return DEFAULT_MTU
+        finally:
+            probe.close()
+
+    def connection(self):
+        """
+        Initialises a multi-cast UDP socket with the multi-cast IP and port provided
+        """
+        self.sock = socket.socket(
+            family=socket.AF_INET, type=socket.SOCK_DGRAM, proto=socket.IPPROTO_UDP)
+        self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 2)
+        self.sock.setblocking(0)
+        return True
+
+    def open_file(self):
+        """
+        Opens the target file to be read as bytes
+        """
+        if self.tree is not None: # Directory tree, read through its manifest
+            self.f = self.tree
+        elif not os.path.isfile(self.args.file_path):
+            print(f"{self.args.file_path} is not a valid file.")
+            sys.exit(1)
+        else:
+            self.f = open(os.path.expanduser(self.args.file_path), 'rb')
+            enc_file = os.path.expanduser(self.args.file_path).encode()
+            hash_obj = hashlib.sha1(enc_file)
+            self.hex_val = hash_obj.hexdigest()
+            return True
+
+    def get_block(self, block):
+        """
+        Returns the source symbols of a block as integers, so encoding is a chain of integer XORs. Recently used blocks are
+        kept, up to --block-cache blocks, as repair rounds return to blocks sent earlier.
+
+        Parameters
+        ----------
+        block : int
+            The block number
+
+        Returns
+        -------
+        A list of source symbols
+        """
+        if block in self.blocks:
+            self.blocks.move_to_end(block)
+            return self.blocks[block]
+        data = pread(self.f, self.block_size * self.packet_bytes, block * self.block_size * self.packet_bytes)
+        symbols = [int.from_bytes(data[i:i + self.packet_bytes], 'little') for i in range(0, self.block_symbols(block) * self.packet_bytes, self.packet_bytes)]
+        self.blocks[block] = symbols
+        while len(self.blocks) > max(self.args.block_cache, 1):
+            self.blocks.popitem(last=False)
+        return symbols
+
+    def encode(self, block):
+        """
+        Returns a new encoded symbol of a block, the XOR of the source symbols its seed selects
+
+        Parameters
+        ----------
+        block : int
+            The block number
+
+        Returns
+        -------
+        seed : int
+            The seed the source symbols of the encoded symbol were chosen from
+        symbol : bytes
+            The encoded symbol
+        """
+        symbols = self.get_block(block)
+        seed = random.getrandbits(32)
+        value = 0
+        for i in neighbours(seed, len(symbols), self.distribution(len(symbols))):
+            value ^= symbols[i]
+        return seed, value.to_bytes(self.packet_bytes, 'little')
+
+    def create_packet(self, packet_type, block=0, flags=0):
+        """
+        Creates a packet header containing:
+            version
+            packet_type
+            flags
+            session
+            block, or the round number for control packets
+            seed
+
+        Engineering packets carry the transfer parameters (total_bytes, packet_bytes, block_size, tree, layers) as their payload, and
+        in a carousel the block about to be sent and the cycle in the seed field.
+        Data packets carry an encoded symbol as their payload.
+
+        Parameters
+        ----------
+        packet_type : int
+            An integer to represent the packet type:
+                1: Engineering
+                2: Data
+                3: End of round
+                6: File transfer complete
+
+        block : int, default=0
+            The block number of a data packet, or of a carousel engineering packet
+
+        flags : int, default=0
+            Bit flags for the packet, such as FLAG_REPAIR
+
+        Returns
+        -------
+        A packet containing header and payload
+        """
+        if packet_type == 2:
+            seed, payload = self.encode(block)
+        elif flags & FLAG_CAROUSEL:
+            seed, payload = self.cycle, b''
+        else:
+            seed, payload = 0, b''
+            block = self.round
+        if packet_type == 1:
+            payload = ENGINEERING.pack(self.total_bytes, self.packet_bytes, self.block_size, 1 if self.tree else 0, self.layers)
+        return SERVER_HEADER.pack(VERSION, packet_type, flags, self.session, block, seed) + payload
+
+    def pace(self):
+        """
+        Waits until the next data packet of the carousel is due, spacing packets by their size at the multi-cast rate
+        (--mcast-rate) so the carousel sends at a fixed rate. Each layer above the base layer doubles the rate, so packets
+        are spaced at the rate of all layers together. A server that falls behind does not burst to catch up.
+        """
+        now = time.time()
+        if self.send_time > now:
+            time.sleep(self.send_time - now)
+        rate = self.args.mcast_rate * 2 ** (self.layers - 1)
+        self.send_time = max(self.send_time, now) + (self.packet_bytes + SERVER_HEADER.size + IP_UDP_HEADERS) * 8 / (rate * 1e6)
+        return True
+
+    def layer_share(self, layer):
+        """
+        Returns the number of encoded symbols a layer carries for each symbol of the base layer. Layer i above the base
+        layer carries 2^(i-1), so a client on layers 0 to i receives at 2^i times the base rate.
+
+        Parameters
+        ----------
+        layer : int
+            The layer number
+        """
+        return 1 if layer == 0 else 2 ** (layer - 1)
+
+    def missing_symbols(self, payload):
+        """
+        Decodes the missing source symbols per block reported by a client. A truncated trailing pair is ignored, as are
+        blocks past the end of the file, and no block is reported missing more source symbols than it holds.
+
+        Parameters
+        ----------
+        payload : bytes
+            The payload of a missing feedback packet, one MISSING pair per block
+
+        Returns
+        -------
+        A dictionary storing block keys with the number of missing source symbols
+        """
+        payload = payload[:len(payload) - len(payload) % MISSING.size]
+        return {block: min(missing, self.block_symbols(block)) for block, missing in MISSING.iter_unpack(payload) if block < self.num_blocks}
+
+    def plan_repairs(self, needs):
+        """
+        Returns the number of encoded symbols to send per block in a repair round. Every encoded symbol is new, so one
+        multi-cast symbol can complete any client missing the block, and each block is sent enough for the client that is
+        furthest from decoding it, with --overhead extra for symbols that do not release a source symbol straight away.
+
+        Parameters
+        ----------
+        needs : dict
+            A dictionary storing client hostname keys with dictionaries of block keys and missing source symbol values
+
+        Returns
+        -------
+        A dictionary storing block keys with the number of encoded symbols to send
+        """
+        counts = {}
+        for report in needs.values():
+            for block, missing in report.items():
+                counts[block] = max(counts.get(block, 0), math.ceil(missing * (1 + self.args.overhead)) + 1)
+        return counts
+
+    def start_shards(self):
+        """
+        Starts a worker process per shard (--shards), each with its own socket, file handle and block cache. Blocks are
+        striped across the shards, block b being sent by shard b % shards, so the shards move through the file together and
+        clients write blocks in order without holding more than a few blocks back. The server process stays the
+        coordinator, handling joins and feedback and sending control packets.
+        """
+        if self.shards <= 1:
+            return False
+        self.results = multiprocessing.Queue()
+        for shard in range(self.shards):
+            tasks = multiprocessing.Queue()
+            worker = multiprocessing.Process(target=run_shard, args=(self.args, self.session, self.packet_bytes, shard, tasks, self.results), daemon=True)
+            worker.start()
+            self.tasks.append(tasks)
+            self.workers.append(worker)
+        return True
+
+    def send_shards(self, counts, flags=0):
+        """
+        Sends encoded symbols of blocks from the worker processes of their shards, which encode and send in parallel, and
+        waits until every shard has sent its share so a control packet sent next follows all of them
+
+        Parameters
+        ----------
+        counts : dict
+            A dictionary storing block keys with the number of encoded symbols to send
+        flags : int, default=0
+            Bit flags for the data packets, such as FLAG_REPAIR
+        """
+        shares = [{} for _ in range(self.shards)]
+        for block, count in counts.items():
+            shares[block % self.shards][block] = count
+        pending = set()
+        for shard, share in enumerate(shares):
+            if share:
+                self.tasks[shard].put((share, flags))
+                pending.add(shard)
+        while pending:
+            try:
+                shard, sent = self.results.get(timeout=1)
+            except queue.Empty:
+                if not all(worker.is_alive() for worker in self.workers):
+                    print("A shard worker stopped.")
+                    sys.exit(1)
+                continue
+            pending.discard(shard)
+            self.tx += sent
+        return True
+
+    def stop_shards(self):
+        """
+        Stops the worker processes once the transfer is complete
+        """
+        for tasks in self.tasks:
+            tasks.put(None)
+        for worker in self.workers:
+            worker.join()
+        return True
+
+    def create_join_ack(self, hostname):
+        """
+        Creates a join acknowledgement for a client, with the client ID in the seed field of the header
+
+        Parameters
+        ----------
+        hostname : int
+            The ID of the joining client
+
+        Returns
+        -------
+        A packet containing the header only
+        """
+        return SERVER_HEADER.pack(VERSION, 8, 0, self.session, 0, hostname)
+
+    def join(self, hostname, payload, rtt):
+        """
+        Adds a client to the 'client state matrix' with the capabilities it joined with, and acknowledges the join. The
+        acknowledgement is multi-cast, as clients on one host share an address and port, and carries the client ID.
+
+        Parameters
+        ----------
+        hostname : int
+            The ID of the joining client
+        payload : bytes
+            The capabilities of the client, packed as CAPABILITIES
+        rtt : float
+            The time from announcing the session to the join, in seconds
+        """
+        if len(payload) < CAPABILITIES.size: # Malformed join, dropped
+            return False
+        self.clients[hostname] = 1 # Adding client to state matrix by ID and default state of 1
+        self.reports[hostname] = {"loss": CAPABILITIES.unpack_from(payload)[0]}
+        self.update_rtt(hostname, rtt) # Join round trip time
+        self.transmit(self.create_join_ack(hostname))
+        return True
+
+    def update_rtt(self, hostname, sample):
+        """
+        Adds a round trip time sample to the estimate for a client
+
+        Parameters
+        ----------
+        hostname : int
+            The hostname of the client
+        sample : float
+            The time from sending a packet to the client's reply, in seconds
+        """
+        self.rtts.setdefault(hostname, RttEstimator()).update(sample)
+
+    def timeout(self):
+        """
+        Returns how long to wait for client feedback: the longest retransmission timeout of the clients, so the slowest client
+        is not taken for a lost packet, multiplied by the current back-off and bounded by MAX_RTO
+        """
+        rto = max((self.rtts[h].timeout() for h in self.clients if h in self.rtts), default=INITIAL_RTO)
+        return min(rto * self.backoff, MAX_RTO)
+
+    def transmit_control(self, resend=False):
+        """
+        Multi-casts the end of round control packet and times the feedback it prompts. A new round is started unless the
+        packet is re-sent, which doubles the back-off, and feedback after it is not sampled as it may answer either copy
+        (Karn's algorithm).
+
+        Parameters
+        ----------
+        resend : bool, default=False
+            Whether the control packet is re-sent because feedback did not arrive in time
+        """
+        if resend:
+            self.control_resends += 1
+            self.control_time = None
+            if self.timeout() < MAX_RTO:
+                self.backoff *= 2
+        else:
+            self.round += 1
+            self.control_time = time.time()
+            self.sampled.clear()
+        self.transmit(self.create_packet(3))
+        return True
+
+    def end_round(self):
+        """
+        Records the time spent waiting for feedback in the round that has just ended
+        """
+        self.round_waits.append(self.waited)
+        self.waited = 0
+
+    def transmit(self, packet, address=None):
+        """
+        Transmits a packet via the multi-cast socket
+
+        Parameters
+        ----------
+        packet : bytes
+            Bytes representing a single packet from the create_packet method
+        address : tuple, optional
+            The address of a single client to uni-cast to. Defaults to the multi-cast group
+        """
+        while True:
+            ready = select.select([], [self.sock], [], 1)
+            if ready[1]:
+                self.sock.sendto(packet, address or self.address)
+                break
+        return True
+
+    def receive(self, timeout=None):
+        """
+        Receives and processes packets from clients
+
+        Returns
+        -------
+        packet_type : int
+            The type of packet received:
+                1: Join
+                3: Missing source symbols
+                4: File complete
+
+        symbol : bytes
+            The payload of the received packet
+
+        hostname : int
+            The hostname of the source client, for updating the client dictionary
+
+        Feedback from another session, or for an earlier round, is dropped. The first feedback from each client to a control
+        packet is timed for its round trip time estimate.
+
+        Parameters
+        ----------
+        timeout : float, optional
+            The time to wait for a packet in seconds. Defaults to the adaptive feedback timeout
+        """
+        start = time.time()
+        end = start + (self.timeout() if timeout is None else timeout)
+        while True:
+            ready = select.select([self.sock], [], [], max(end - time.time(), 0))
+            if ready[0]:
+                packet, addr = self.sock.recvfrom(MAX_DATAGRAM)
+                if len(packet) < CLIENT_HEADER.size:
+                    continue
+                symbol = bytearray(packet[CLIENT_HEADER.size:])
+                version, packet_type, session, hostname, rnd = CLIENT_HEADER.unpack_from(packet)
+                if version != VERSION or session != self.session:
+                    continue
+                self.addresses[hostname] = addr
+                if packet_type in (3, 4) and rnd != self.round: # Stale feedback for an earlier round
+                    continue
+                if packet_type == 1 and hostname in self.clients: # Repeated join after a lost acknowledgement
+                    self.transmit(self.create_join_ack(hostname))
+                    continue
+                if packet_type in (3, 4) and hostname not in self.sampled:
+                    self.sampled.add(hostname)
+                    self.backoff = 1
+                    if self.control_time is not None:
+                        self.update_rtt(hostname, time.time() - self.control_time)
+                if packet_type in (1, 3, 4):
+                    break
+            else:
+                packet_type, symbol, hostname = 0, 0, 0
+                break
+        if self.round:
+            self.waited += time.time() - start
+        return packet_type, symbol, hostname
+
+
+def run_shard(args, session, packet_bytes, shard, tasks, results):
+    """
+    Runs in a worker process of a sharded server, sending encoded symbols of the blocks of one shard as the coordinator
+    asks for them, until it is stopped. The worker opens the target itself and takes the session and packet size of the
+    coordinator, so its packets belong to the same transfer.
+
+    Parameters
+    ----------
+    args : Namespace
+        The arguments the server was started with
+    session : int
+        The session of the transfer
+    packet_bytes : int
+        The packet size of the transfer
+    shard : int
+        The shard number
+    tasks : multiprocessing.Queue
+        A queue of (counts, flags) pairs of encoded symbols to send per block, None to stop
+    results : multiprocessing.Queue
+        A queue the shard and number of encoded symbols sent are put on as each task finishes
+    """
+    random.seed() # Forked workers would otherwise share the seeds of the coordinator
+    s = Server(args)
+    s.session = session
+    s.packet_bytes = packet_bytes
+    s.block_size = args.block_size
+    s.set_blocks()
+    s.connection()
+    s.open_file()
+    address = s.layer_address(shard) if args.shard_groups else s.address
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        counts, flags = task
+        sent = 0
+        for block, count in counts.items():
+            for _ in range(count):
+                s.transmit(s.create_packet(2, block, flags), address)
+                sent += 1
+        results.put((shard, sent))
+    s.sock.close()
+    s.f.close()
+
+
+class Block:
+    """
+    A class to hold the peeling decoder of a single block of encoded symbols on the client.
+    ...
+    Attributes
+    ----------
+    symbols : list
+        a list of the decoded source symbols of the block as integers, None until decoded
+    decoded : int
+        an integer storing the number of source symbols decoded
+    pending : dict
+        a dictionary storing encoded symbol id keys with [value, undecoded neighbours] values for symbols still combining
+        two or more undecoded source symbols
+    waiting : dict
+        a dictionary storing source symbol keys with the ids of pending encoded symbols that include them
+    next_id : int
+        an integer storing the id of the next pending encoded symbol
+    innovative : int
+        an integer storing the number of encoded symbols that included an undecoded source symbol when received
+    wasted : int
+        an integer storing the number of encoded symbols whose source symbols were all decoded already
+
+    Methods
+    -------
+    add(sources, value)
+        Reduces an encoded symbol by the decoded source symbols and peels it if one source symbol is left
+    release(index, value)
+        Decodes a source symbol and peels every pending encoded symbol it completes
+    complete()
+        Returns whether every source symbol of the block is decoded
+    """
+    def __init__(self, k):
+        self.symbols = [None] * k
+        self.decoded = 0
+        self.pending = {}
+        self.waiting = {}
+        self.next_id = 0
+        self.innovative = 0
+        self.wasted = 0
+
+    def add(self, sources, value):
+        """
+        Reduces an encoded symbol by the source symbols already decoded. If one source symbol is left it is decoded, otherwise
+        the symbol waits until enough of its source symbols are decoded.
+
+        Parameters
+        ----------
+        sources : list
+            The source symbols combined into the encoded symbol
+        value : int
+            The encoded symbol
+        """
+        remaining = set()
+        for i in sources:
+            if self.symbols[i] is None:
+                remaining.add(i)
+            else:
+                value ^= self.symbols[i]
+        if not remaining:
+            self.wasted += 1
+            return
+        self.innovative += 1
+        if len(remaining) == 1:
+            self.release(remaining.pop(), value)
+        else:
+            self.pending[self.next_id] = [value, remaining]
+            for i in remaining:
+                self.waiting.setdefault(i, []).append(self.next_id)
+            self.next_id += 1
+
+    def release(self, index, value):
+        """
+        Decodes a source symbol and removes it from every pending encoded symbol that includes it, decoding in turn any that
+        are left with a single source symbol (the peeling decoder). Runs in time linear in the number of edges.
+
+        Parameters
+        ----------
+        index : int
+            The position of the source symbol within the block
+        value : int
+            The source symbol
+        """
+        ripple = [(index, value)]
+        while ripple:
+            index, value = ripple.pop()
+            if self.symbols[index] is not None:
+                continue
+            self.symbols[index] = value
+            self.decoded += 1
+            for sid in self.waiting.pop(index, ()):
+                entry = self.pending.get(sid)
+                if entry is None:
+                    continue
+                entry[0] ^= value
+                entry[1].discard(index)
+                if len(entry[1]) <= 1:
+                    del self.pending[sid]
+                    if entry[1]:
+                        ripple.append((entry[1].pop(), entry[0]))
+
+    def complete(self):
+        """
+        Returns whether every source symbol of the block is decoded
+        """
+        return self.decoded == len(self.symbols)
+
+
+class Client(ltUDP):
+    """
+    A class to enable a client to reliably receive LT fountain coded data via multi-cast UDP sockets from a server.
+    There is no per-block barrier: encoded symbols of any block are decoded as they arrive, and a block is written to the
+    output file as soon as it is decoded.
+    ...
+    Attributes
+    ----------
+    blocks : dict
+        a dictionary storing block number keys with the Block decoders of blocks not yet decoded
+    completed : set
+        a set of the numbers of the blocks decoded and handed to the writer
+    rx_gen : int
+        an integer storing the block, or round for control packets, of the last packet received
+    round : int
+        an integer storing the round number of the last control packet, echoed in feedback
+    server : tuple
+        the address of the server, learnt from the engineering packet
+    hostname : int
+        an integer ID identifying the client in feedback, random unless set with --hostname
+    erased : int
+        an integer to store the number of missed packets
+    total_rx : int
+        an integer to store the total number of received packets
+    erasure : float
+        a float representing the chance of packet erasure as a percentage
+    bad : bool
+        a boolean set while the burst loss model is in its bad state
+    innovative : int
+        an integer storing the number of received packets that included an undecoded source symbol
+    wasted : int
+        an integer storing the number of received packets that carried nothing new
+    writer : FileWriter
+        the writer stage flushing decoded blocks to the output file
+    rtt : RttEstimator
+        the estimate of the time the server takes to answer feedback, from which the receive timeout is set
+    backoff : int
+        an integer multiplying the receive timeout, doubled each time nothing is received in time
+    feedback_time : float
+        a float storing when unanswered feedback was first sent to the server, None once answered
+    feedback_resent : bool
+        a boolean set when unanswered feedback is sent again, so its answer is not timed (Karn's algorithm)
+    tree : bool
+        a boolean set when the server sends a directory tree, written under the output path as a directory
+    carousel : bool
+        a boolean set when the server runs a carousel, which this client listens to without joining or sending feedback
+    cycle_start : int
+        an integer storing the position in the carousel, in blocks, of the first announcement received
+    cycle_position : int
+        an integer storing the position in the carousel, in blocks, of the latest announcement received
+    layers : int
+        an integer representing the number of multi-cast layers the carousel is sent on, or of groups a sharded server
+        sends on, which are all joined
+    socks : list
+        a list of the sockets of the layers this client has joined, lowest first, the first being the base layer socket
+    join_timers : list
+        a list of the time to wait before next trying to join each layer, in seconds, doubled each time a join fails
+    next_join : float
+        a float storing when this client next tries to join a layer
+    experiment : int
+        an integer storing the layer joined on trial, None when no join is being judged
+    baseline : float
+        a float storing the loss rate measured before the last join, against which congestion is judged
+    window_start : float
+        a float storing when the current loss measurement window started
+    window_rx : int
+        an integer storing the number of packets received in the current loss measurement window
+    window_lost : int
+        an integer storing the number of packets lost in the current loss measurement window
+    joins : int
+        an integer storing the number of layers joined
+    leaves : int
+        an integer storing the number of layers left
+    tokens : float
+        a float storing the bytes the simulated link can take before it drops packets, with --capacity
+    token_time : float
+        a float storing when the simulated link was last refilled
+
+    Methods
+    -------
+    connection()
+        Creates UDP network socket
+    erase()
+        Returns whether a received packet is simulated as lost
+    congested(size)
+        Returns whether a received packet is dropped by the simulated link capacity
+    join_layer()
+        Joins the next layer of the carousel, or group of a sharded server
+    leave_layer()
+        Leaves the top layer of the carousel
+    adapt()
+        Joins or leaves layers from the loss rate measured over the last window
+    capabilities()
+        Returns the serialised capabilities this client joins with
+    decode(block, seed, symbol)
+        Passes an encoded symbol to the decoder of its block
+    is_complete()
+        Returns whether every block is decoded
+    missing()
+        Returns the number of source symbols still missing per block
+    nack()
+        Encodes the missing source symbols per block for missing feedback
+    cycles()
+        Returns the number of carousel cycles listened to
+    create_packet(packet_type, payload=b'')
+        Creates a packet with header and data
+    open_file()
+        Opens the output file and starts the writer stage
+    save_file()
+        Waits for all received data to be written and closes the output file
+    transmit(packet, address)
+        Transmits packet via socket
+    receive(timeout=None)
+        Receives packets via socket
+    """
+    def __init__(self, args):
+        ltUDP.__init__(self, args)
+        self.blocks = {}
+        self.completed = set()
+        self.rx_gen = 0
+        self.round = 0
+        self.server = None
+        self.hostname = random.getrandbits(32) if args.hostname is None else args.hostname
+        self.erased = 0
+        self.total_rx = 0
+        self.erasure = random.uniform(args.erasurelow, args.erasurehigh)
+        self.bad = False
+        self.innovative = 0
+        self.wasted = 0
+        self.writer = None
+        self.rtt = RttEstimator()
+        self.backoff = 1
+        self.feedback_time = None
+        self.feedback_resent = False
+        self.carousel = False
+        self.cycle_start = None
+        self.cycle_position = 0
+        self.layers = 1
+        self.socks = []
+        self.join_timers = []
+        self.next_join = 0
+        self.experiment = None
+        self.baseline = 1.0
+        self.window_start = time.time()
+        self.window_rx = 0
+        self.window_lost = 0
+        self.joins = 0
+        self.leaves = 0
+        self.tokens = 0
+        self.token_time = time.time()
+        self.packet_bytes = MAX_DATAGRAM - SERVER_HEADER.size # Replaced by the advertised value on the engineering packet
+
+    def connection(self):
+        """
+        Initialises a multi-cast UDP socket with the multi-cast IP and port provided
+        """
+        self.sock = socket.socket(
+            family=socket.AF_INET, type=socket.SOCK_DGRAM, proto=socket.IPPROTO_UDP)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(('', self.mcast_port))
+        self.mreq = struct.pack('4sl', socket.inet_aton(
+            self.mcast_grp), socket.INADDR_ANY)
+        self.sock.setsockopt(
+            socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, self.mreq)
+        self.sock.setblocking(0)
+        self.socks = [self.sock]
+        return True
+
+    def erase(self):
+        """
+        Returns whether a received packet is simulated as lost. Losses are independent at the client's erasure rate, or with
+        --burst-length they follow a two-state Gilbert-Elliott model: every packet is lost in the bad state, which lasts
+        --burst-length packets on average, and the good state is left at the rate that keeps the mean loss at the erasure rate.
+        """
+        if self.args.burst_length <= 1:
+            return random.uniform(0, 100) <= self.erasure
+        loss = self.erasure / 100
+        if self.bad:
+            self.bad = random.random() >= 1 / self.args.burst_length
+        else:
+            self.bad = loss >= 1 or random.random() < loss / (self.args.burst_length * (1 - loss))
+        return self.bad
+
+    def congested(self, size):
+        """
+        Returns whether a received packet is dropped by the simulated link capacity (--capacity), a token bucket refilled at
+        the capacity that holds CAPACITY_BURST seconds of data. Packets arriving faster than the link takes them are dropped,
+        as on a link whose queue overflows.
+
+        Parameters
+        ----------
+        size : int
+            The size of the packet in bytes
+        """
+        if not self.args.capacity:
+            return False
+        now = time.time()
+        rate = self.args.capacity * 1e6 / 8
+        self.tokens = min(self.tokens + (now - self.token_time) * rate, rate * CAPACITY_BURST)
+        self.token_time = now
+        if self.tokens < size:
+            return True
+        self.tokens -= size
+        return False
+
+    def join_layer(self):
+        """
+        Joins the next layer of the carousel, or group of a sharded server, by opening a socket on its port and adding its
+        multi-cast group membership
+        """
+        group, port = self.layer_address(len(self.socks))
+        sock = socket.socket(family=socket.AF_INET, type=socket.SOCK_DGRAM, proto=socket.IPPROTO_UDP)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            sock.setsockopt(socket.IPPROTO_IP, IP_MULTICAST_ALL, 0)
+        except OSError: # Not supported by the platform, where a socket only receives the groups it joined anyway
+            pass
+        sock.bind(('', port))
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, struct.pack('4sl', socket.inet_aton(group), socket.INADDR_ANY))
+        sock.setblocking(0)
+        self.socks.append(sock)
+        self.joins += 1
+        return True
+
+    def leave_layer(self):
+        """
+        Leaves the top layer of the carousel, dropping its multi-cast group membership and closing its socket
+        """
+        group, port = self.layer_address(len(self.socks) - 1)
+        sock = self.socks.pop()
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_DROP_MEMBERSHIP, struct.pack('4sl', socket.inet_aton(group), socket.INADDR_ANY))
+        sock.close()
+        self.leaves += 1
+        return True
+
+    def adapt(self):
+        """
+        Joins or leaves layers of the carousel from the loss rate measured over each RLM_WINDOW, as in receiver-driven layered
+        multi-cast. A client starts on the base layer and tries the next layer once its join timer expires. A join is kept if
+        the loss rate stays within RLM_LOSS of the loss before it, and otherwise the layer is left and its join timer doubled,
+        up to RLM_MAX_JOIN. A rise in loss outside a join leaves the top layer too.
+        """
+        now = time.time()
+        if self.layers <= 1 or now - self.window_start < RLM_WINDOW:
+            return False
+        loss = self.window_lost / max(self.window_rx + self.window_lost, 1)
+        self.window_start, self.window_rx, self.window_lost = now, 0, 0
+        if not self.join_timers:
+            self.join_timers = [RLM_JOIN] * self.layers
+            self.next_join = now + RLM_JOIN
+        if self.experiment is not None: # Judge the last join
+            layer, self.experiment = self.experiment, None
+            if loss > self.baseline + RLM_LOSS:
+                self.leave_layer()
+                self.join_timers[layer] = min(self.join_timers[layer] * 2, RLM_MAX_JOIN)
+            if len(self.socks) < self.layers:
+                self.next_join = now + self.join_timers[len(self.socks)]
+        elif loss > self.baseline + RLM_LOSS and len(self.socks) > 1: # Congestion since the last join
+            self.leave_layer()
+            self.baseline = 1.0
+            self.next_join = now + self.join_timers[len(self.socks)]
+        else:
+            self.baseline = min(self.baseline, loss)
+            if len(self.socks) < self.layers and now >= self.next_join:
+                self.baseline = loss
+                self.join_layer()
+                self.experiment = len(self.socks) - 1
+        return True
+
+    def capabilities(self):
+        """
+        Returns the capabilities this client joins with: its erasure rate
+
+        Returns
+        -------
+        The capabilities packed as CAPABILITIES
+        """
+        return CAPABILITIES.pack(self.erasure / 100)
+
+    def decode(self, block, seed, symbol):
+        """
+        Passes an encoded symbol to the peeling decoder of its block, handing the block to the writer once it is decoded
+
+        Parameters
+        ----------
+        block : int
+            The block number
+        seed : int
+            The seed the source symbols of the encoded symbol were chosen from
+        symbol : bytes
+            The encoded symbol
+        """
+        if block in self.completed or block >= self.num_blocks:
+            self.wasted += 1
+            return
+        k = self.block_symbols(block)
+        if block not in self.blocks:
+            self.blocks[block] = Block(k)
+        decoder = self.blocks[block]
+        decoder.add(neighbours(seed, k, self.distribution(k)), int.from_bytes(symbol, 'little'))
+        if decoder.complete():
+            del self.blocks[block]
+            self.completed.add(block)
+            self.innovative += decoder.innovative
+            self.wasted += decoder.wasted
+            self.writer.write(block, [value.to_bytes(self.packet_bytes, 'little') for value in decoder.symbols])
+
+    def is_complete(self):
+        """
+        Returns whether every block of the file is decoded
+        """
+        return len(self.completed) == self.num_blocks
+
+    def missing(self):
+        """
+        Returns the number of source symbols still missing from each block not yet decoded, including blocks of which no
+        symbol has been received
+
+        Returns
+        -------
+        A dictionary storing block number keys with the number of missing source symbols
+        """
+        needs = {}
+        for block in range(self.num_blocks):
+            if block in self.blocks:
+                needs[block] = len(self.blocks[block].symbols) - self.blocks[block].decoded
+            elif block not in self.completed:
+                needs[block] = self.block_symbols(block)
+        return needs
+
+    def nack(self):
+        """
+        Encodes the number of source symbols still missing from each block not yet decoded, as one MISSING pair per block
+
+        Returns
+        -------
+        The pairs as bytes, for the payload of a missing feedback packet
+        """
+        return b''.join(MISSING.pack(block, missing) for block, missing in self.missing().items())
+
+    def cycles(self):
+        """
+        Returns the number of carousel cycles this client listened to, from the block it joined at to the last block
+        announced
+
+        Returns
+        -------
+        The number of cycles as a float
+        """
+        return (self.cycle_position - self.cycle_start + 1) / max(self.num_blocks, 1) if self.cycle_start is not None else 0
+
+    def create_packet(self, packet_type, payload=b''):
+        """
+        Creates a packet header containing:
+            version
+            packet_type
+            session
+            hostname
+            round
+
+        If a payload (data) is included, this is appended to the header.
+
+        Parameters
+        ----------
+        packet_type : int
+            An integer to represent the packet type:
+                1: Join
+                3: Missing source symbols
+                4: File complete
+
+        payload : bytes, default=b''
+            A byte stream of the serialised capabilities or missing source symbol counts. Default is empty
+
+        Returns
+        -------
+        A packet containing header and payload
+        """
+        return CLIENT_HEADER.pack(VERSION, packet_type, self.session, self.hostname, self.round) + payload
+
+    def open_file(self):
+        """
+        Opens the output file, or the output directory of a tree, and starts the writer stage, once the file size is known
+        from the engineering packet
+        """
+        self.writer = (TreeWriter if self.tree else FileWriter)(self.args.output_file, self.total_bytes, self.args.fsync)
+        return True
+
+    def save_file(self):
+        """
+        Waits for the writer stage to write all received data and closes the output file
+        """
+        self.writer.close()
+        enc_file = self.args.output_file.encode()
+        hash_obj = hashlib.sha1(enc_file)
+        self.hex_val = hash_obj.hexdigest()
+        return True
+
+    def transmit(self, packet, address):
+        """
+        Transmits a packet via uni-cast to the server. Feedback is timed until the server answers it.
+
+        Parameters
+        ----------
+        packet : bytes
+            Bytes representing a single packet from the create_packet method
+        """
+        if address == self.server and CLIENT_HEADER.unpack_from(packet)[1] in (3, 4):
+            if self.feedback_time is None:
+                self.feedback_time = time.time()
+            else:
+                self.feedback_resent = True
+        while True:
+            ready = select.select([], [self.sock], [], 1)
+            if ready[1]:
+                self.sock.sendto(packet, address)
+                break
+        return True
+
+    def receive(self, timeout=None):
+        """
+        Receives and processes packets from the server. Encoded symbols are decoded as they arrive.
+
+        Parameters
+        ----------
+        timeout : float, optional
+            The time to wait for a control packet in seconds. Defaults to the adaptive timeout, which backs off while nothing
+            is received
+
+        Returns
+        -------
+        packet_type : int
+            The type of packet received:
+                1: Engineering
+                3: End of round
+                6: File complete
+                8: Join acknowledged
+
+        addr : str
+            The hostname of the server, for uni-cast responses
+
+        Packets of another wire format version or session are dropped, as are all packets before the engineering packet.
+        """
+        adaptive = timeout is None
+        if adaptive:
+            timeout = min(self.rtt.timeout() * self.backoff, MAX_RTO)
+        end = time.time() + timeout
+        while True:
+            if self.carousel:
+                self.adapt()
+            # Upper layers first, so symbols sent ahead of a control packet on the base layer are taken before it
+            ready = select.select(self.socks, [], [], max(end - time.time(), 0))
+            if ready[0]:
+                packet, addr = ready[0][-1].recvfrom(self.packet_bytes + SERVER_HEADER.size)
+                if len(packet) < SERVER_HEADER.size:
+                    continue
+                version, packet_type, flags, session, self.rx_gen, seed = SERVER_HEADER.unpack_from(packet)
+                if version != VERSION:
+                    continue
+                symbol = packet[SERVER_HEADER.size:]
+                # Engineering packet
+                if packet_type == 1:
+                    self.session = session
+                    self.server = addr
+                    self.total_bytes, self.packet_bytes, self.block_size, tree, self.layers = ENGINEERING.unpack_from(symbol)
+                    self.tree = bool(tree)
+                    self.carousel = bool(flags & FLAG_CAROUSEL)
+                    self.set_blocks()
+                    while not self.carousel and len(self.socks) < self.layers: # Every group of a sharded server
+                        self.join_layer()
+                    if self.carousel: # Position in the carousel, from the cycle and block announced
+                        self.cycle_position = seed * self.num_blocks + self.rx_gen
+                        if self.cycle_start is None:
+                            self.cycle_start = self.cycle_position
+                    break
+                elif session != self.session:
+                    continue
+                self.backoff = 1
+                # Time the answer to feedback: a repair or control packet from the server
+                if self.feedback_time is not None and (packet_type in (3, 6) or flags & FLAG_REPAIR):
+                    if not self.feedback_resent:
+                        self.rtt.update(time.time() - self.feedback_time)
+                    self.feedback_time = None
+                    self.feedback_resent = False
+                # Data received
+                if packet_type == 2:
+                    self.total_rx += 1
+                    if not self.congested(len(packet)) and not self.erase():
+                        self.decode(self.rx_gen, seed, symbol)
+                        self.window_rx += 1
+                    else:
+                        self.erased += 1
+                        self.window_lost += 1
+                # Join acknowledgement
+                elif packet_type == 8:
+                    if seed == self.hostname:
+                        break
+                # End of round, report missing source symbols
+                elif packet_type == 3:
+                    self.round = self.rx_gen
+                    break
+                # File complete
+                elif packet_type == 6:
+                    break
+            elif time.time() >= end:
+                if adaptive and timeout < MAX_RTO:
+                    self.backoff *= 2
+                return 0, 0
+        return packet_type, addr
+
+
+def arguments():
+    """
+    A helper method called prior to class object instantiation to collate all input arguments for use by the constructor methods in setting variables.
+
+    Parameters
+    ----------
+    --file-path : str
+        The path to the file which should be sent, or a directory whose whole tree is sent. A tree is sent as a manifest
+        followed by its files packed back to back, so small files share blocks
+
+    --output-file : str
+        The path to where the received file should be saved, or the directory a tree is written to. A named pipe is
+        written as it is read, and "-" writes the received data to stdout, with progress and statistics on stderr
+
+    --ip : str
+        The multi-cast group IP address
+
+    --port : int
+        The multi-cast port
+
+    --packet-size : int
+        The desired packet payload size in bytes
+        Default is derived from the MTU
+
+    --mtu : int
+        The path MTU in bytes
+        Default is discovered from the interface used to reach the multi-cast group
+
+    --block-size : int
+        The number of source symbols per block, 0 to code over the whole file as a single block
+
+    --overhead : float
+        The fraction of extra encoded symbols sent per block over the number of source symbols, in the initial transmission and in repairs
+
+    --block-cache : int
+        The number of blocks of source symbols the server keeps in memory for repair rounds
+
+    --mcast-rate : float
+        The multi-cast link rate in Mbit/s a carousel sends at
+
+    --carousel : bool
+        The server loops over the file at --mcast-rate without joins or feedback, and clients listen from any block and
+        leave once they have decoded the whole file
+
+    --cycles : int
+        The number of cycles a carousel sends, 0 to send until interrupted
+
+    --carousel-loss : int
+        The packet loss rate (%) the expected number of carousel cycles is reported for
+
+    --layers : int
+        The number of multi-cast layers a carousel is sent on, each on the next group address and port. The base layer sends
+        at --mcast-rate and each layer above doubles the rate, and clients join and leave layers from the loss they observe
+
+    --shards : int
+        The number of worker processes the server sends from, each sending the encoded symbols of every shards-th block
+        from its own socket, while the server process coordinates feedback. Not used by a carousel
+
+    --shard-groups : bool
+        Each shard sends on its own multi-cast group and port, the next ones after those given, and clients join them all
+
+    --capacity : float
+        The link capacity in Mbit/s a client simulates, dropping packets that arrive faster, or 0 for no limit
+
+    --hostname : int
+        The 32-bit ID of the client
+        Default is a random ID chosen when the client starts
+
+    --expect-clients : int
+        The number of clients the server waits for before starting the transfer
+        Default is to start after a join window timed from the round trip times of the clients that joined
+
+    --erasurelow : int
+        The lower bound on erasure probability setting (%)
+
+    --erasurehigh : int
+        The upper bound on erasure probability setting (%)
+
+    --burst-length : float
+        The mean number of packets lost in a row, following a Gilbert-Elliott model, or 0 for independent losses
+
+    --fsync : str
+        When received data is synced to disk: "none" (the default), after every "block", or once at the "end"
+    """
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(
+        "--file-path",
+        type=str,
+        help="Path to the file which should be sent.",
+        default=os.path.realpath(__file__),
+    )
+    parser.add_argument(
+        "--output-file",
+        type=str,
+        help="Path to the file which should be received.",
+        default="output_file",
+    )
+    parser.add_argument(
+        "--ip", type=str, help="The IP address to send to.", default=MCAST_GRP
+    )
+    parser.add_argument(
+        "--port", type=int, help="The port to send to.", default=MCAST_PORT
+    )
+    parser.add_argument(
+        "--packet-size", type=int, help="Packet payload size in bytes, derived from the MTU by default.", default=None
+    )
+    parser.add_argument(
+        "--mtu", type=int, help="Path MTU in bytes, discovered by default.", default=None
+    )
+    parser.add_argument(
+        "--block-size", type=int, help="Source symbols per block, 0 for the whole file.", default=1024
+    )
+    parser.add_argument(
+        "--overhead", type=float, help="Extra encoded symbols sent per block", default=0.1
+    )
+    parser.add_argument(
+        "--block-cache", type=int, help="Blocks kept in server memory", default=64
+    )
+    parser.add_argument(
+        "--mcast-rate", type=float, help="Multi-cast link rate in Mbit/s", default=6
+    )
+    parser.add_argument(
+        "--carousel", action="store_true", help="Loop over the file without feedback"
+    )
+    parser.add_argument(
+        "--cycles", type=int, help="Carousel cycles, 0 until interrupted", default=0
+    )
+    parser.add_argument(
+        "--carousel-loss", type=int, help="Loss percentage for the expected carousel cycles", default=10
+    )
+    parser.add_argument(
+        "--layers", type=int, help="Multi-cast layers of a carousel", default=1
+    )
+    parser.add_argument(
+        "--shards", type=int, help="Worker processes the server sends from", default=1
+    )
+    parser.add_argument(
+        "--shard-groups", action="store_true", help="Send each shard on its own multi-cast group and port"
+    )
+    parser.add_argument(
+        "--capacity", type=float, help="Simulated client link capacity in Mbit/s, 0 for none", default=0
+    )
+    parser.add_argument(
+        "--hostname", type=int, help="Client ID, random by default", default=None
+    )
+    parser.add_argument(
+        "--expect-clients", type=int, help="Start as soon as this many clients have joined", default=0
+    )
+    parser.add_argument(
+        "--erasurelow", type=int, help="Erasure low percentage", default=0
+    )
+    parser.add_argument(
+        "--erasurehigh", type=int, help="Erasure high percentage", default=0
+    )
+    parser.add_argument(
+        "--burst-length", type=float, help="Mean packets per loss burst, 0 for independent losses", default=0
+    )
+    parser.add_argument(
+        "--fsync", type=str, help="When to sync received data to disk", default="none", choices=["none", "block", "end"]
+    )
+    args = parser.parse_args()
+    return args
@@ -0,0 +1,133 @@
+import time
+import math
+import ltudp
+
+def main():
+    """
+    Main flow control logic for the LT fountain coded server.
+    """
+    args = ltudp.arguments() # Get arguments at execution
+    s = ltudp.Server(args) # Instantiate ltUDP server object
+    s.connection() # Initialise network socket
+    s.open_file() # Open the target file
+    if s.tree:
+        print(f"> Sending {s.tree.files} files in {s.total_bytes} bytes from {args.file_path}")
+
+    # Carousel mode: the file is sent round at a fixed rate with no joins, feedback or per client state, and clients listen
+    # from any block and leave once they have decoded the whole file
+    if args.carousel:
+        print(f"\n> Carousel of {s.num_blocks} block(s) of up to {s.block_size} symbols at {args.mcast_rate} Mbit/s")
+        if s.layers > 1:
+            print(f"> {s.layers} layers up to {args.mcast_rate * 2 ** (s.layers - 1)} Mbit/s, from {s.layer_address(0)[0]}:{s.layer_address(0)[1]}")
+        print(f"> Expected cycles at {args.carousel_loss}% loss: {round(ltudp.expected_cycles(args.carousel_loss / 100, s.num_blocks, s.block_size, args.overhead), 2)}")
+        try:
+            while not args.cycles or s.cycle < args.cycles:
+                for x in range(s.num_blocks):
+                    s.transmit(s.create_packet(1, x, ltudp.FLAG_CAROUSEL)) # Announce the session and position to new clients
+                    for _ in range(math.ceil(s.block_symbols(x) * (1 + args.overhead))): # New encoded symbols every cycle
+                        for layer in range(s.layers): # Each layer carries its own encoded symbols, at its share of the rate
+                            for _ in range(s.layer_share(layer)):
+                                s.pace() # Space packets at the carousel rate
+                                s.transmit(s.create_packet(2, x), s.layer_address(layer))
+                                s.tx += 1
+                s.cycle += 1
+                if args.cycles:
+                    s.progressBar(s.cycle, args.cycles, 'Tx') # Increment transmit progress
+        except KeyboardInterrupt: # A carousel without --cycles runs until stopped
+            pass
+        for _ in range(3):
+            s.transmit(s.create_packet(6))
+
+        # Print statistics to terminal
+        print('\nCarousel stopped\n-------------------------------------')
+        print(f'Cycles sent: {s.cycle}')
+        print(f'Packets sent: {s.tx}\n')
+        s.sock.close() # Close the socket
+        s.f.close() # Close the target file
+        return
+
+    missing = {} # Initialise empty dictionary of missing source symbols per block per client
+    s.start_shards() # Worker processes that send the blocks of each shard, with --shards
+
+    # Engineering phase: Server sends advertisement packets
+    sent = time.time()
+    for _ in range(3):
+        s.transmit(s.create_packet(1))
+    print("\nSent engineering packet, awaiting response...")
+    print(f"> Packet size: {s.packet_bytes} bytes (MTU {s.mtu}), {s.num_blocks} block(s) of up to {s.block_size} symbols")
+    if s.shards > 1:
+        print(f"> Sending from {s.shards} shard processes{' on their own groups' if args.shard_groups else ''}")
+
+    # Join phase: clients join with their ID and capabilities and are acknowledged, until the expected number of clients
+    # have joined, or otherwise until twice the timeout of the slowest client has passed
+    timeout = sent + ltudp.INITIAL_RTO
+    while len(s.clients) < args.expect_clients if args.expect_clients else time.time() < timeout:
+        type, symbol, hostname = s.receive(None if args.expect_clients else timeout - time.time())
+        if type == 1:
+            s.join(hostname, symbol, time.time() - sent)
+            timeout = sent + 2 * s.timeout()
+        elif type == 0: # Re-announce the session for clients still to join
+            s.transmit(s.create_packet(1))
+
+    print(f"> Connected to {len(s.clients)} client(s)\n-------------------------------------")
+
+    # Initial transmission: every block is sent once with --overhead extra encoded symbols, with no barrier between blocks
+    if s.shards > 1: # Shards encode and send their blocks in parallel
+        s.send_shards({x: math.ceil(s.block_symbols(x) * (1 + args.overhead)) for x in range(s.num_blocks)})
+        s.progressBar(s.num_blocks, s.num_blocks, 'Tx')
+    else:
+        for x in range(s.num_blocks):
+            for _ in range(math.ceil(s.block_symbols(x) * (1 + args.overhead))):
+                s.transmit(s.create_packet(2, x))
+                s.tx += 1 # Track number of data packets sent for calculating re-transmission rate
+            s.progressBar(x+1, s.num_blocks, 'Tx') # Increment transmit progress
+    s.transmit_control() # Transmit end of round control packet
+
+    # Repair rounds: clients report the source symbols they are missing per block, and new encoded symbols are sent
+    while True:
+        type, symbol, hostname = s.receive()
+        if type == 3: # If missing, add to list and client state to 3
+            s.clients[hostname] = 3
+            missing[hostname] = s.missing_symbols(symbol) # Decode the missing source symbols per block
+        elif type == 4: # If not missing, set client state to 4
+            s.clients[hostname] = 4
+        elif type == 0: # Feedback timed out, re-send the control packet for clients that missed it
+            s.transmit_control(resend=True)
+        # If all clients have reported status, send new encoded symbols for the blocks still missing
+        if all(v != 1 for v in s.clients.values()):
+            if missing:
+                if s.shards > 1: # Repairs are sent by the shard of each block
+                    s.send_shards(s.plan_repairs(missing), ltudp.FLAG_REPAIR)
+                else:
+                    for block, count in s.plan_repairs(missing).items():
+                        for _ in range(count):
+                            s.transmit(s.create_packet(2, block, ltudp.FLAG_REPAIR))
+                            s.tx += 1 # Track number of data packets sent for calculating re-transmission rate
+                for y in s.clients: # Reset clients state that were missing back to 1
+                    if s.clients[y] == 3:
+                        s.clients[y] = 1
+                s.end_round()
+                s.transmit_control()
+                missing.clear() # Clear missing after re-transmissions complete
+            # If all clients complete (state 4), the file is complete
+            elif all(v == 4 for v in s.clients.values()):
+                s.end_round()
+                break
+
+    # Transmit end file packet
+    for _ in range(3):
+        s.transmit(s.create_packet(6))
+    s.stop_shards()
+
+    # Print statistics to terminal
+    print('\nFile transfer complete!\n-------------------------------------')
+    print(f'Re-transmit rate: {round(((s.tx / s.total_packets) -1)*100, 1)} %')
+    print(f'Repair rounds: {len(s.round_waits) - 1}')
+    print(f'Feedback wait: {round(sum(s.round_waits), 3)} s, {round(sum(s.round_waits) / max(len(s.round_waits), 1) * 1000, 1)} ms mean, {round(max(s.round_waits, default=0) * 1000, 1)} ms max per round')
+    print(f'Control re-sends: {s.control_resends}\n')
+    print('File transfer complete.')
+    s.sock.close() # Close the socket
+    s.f.close() # Close the target file
+
+if __name__ == '__main__':
+    main()
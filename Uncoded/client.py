@@ -1,5 +1,5 @@
+import sys
 import time
-import pickle
 import smartudp as sudp
 
 def main():
@@ -7,53 +7,94 @@ def main():
     Main flow control logic for the un-coded client.
     """
     args = sudp.arguments()# Get arguments at execution
+    if args.output_file == "-": # Received data is written to stdout, so progress and statistics go to stderr
+        sys.stdout = sys.stderr
     c = sudp.Client(args) # Initialise smartUDP client
     c.connection() # Initialise network socket
 
     print("\nClient initialised, awaiting connection...")
 
-    # Engineering phase: Client listens and responds to server advertisement
+    # Engineering phase: Client listens for the server announcement and joins until the server acknowledges it
     while True:
         type, addr = c.receive()
-        if type == 1:
-            c.transmit(c.create_packet(1), addr)
+        if c.carousel: # A carousel is listened to without joining
+            c.open_file() # Start writing received generations to the output file
+            print(f"> Listening to carousel from server: {c.server[0]}:{c.server[1]}\n-------------------------------------")
+            break
+        if type != 8 and c.server: # Join, or join again until the join is acknowledged
+            for packet in c.signature_packets(): # Signatures of the basis for a delta transfer, ahead of the join
+                c.transmit(packet, c.server)
+            c.transmit(c.create_packet(1, c.capabilities()), c.server)
+        elif type == 8: # Join acknowledged
             c.set_generation()
-            print(f"> Connected to server: {addr[0]}:{addr[1]}\n-------------------------------------")
+            c.open_file() # Start writing received generations to the output file
+            print(f"> Connected to server: {c.server[0]}:{c.server[1]} as client {c.hostname:08x}\n-------------------------------------")
             break
     
     start = time.time() + 0.1 # Start timer for measuring decode time
 
-    # Loop for each generation in the file to be received
-    for x in range(c.num_gens):
-        # Receive data packets and respond until no missing packets
-        while c.missing:
+    if c.carousel:
+        # Collect packets of every generation as they come round, writing each generation once all of its packets are held
+        while len(c.done) < c.num_gens:
             type, addr = c.receive()
-            if type == 3: # Received end generation control packet
-                res = pickle.dumps(c.missing)
-                c.transmit(c.create_packet(3, res), addr) # Transmit missing list
-        c.transmit(c.create_packet(4), addr)   # Transmit generation complete
+            if type == 3 and c.collect_generation(c.rx_gen): # End of a generation, with its layout
+                c.progressBar(len(c.done), c.num_gens, 'Rx') # Increment receive progress
+            elif type == 6: # The carousel stopped before the whole file was held
+                print(f"\nCarousel stopped with {len(c.done)} of {c.num_gens} generations received")
+                break
+    else:
+        # Loop for each generation in the file to be received, skipping generations a delta transfer takes from the basis
+        while c.gen_number < c.num_gens:
+            # Receive data packets and respond until no missing packets
+            while c.missing:
+                type, addr = c.receive()
+                if type == 3 and c.rx_gen == c.gen_number: # Received end generation control packet
+                    c.recover() # Recover what parity can before asking for anything
+                    if args.peer_repair and c.missing:
+                        c.request_peers() # Ask peers for missing packets first
+                        c.recover()
+                    if c.missing:
+                        c.transmit(c.create_packet(3, c.nack()), c.server) # Transmit missing packet bitmap
+                elif type == 0: # Nothing received, re-send missing packet bitmap in case it was lost
+                    c.transmit(c.create_packet(3, c.nack()), c.server)
+                elif type == 5: # Playout deadline passed, the generation was delivered with its gaps
+                    c.progressBar(c.gen_number, c.num_gens, 'Rx') # Increment receive progress
+            if c.gen_number == c.num_gens: # The rest of the file was skipped, unchanged from the basis
+                break
+            c.transmit(c.create_packet(4), c.server)   # Transmit generation complete
 
-        # When generation complete, wait for all other clients to complete before moving to next generation.    
-        while True:
+            # When generation complete, wait for all other clients to complete before moving to next generation.    
+            while True:
+                type, addr = c.receive()
+                if type == 5 and c.rx_gen == c.gen_number: # Server signals all clients complete
+                    c.progressBar(c.gen_number+1, c.num_gens, 'Rx') # Increment receive progress
+                    c.flush_generation(c.gen_number) # Write the generation to the output file in the background
+                    c.gen_number += 1 # Increment current generation number
+                    c.set_generation() # Set the next generation for receiving
+                    break
+                elif type == 3 and c.rx_gen == c.gen_number: # Server missed the generation complete packet, re-send it
+                    c.transmit(c.create_packet(4), c.server)
+        # When last generation complete, wait for file transfer complete confirmation from server   
+        while type != 6: # All clients finished receiving file
             type, addr = c.receive()
-            if type == 5: # Server signals all clients complete
-                c.progressBar(x+1, c.num_gens, 'Rx') # Increment receive progress
-                c.gen_number += 1 # Increment current generation number
-                c.set_generation() # Set the next generation for receiving
-                break
-    # When last generation complete, wait for file transfer complete confirmation from server   
-    while True:
-        type, addr = c.receive()
-        if type == 6: # All clients finished receiving file
-            c.save_file() # Save data to file
-            break
+    c.save_file() # Wait for the remaining data to be written
     
     delta = time.time() - start # Calculate total decode time
 
     # Print statistics to terminal
     print("\nFile transfer complete!\n-------------------------------------")
     print(f"Decode Rate: {round((c.total_bytes / delta)/1e6, 2)} MB/s")
-    print(f"Erasure Rate: {round(((c.erased)/(c.total_rx)) * 100, 1)}%\n")
+    print(f"Erasure Rate: {round(((c.erased)/max(c.total_rx, 1)) * 100, 1)}%")
+    print(f"Packets recovered from parity: {c.recovered}")
+    if c.carousel:
+        print(f"Carousel cycles: {round(c.cycles(), 2)} (expected {round(sudp.expected_cycles(c.erasure / 100, c.num_gens, c.gen_size, c.fec), 2)} at {round(c.erasure, 1)}% loss)")
+    if c.expired:
+        print(f"Generations expired: {c.expired} ({c.gaps} packets replaced by zeros)")
+    if c.basis:
+        print(f"Generations from basis: {c.from_basis}/{c.num_gens}")
+    if c.tree:
+        print(f"Files written: {c.writer.completed}")
+    print(f"Peer repairs sent: {c.peer_tx}\n")
     print(f"Run-time: {delta}")
     c.sock.close() # Close the socket
 
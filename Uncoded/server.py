@@ -1,5 +1,4 @@
 import time
-import pickle
 import smartudp as sudp
 
 def main():
@@ -10,70 +9,184 @@ def main():
     s = sudp.Server(args) # Instantiate smartUDP server object
     s.connection() # Initialise network socket
     s.open_file() # Open the target file
-    missing = [] # Initialise empty missing packet list
+    if s.tree:
+        print(f"> Sending {s.tree.files} files in {s.total_bytes} bytes from {args.file_path}")
+    if args.compress != "none" and not s.sample_compression(): # Compression is skipped for files that do not compress
+        print(f"> File does not compress with {args.compress}, sending uncompressed")
+
+    # Carousel mode: the file is sent round at a fixed rate with no joins, feedback or per client state, and clients listen
+    # from any generation and leave once they hold the whole file
+    if args.carousel:
+        s.plan_generations() # Every generation, as no client reports signatures
+        print(f"\n> Carousel of {s.num_gens} generations at {args.mcast_rate} Mbit/s")
+        print(f"> Expected cycles at {args.carousel_loss}% loss: {round(sudp.expected_cycles(args.carousel_loss / 100, s.num_gens, s.gen_size, s.fec), 2)}")
+        try:
+            while not args.cycles or s.cycle < args.cycles:
+                for x in s.plan:
+                    s.gen_number = x
+                    s.transmit(s.create_packet(1, flags=sudp.FLAG_CAROUSEL)) # Announce the session and position to new clients
+                    first = x * s.gen_size
+                    for seq in range(first, first + s.layout(x)[0]):
+                        s.pace() # Space packets at the carousel rate
+                        s.transmit(s.create_packet(2, seq, s.get_data(seq)))
+                        s.tx += 1
+                    if s.fec: # Parity packets, new Reed-Solomon rows every cycle
+                        for packet in s.create_parity(x, s.cycle):
+                            s.pace()
+                            s.transmit(packet)
+                            s.tx += 1
+                            s.parity_tx += 1
+                    s.transmit(s.create_packet(3)) # Layout of the generation, which ends it for clients
+                s.cycle += 1
+                if args.cycles:
+                    s.progressBar(s.cycle, args.cycles, 'Tx') # Increment transmit progress
+        except KeyboardInterrupt: # A carousel without --cycles runs until stopped
+            pass
+        for _ in range(3):
+            s.transmit(s.create_packet(6))
+
+        # Print statistics to terminal
+        print('\nCarousel stopped\n-------------------------------------')
+        print(f'Cycles sent: {s.cycle}')
+        print(f'Packets sent: {s.tx}')
+        print(f'Parity packets: {s.parity_tx}\n')
+        s.sock.close() # Close the socket
+        s.f.close() # Close the target file
+        return
+
+    missing = {} # Initialise empty dictionary of missing packets per client
+    interleave = max(args.interleave, 1) # Generations sent in each interleaved initial transmission
 
     # Engineering phase: Server sends advertisement packets
+    sent = time.time()
     for _ in range(3):
         s.transmit(s.create_packet(1))
     print("\nSent engineering packet, awaiting response...")
+    print(f"> Packet size: {s.packet_bytes} bytes (MTU {s.mtu})")
 
-    # Wait for clients to respond and add them to the 'client state matrix'
-    timeout = time.time() + 0.1
-    while True:
-        type, symbol, hostname = s.receive()
+    # Join phase: clients join with their ID and capabilities and are acknowledged, until the expected number of clients
+    # have joined, or otherwise until twice the timeout of the slowest client has passed
+    timeout = sent + sudp.INITIAL_RTO
+    while len(s.clients) < args.expect_clients if args.expect_clients else time.time() < timeout:
+        type, symbol, hostname = s.receive(None if args.expect_clients else timeout - time.time())
         if type == 1:
-            s.clients[hostname] = 1 # Adding client to state matrix by hostname and default state of 1
-        else:
-            if time.time() > timeout:
-                break
+            s.join(hostname, symbol, time.time() - sent)
+            timeout = sent + 2 * s.timeout()
+        elif type == 0: # Re-announce the session for clients still to join
+            s.transmit(s.create_packet(1))
 
     print(f"> Connected to {len(s.clients)} client(s)\n-------------------------------------")
+
+    # Delta transfer: skip the generations every client already holds, from the signatures they joined with
+    if len(s.plan_generations()) < s.num_gens:
+        print(f"> Delta transfer: sending {len(s.plan)} of {s.num_gens} generations")
         
     # Loop for each generation in the file to be transmitted
-    for x in range(s.num_gens):
+    for i, x in enumerate(s.plan):
         s.gen_number = x # Set generation number
-        # Initial transmission of generation packets
-        for _ in range(s.gen_size):
-            s.transmit(s.create_packet(2, s.seq, s.get_data(s.seq)))
-            s.seq += 1 # Increment the sequence number
-            s.tx += 1 # Track number of data packets sent for calculating re-transmission rate
-        for _ in range(1):
-            s.transmit(s.create_packet(3)) # Transmit end generation control packet
+        s.start_deadline() # Playout deadline of the generation, with --deadline
+        # Initial transmission of generation packets, interleaved packet by packet across the next --interleave generations
+        # so a burst of losses is spread across them. Generations sent ahead go straight to feedback when their turn comes.
+        if i % interleave == 0:
+            window = s.plan[i:i + interleave]
+            counts = [s.layout(gen)[0] for gen in window] # Compressed generations have fewer packets
+            for index in range(max(counts)):
+                for gen, count in zip(window, counts):
+                    if index >= count:
+                        continue
+                    s.seq = gen * s.gen_size + index # Sequence number of the packet
+                    s.transmit(s.create_packet(2, s.seq, s.get_data(s.seq)))
+                    s.tx += 1 # Track number of data packets sent for calculating re-transmission rate
+            if s.fec: # Parity packets, from which clients recover lost packets without feedback
+                for packets in zip(*[s.create_parity(gen) for gen in window]):
+                    for packet in packets:
+                        s.transmit(packet)
+                        s.tx += 1
+                        s.parity_tx += 1
+        s.transmit_control() # Transmit end generation control packet
 
         # Loop to receive missing packet lists from clients
         while True:
             type, symbol, hostname = s.receive()
+            if type in (3, 4) and hostname in s.stragglers: # Feedback from a client in the catch-up session
+                s.catch_up(type, symbol, hostname)
+                continue
             if type == 3: # If missing, add to list and client state to 3
                 s.clients[hostname] = 3
-                res = pickle.loads(symbol)
-                for pkt in res:
-                    missing.append(pkt)
+                missing[hostname] = s.missing_packets(symbol) # Decode the missing packet bitmap
+                s.record_loss(hostname, len(missing[hostname]))
             elif type == 4: # If not missing, set client state to 4
                 s.clients[hostname] = 4
+                s.record_loss(hostname, 0)
+            elif type == 0 and not s.is_expired(): # Feedback timed out, re-send the control packet and re-prompt clients in the catch-up session
+                s.transmit_control(resend=True)
+                s.prompt_stragglers()
+            # Move clients holding back the healthy clients to the catch-up session, so the group moves on without them
+            lagging = s.lagging()
+            if lagging:
+                s.demote(lagging)
+                for client in lagging:
+                    missing.pop(client, None)
             # If all clients have reported status, re-transmit any packets in the missing list
             if all(v != 1 for v in s.clients.values()):
                 if any(v == 3 for v in s.clients.values()):
-                    for pkt in missing:
-                        s.transmit(s.create_packet(2, pkt, s.data[pkt]))
+                    s.note_round() # Track clients holding the group back
+                    multicast, unicast = s.plan_repairs(missing) # Split repairs between multi-cast and uni-cast
+                    for pkt in multicast:
+                        s.transmit(s.create_packet(2, pkt, s.data[pkt], sudp.FLAG_REPAIR))
                         s.tx += 1 # Track number of data packets sent for calculating re-transmission rate
-                    s.transmit(s.create_packet(3))
+                    for client, pkts in unicast.items():
+                        for pkt in pkts:
+                            s.transmit(s.create_packet(2, pkt, s.data[pkt], sudp.FLAG_REPAIR), s.addresses[client])
+                            s.tx += 1
+                    s.transmit_control()
                     missing.clear() # Empty the missing list after re-transmissions complete
                 # If all clients complete (state 4), send finished gen packet
                 elif all(v == 4 for v in s.clients.values()):
                     s.transmit(s.create_packet(5))
                     break
+            # Playout deadline passed: stop repairing the generation, and clients still missing packets deliver it with gaps
+            if s.is_expired():
+                s.expire()
+                missing.clear()
+                break
 
-        s.progressBar(x+1, s.num_gens, 'Tx') # Increment transmit progress
+        s.progressBar(i+1, len(s.plan), 'Tx') # Increment transmit progress
+        s.end_generation() # Update how long each client has held the group back
         for client in s.clients: # Reset client states to 1
             s.clients[client] = 1 
             
+    # Serve clients still in the catch-up session until they have the whole file
+    s.finished = True
+    while s.stragglers:
+        type, symbol, hostname = s.receive()
+        if type in (3, 4) and hostname in s.stragglers:
+            s.catch_up(type, symbol, hostname)
+        elif type == 0:
+            s.prompt_stragglers()
+
     # When last generation complete, transmit end file packet
     for _ in range(1):
         s.transmit(s.create_packet(6))
 
     # Print statistics to terminal
     print('\nFile transfer complete!\n-------------------------------------')
-    print(f'Re-transmit rate: {round(((s.tx / s.total_packets) -1)*100, 1)} %\n')
+    # Packets the file was sent in, fewer than the file holds if compressed or skipped by a delta transfer
+    sent = sum(layout[0] for layout in s.layouts.values()) if s.codec or len(s.plan) < s.num_gens else s.total_packets
+    print(f'Re-transmit rate: {round(((s.tx / sent) -1)*100, 1) if sent else 0} %')
+    print(f'Repair rounds: {s.repair_rounds}')
+    if s.codec:
+        print(f'Compressed generations: {sum(1 for layout in s.layouts.values() if layout[1])}/{s.num_gens}')
+    print(f'Repair air time: {round(s.repair_airtime, 3)} s')
+    print(f'Catch-up packets: {s.catch_up_tx}')
+    print(f'Parity packets: {s.parity_tx}')
+    if args.deadline:
+        print(f'Generations expired: {s.expired}/{len(s.plan)}')
+    if s.signatures:
+        print(f'Generations sent: {len(s.plan)}/{s.num_gens}')
+    print(f'Generations read ahead: {s.reader.reads if s.reader else 0}/{len(s.plan)}')
+    print(f'Feedback wait: {round(sum(s.gen_waits), 3)} s, {round(sum(s.gen_waits) / max(len(s.gen_waits), 1) * 1000, 1)} ms mean, {round(max(s.gen_waits, default=0) * 1000, 1)} ms max per generation')
+    print(f'Control re-sends: {s.control_resends}\n')
     s.sock.close() # Close the socket
     s.f.close() # Close the target file
 
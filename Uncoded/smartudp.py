@@ -1,15 +1,303 @@
 import argparse
+import bisect
 import os
 import socket
 import sys
 import struct
 import random
+import queue
+import threading
 import select
 import hashlib
+import json
+import math
+import time
+import zlib
+import concurrent.futures
+from collections import Counter, OrderedDict
+try:
+    import numpy as np
+except ImportError: # Only needed for Reed-Solomon parity
+    np = None
+try:
+    import zstandard
+except ImportError: # Only needed for zstd compression
+    zstandard = None
 
 MCAST_GRP = "224.1.1.1"
 MCAST_PORT = 5007
 
+DEFAULT_MTU = 1500 # Assumed MTU when it cannot be discovered from the outgoing interface
+IP_MTU = getattr(socket, 'IP_MTU', 14) # Linux socket option, not exposed by every Python build
+IP_UDP_HEADERS = 28 # Bytes of IPv4 and UDP header in every datagram
+MAX_DATAGRAM = 65507 # Largest UDP payload over IPv4
+LOSS_GAIN = 0.25 # Weight of the newest sample in the per client loss estimate
+RTT_ALPHA = 0.125 # Weight of the newest sample in the smoothed round trip time
+RTT_BETA = 0.25 # Weight of the newest sample in the round trip time variation
+INITIAL_RTO = 0.1 # Time to wait for a reply before any round trip time has been measured, in seconds
+MIN_RTO = 0.005 # Shortest time to wait for a reply, in seconds
+MAX_RTO = 1.0 # Longest time to wait for a reply, including back-off, in seconds
+FRAME_OVERHEAD = 100e-6 # Approximate per frame air time of WiFi preamble, inter-frame spacing and acknowledgement, in seconds
+
+VERSION = 6 # Wire format version, packets of any other version are dropped
+FLAG_REPAIR = 0x01 # Set on data packets that are re-transmissions
+FLAG_PEER = 0x02 # Set on data packets sent by a peer client rather than the server
+FLAG_PARITY = 0x04 # Set on parity packets, whose index is the parity row rather than a packet position
+FLAG_CAROUSEL = 0x08 # Set on engineering packets of a carousel, whose index is the cycle number
+FLAG_EXPIRED = 0x10 # Set on next generation packets sent once the playout deadline of the generation has passed
+
+FEC_SCHEMES = {"none": 0, "xor": 1, "rs": 2} # Parity schemes, advertised by number in the engineering packet
+CODECS = {"none": 0, "zlib": 1, "zstd": 2} # Generation compression codecs, advertised by number
+
+PEER_BACKOFF = 0.01 # Upper bound of the random delay before a peer answers a repair request, in seconds
+PEER_WINDOW = 0.03 # Time a client waits for peer repairs before reporting missing packets to the server, in seconds
+PEER_HISTORY = 4 # Number of completed generations a client keeps to answer peers that are behind it
+IOV_MAX = 1024 # Most buffers written by a single writev call
+TREE_FDS = 64 # Most files of a directory tree the server holds open at once
+ZLIB_LEVEL = 6 # zlib compression level of generations
+ZSTD_LEVEL = 3 # zstd compression level of generations
+COMPRESS_SAMPLE = 4 # Generations spread through the file that are compressed to decide whether compression pays
+SIGNATURE_BYTES = 16 # Bytes of the hash of each generation a client reports from its existing copy of the file
+GF_POLY = 0x11d # Primitive polynomial of GF(2^8), for Reed-Solomon parity
+MAX_CYCLES = 1000 # Most carousel cycles summed by the expected cycles metric
+
+# Header of every server packet: version, packet_type, flags, session, generation, index
+SERVER_HEADER = struct.Struct('<BBBHII')
+# Header of every client packet: version, packet_type, session, hostname, generation
+CLIENT_HEADER = struct.Struct('<BBHII')
+# Transfer parameters, carried only by engineering packets: total_bytes, packet_bytes, gen_size, parity scheme, parity packets,
+# codec, tree (1 when a directory tree is sent)
+ENGINEERING = struct.Struct('<QHIBBBB')
+# Capabilities a client joins with: peer_repair, loss (its erasure rate from 0 to 1), and the generation size in bytes its basis
+# was signed with, 0 without a basis
+CAPABILITIES = struct.Struct('<?fI')
+# Length of the manifest at the start of a directory tree transfer, which follows it as JSON
+MANIFEST = struct.Struct('<I')
+# Layout of a generation, carried by end generation control packets: packets, codec, compressed length
+LAYOUT = struct.Struct('<IBI')
+# First generation skipped by a delta transfer before the generation of a control packet (after the layout of end
+# generation packets, or the payload of file complete packets), equal to that generation if none were skipped
+SKIPPED = struct.Struct('<I')
+
+
+def bitmap_indices(bitmap):
+    """
+    Decodes a missing packet bitmap into the positions of the set bits
+
+    Parameters
+    ----------
+    bitmap : bytes
+        A bitmap with one bit per packet of a generation
+
+    Returns
+    -------
+    A list of packet positions within the generation, in increasing order
+    """
+    bits = int.from_bytes(bitmap, 'little')
+    indices = []
+    while bits:
+        low = bits & -bits # Lowest set bit
+        indices.append(low.bit_length() - 1)
+        bits ^= low
+    return indices
+
+
+def gf_tables():
+    """
+    Builds the exponent, logarithm and multiplication tables of GF(2^8), so multiplying whole packets by a coefficient is a
+    single table lookup per byte
+
+    Returns
+    -------
+    exp : numpy.ndarray
+        The powers of the generator, repeated so sums of two logarithms need no reduction
+    log : numpy.ndarray
+        The logarithm of each non-zero field element
+    mul : numpy.ndarray
+        A 256 by 256 table of the product of every pair of field elements
+    """
+    exp = np.zeros(512, dtype=np.uint8)
+    log = np.zeros(256, dtype=np.int32)
+    x = 1
+    for i in range(255):
+        exp[i] = x
+        log[x] = i
+        x <<= 1
+        if x & 0x100:
+            x ^= GF_POLY
+    exp[255:510] = exp[:255]
+    mul = exp[log[:, None] + log[None, :]]
+    mul[0, :] = 0
+    mul[:, 0] = 0
+    return exp, log, mul
+
+
+
+def compress(codec, data):
+    """
+    Compresses data with a codec
+
+    Parameters
+    ----------
+    codec : int
+        The codec, a value of CODECS other than none
+    data : bytes
+        The bytes-like data to compress
+
+    Returns
+    -------
+    The compressed bytes
+    """
+    if codec == CODECS["zstd"]:
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return zlib.compress(data, ZLIB_LEVEL)
+
+
+def decompress(codec, data):
+    """
+    Decompresses data compressed by compress()
+
+    Parameters
+    ----------
+    codec : int
+        The codec the data was compressed with
+    data : bytes
+        The compressed bytes
+
+    Returns
+    -------
+    The decompressed bytes
+    """
+    if codec == CODECS["zstd"]:
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+def signature(data, block_bytes):
+    """
+    Returns the signature of a generation: a hash of its data, padded with zeros to the generation size as it is sent
+
+    Parameters
+    ----------
+    data : bytes
+        The bytes of the generation read from a file, fewer than block_bytes at the end of the file
+    block_bytes : int
+        The number of bytes in one generation
+
+    Returns
+    -------
+    A digest of SIGNATURE_BYTES bytes
+    """
+    digest = hashlib.blake2b(data, digest_size=SIGNATURE_BYTES)
+    digest.update(bytes(block_bytes - len(data)))
+    return digest.digest()
+
+
+def binomial_tail(n, q, need):
+    """
+    Returns the probability that at least need of n packets arrive, each arriving independently with probability q
+
+    Parameters
+    ----------
+    n : int
+        The number of packets sent
+    q : float
+        The probability that a packet arrives
+    need : int
+        The number of packets needed
+
+    Returns
+    -------
+    The probability as a float
+    """
+    if need <= 0:
+        return 1.0
+    if need > n or q <= 0:
+        return 0.0
+    if q >= 1:
+        return 1.0
+    log_q, log_p = math.log(q), math.log1p(-q)
+    terms = (math.lgamma(n + 1) - math.lgamma(i + 1) - math.lgamma(n - i + 1) + i * log_q + (n - i) * log_p for i in range(need, n + 1))
+    return min(sum(math.exp(t) for t in terms), 1.0)
+
+
+def expected_cycles(loss, gens, k, fec=None):
+    """
+    Returns the expected number of carousel cycles a client needs to hold every generation of the file at a packet loss
+    rate, counted in whole cycles from the start of a cycle. Each cycle sends the k source packets of every generation
+    again, so a source packet is held once it has arrived in any cycle, followed by the parity packets of the generation:
+    the same XOR stripes every cycle, or new Reed-Solomon rows, so any k of the source packets and distinct parity rows held
+    recover the generation. Generations are taken at their full size, as if uncompressed.
+
+    Parameters
+    ----------
+    loss : float
+        The packet loss rate, from 0 to 1
+    gens : int
+        The number of generations in the file
+    k : int
+        The number of source packets per generation
+    fec : ParityCode, optional
+        The parity code sent with each generation, None if no parity is sent
+
+    Returns
+    -------
+    The expected number of cycles as a float, infinite if nothing arrives
+    """
+    if loss >= 1:
+        return math.inf
+    expected = 0
+    for cycles in range(MAX_CYCLES):
+        held = 1 - loss ** cycles if cycles else 0 # Chance a source packet has arrived in one of the cycles
+        if fec is None:
+            complete = held ** k
+        elif fec.scheme == FEC_SCHEMES["xor"]: # A stripe is recovered with at most one loss, if its parity has arrived
+            complete = 1
+            for stripe in range(fec.m):
+                size = len(range(stripe, k, fec.m))
+                complete *= held ** size + size * held ** (size - 1) * (1 - held) * held
+        else: # Any k of the source packets and distinct parity rows held
+            rows = min(cycles * fec.m, fec.rows)
+            complete = sum(math.comb(k, s) * held ** s * (1 - held) ** (k - s) * binomial_tail(rows, 1 - loss, k - s)
+                           for s in range(k + 1))
+        remaining = 1 - complete ** gens # Chance the file is not yet held after this many cycles
+        expected += remaining
+        if remaining < 1e-9:
+            break
+    return expected
+
+
+def pack_generation(buf, length, codec, packet_bytes):
+    """
+    Compresses a generation in place when that sends it in fewer packets. Each generation is compressed on its own, so it
+    can be decompressed without any other generation.
+
+    Parameters
+    ----------
+    buf : bytearray
+        A buffer holding the generation, of the generation size in packets
+    length : int
+        The number of bytes of the buffer read from the file
+    codec : int
+        The codec, a value of CODECS
+    packet_bytes : int
+        The number of bytes per packet
+
+    Returns
+    -------
+    length : int
+        The number of bytes of the buffer to send
+    codec : int
+        The codec the buffer now holds, 0 if it was left as it was read
+    """
+    if not codec:
+        return length, 0
+    data = compress(codec, memoryview(buf)[:length])
+    if -(-len(data) // packet_bytes) >= len(buf) // packet_bytes: # Saves no packet, send as it is
+        return length, 0
+    buf[:len(data)] = data
+    buf[len(data):] = bytes(len(buf) - len(data))
+    return len(data), codec
 
 class SmartUDP:
     """
@@ -33,6 +321,8 @@ class SmartUDP:
         an integer representing the current sequence number
     gen_size : int
         an integer representing the configured generation size
+    session : int
+        an integer identifying the transfer, chosen by the server and echoed in every packet
 
     Methods
     -------
@@ -56,6 +346,7 @@ class SmartUDP:
         self.packet_bytes = 1400
         self.seq = 0
         self.gen_size = self.args.gen_size
+        self.session = None
 
     def progressBar (self, iteration, total, prefix = '', suffix = '', decimals = 1, length = 50, fill = '█', printEnd = "\r"):
         """
@@ -81,144 +372,1802 @@ class SmartUDP:
             print()
 
 
-class Server(SmartUDP):
+def pread(f, size, offset):
     """
-    A class to enable a server to reliably transmitt data via multi-cast UDP socket to a client
+    Reads bytes of the target at an offset without moving its read position
+
+    Parameters
+    ----------
+    f : file or TreeReader
+        The open target file, or the directory tree being sent
+    size : int
+        The number of bytes to read
+    offset : int
+        The offset to read from
+
+    Returns
+    -------
+    The bytes read, fewer than size at the end of the target
+    """
+    if isinstance(f, TreeReader):
+        return f.pread(size, offset)
+    return os.pread(f.fileno(), size, offset)
+
+
+class ReadAhead:
+    """
+    Reads the target file a generation at a time on a background thread, into a bounded pool of reusable buffers, so the
+    send path takes generations that are already in memory rather than waiting on storage.
     ...
     Attributes
     ----------
-    clients : dict
-        a dictionary storing client hostname keys with state values
-    address : tuple
-        a tuple containing the IP address and port information for the multi-cast group
-    total_bytes : int
-        an integer representing the total number of bytes of data in the target file
+    f : file
+        the open target file, read only by the read-ahead thread
+    block_bytes : int
+        an integer representing the number of bytes in one generation
+    blocks : list
+        a list of the generation numbers to read, in file order, so generations a delta transfer skips are never read
+    free : queue.Queue
+        a queue of buffers available to the read-ahead thread, bounding the memory used to depth + 1 generations
+    ready : queue.Queue
+        a queue of (buffer, length) pairs read ahead of the send path, in file order
+    depth : int
+        an integer representing the number of generations read ahead of the send path
+    reads : int
+        an integer storing the number of generations taken that were already read, rather than waited for
+    codec : int
+        an integer representing the codec generations are compressed with, 0 to send them as they are read
     packet_bytes : int
-        an integer representing the number of bytes per packet
-    total_packets : int
-        an integer representing the total number of packets of data to be transmitted
-    num_gens : int
-        an integer representing the total number of generations required to transmit the target file
-    tx : int
-        an integer storing the total number of data packets transmitted
+        an integer representing the number of bytes per packet, as a generation is only compressed if it saves a packet
+    pool : concurrent.futures.ThreadPoolExecutor
+        the workers compressing generations ahead of the send path, None without compression
 
     Methods
     -------
-    connection()
-        Creates UDP network socket
-    open_file()
-        Opens target file for reading
-    get_data(seq)
-        Reads a packet size of data and stores in the data dictionary with correct sequence number
-    create_packet(packet_type, seq=0, payload=b'')
-        Creates a packet with header and data
-    transmit(packet)
-        Transmits packet via socket
-    receive()
-        Receives packets via socket
+    run()
+        Reads generations into free buffers until the whole file has been read
+    pack(buf, length)
+        Compresses a generation on a worker
+    next()
+        Returns the next generation of the file
+    release(buf)
+        Returns a buffer to the pool once the send path is finished with it
     """
+    def __init__(self, f, block_bytes, blocks, depth, codec=0, packet_bytes=0):
+        self.f = f
+        self.block_bytes = block_bytes
+        self.blocks = blocks
+        self.depth = max(depth, 1)
+        self.free = queue.Queue()
+        self.ready = queue.Queue()
+        self.reads = 0
+        self.codec = codec
+        self.packet_bytes = packet_bytes
+        self.pool = concurrent.futures.ThreadPoolExecutor(max_workers=min(self.depth, os.cpu_count() or 1)) if codec else None
+        for _ in range(self.depth + 1): # One more than is queued, for the generation being sent
+            self.free.put(bytearray(block_bytes))
+        if hasattr(os, 'posix_fadvise') and hasattr(self.f, 'fileno'): # Not available on every platform, or for a tree
+            os.posix_fadvise(self.f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def run(self):
+        """
+        Runs on a background thread, reading each generation with a single large read into a free buffer. The kernel is
+        asked to start reading the generation after the queued ones, so storage stays busy while the thread waits for a buffer.
+        """
+        for i, block in enumerate(self.blocks):
+            buf = self.free.get() # Blocks while depth generations are queued ahead of the send path
+            if hasattr(os, 'posix_fadvise') and hasattr(self.f, 'fileno') and i + self.depth < len(self.blocks):
+                os.posix_fadvise(self.f.fileno(), self.blocks[i + self.depth] * self.block_bytes, self.block_bytes, os.POSIX_FADV_WILLNEED)
+            self.f.seek(block * self.block_bytes)
+            length = self.f.readinto(buf)
+            buf[length:] = bytes(self.block_bytes - length) # Pad the final generation
+            if self.pool is not None: # Compressed by a worker, in file order as the send path takes the results in turn
+                self.ready.put(self.pool.submit(self.pack, buf, length))
+            else:
+                self.ready.put((buf, length, 0))
 
-    def __init__(self, args):
-        SmartUDP.__init__(self, args)
-        self.clients = {}
-        self.address = (self.mcast_grp, self.mcast_port)
-        file_stats = os.stat(self.args.file_path)
-        self.total_bytes = file_stats.st_size
-        self.packet_bytes = self.args.packet_size
-        self.total_packets = self.total_bytes // self.packet_bytes + 1
-        if self.total_packets < self.gen_size:
-            self.gen_size = self.total_packets
-        self.num_gens = (-(-self.total_packets // self.gen_size))
-        self.tx = 0
+    def pack(self, buf, length):
+        """
+        Runs on a worker of the compression pool, compressing a generation in place when it saves a packet
 
-    def connection(self):
+        Parameters
+        ----------
+        buf : bytearray
+            A buffer holding the generation
+        length : int
+            The number of bytes of the buffer read from the file
+
+        Returns
+        -------
+        The buffer, the number of its bytes to send and the codec it holds
+        """
+        length, codec = pack_generation(buf, length, self.codec, self.packet_bytes)
+        return buf, length, codec
+
+    def next(self):
+        """
+        Returns the next generation of the file, waiting for the read-ahead thread only if it has fallen behind
+
+        Returns
+        -------
+        buf : bytearray
+            A buffer of block_bytes holding the generation, padded with zeros after the end of the file
+        length : int
+            The number of bytes of the buffer read from the file, or of the compressed generation
+        codec : int
+            The codec the generation is compressed with, 0 if it is held as it was read
+        """
+        if not self.ready.empty():
+            self.reads += 1
+        item = self.ready.get()
+        if isinstance(item, concurrent.futures.Future):
+            item = item.result()
+        return item
+
+    def release(self, buf):
+        """
+        Returns a buffer to the pool once the send path no longer needs it
+
+        Parameters
+        ----------
+        buf : bytearray
+            A buffer returned by next()
+        """
+        self.free.put(buf)
+
+
+class FileWriter:
+    """
+    Writes completed generations to the output file in order on a background thread, so received data reaches disk during
+    the transfer and the client does not hold the whole file in memory.
+    ...
+    Attributes
+    ----------
+    fd : int
+        the file descriptor of the output file
+    total_bytes : int
+        an integer representing the size of the file being received, beyond which padding is not written
+    fsync : str
+        a string setting when data is synced to disk: "none", "generation" or "end"
+    queue : queue.Queue
+        a queue of (generation, buffers, codec, length) items waiting to be written
+    pending : dict
+        a dictionary storing generation number keys with (buffers, codec, length) items that arrived before an earlier generation
+    next_gen : int
+        an integer storing the generation number to be written next
+    written : int
+        an integer storing the number of bytes written so far
+    error : Exception
+        the exception raised on the writer thread, re-raised when the file is closed
+
+    Methods
+    -------
+    write(gen, buffers, codec=0, length=0)
+        Queues the buffers of a completed generation for writing
+    run()
+        Writes queued generations in order, coalescing those already waiting into one writev call
+    open_output(path)
+        Opens the output file
+    sync()
+        Syncs the data written so far to disk
+    write_buffers(buffers)
+        Writes a list of buffers at the end of the output file
+    close()
+        Waits for all queued generations to be written and closes the output file
+    """
+    def __init__(self, path, total_bytes, fsync="none"):
+        self.fd = self.open_output(path)
+        self.total_bytes = total_bytes
+        self.fsync = fsync
+        self.queue = queue.Queue()
+        self.pending = {}
+        self.next_gen = 0
+        self.written = 0
+        self.error = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def write(self, gen, buffers, codec=0, length=0):
+        """
+        Queues the buffers of a completed generation for writing, returning straight away. Compressed generations are
+        decompressed on the writer thread.
+
+        Parameters
+        ----------
+        gen : int
+            The generation number
+        buffers : list
+            The bytes-like packets or decoded block of the generation, in order
+        codec : int, default=0
+            The codec the generation is compressed with, 0 if it is not compressed
+        length : int, default=0
+            The number of compressed bytes at the start of the buffers
+        """
+        self.queue.put((gen, buffers, codec, length))
+
+    def run(self):
+        """
+        Runs on a background thread, writing generations in generation order. Generations already waiting when the thread
+        wakes are gathered and written together, so a burst of completed generations costs one system call.
+        """
+        done = False
+        while not done:
+            items = [self.queue.get()]
+            while not self.queue.empty():
+                items.append(self.queue.get())
+            buffers = []
+            for item in items:
+                if item is None: # Sentinel from close()
+                    done = True
+                    continue
+                self.pending[item[0]] = item[1:]
+            try:
+                while self.next_gen in self.pending:
+                    gen_buffers, codec, length = self.pending.pop(self.next_gen)
+                    if codec:
+                        gen_buffers = [decompress(codec, b''.join(gen_buffers)[:length])]
+                    buffers.extend(gen_buffers)
+                    self.next_gen += 1
+            except Exception as e: # Corrupt compressed data, reported when the file is closed
+                if self.error is None:
+                    self.error = e
+            if self.error is None and buffers:
+                try:
+                    self.write_buffers(buffers)
+                    if self.fsync == "generation":
+                        self.sync()
+                except Exception as e: # Includes a malformed tree manifest, reported when the file is closed
+                    self.error = e
+
+    def open_output(self, path):
+        """
+        Opens the output file, truncating any existing file, or stdout for "-"
+
+        Parameters
+        ----------
+        path : str
+            The path of the output file
+
+        Returns
+        -------
+        The file descriptor of the output file
+        """
+        if path == "-":
+            return os.dup(1) # Still the real stdout once the client prints to stderr
+        return os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0), 0o644)
+
+    def sync(self):
+        """
+        Syncs the data written so far to disk
+        """
+        os.fsync(self.fd)
+
+    def write_buffers(self, buffers):
+        """
+        Writes a list of buffers at the end of the output file with as few system calls as possible, dropping any padding past
+        the size of the file
+
+        Parameters
+        ----------
+        buffers : list
+            The bytes-like buffers to write, in order
+        """
+        views = []
+        offset = self.written
+        for buf in buffers:
+            view = memoryview(buf)[:max(self.total_bytes - offset, 0)]
+            if len(view):
+                views.append(view)
+                offset += len(view)
+        while views:
+            if hasattr(os, 'writev'): # Not available on every platform
+                batch = views[:IOV_MAX]
+                n = os.writev(self.fd, batch)
+            else:
+                batch = views[:1]
+                n = os.write(self.fd, batch[0])
+            self.written += n
+            for view in batch: # Drop what was written, keeping the rest of a partially written buffer
+                if n >= len(view):
+                    n -= len(view)
+                    views.pop(0)
+                else:
+                    views[0] = view[n:]
+                    break
+
+    def close(self):
+        """
+        Waits for all queued generations to be written, syncs them to disk if set, and closes the output file. As padding is
+        never written, the file ends at exactly total_bytes.
+        """
+        self.queue.put(None)
+        self.thread.join()
+        try:
+            if self.error is not None:
+                raise self.error
+            if self.fsync != "none":
+                os.fsync(self.fd)
+        finally:
+            os.close(self.fd)
+        return True
+
+
+class TreeReader:
+    """
+    Presents a directory tree to the send path as a single file: a manifest of the tree followed by the contents of its files
+    packed back to back, so small files share generations rather than each needing a transfer of its own.
+    ...
+    Attributes
+    ----------
+    root : str
+        the path of the directory being sent
+    segments : list
+        a list of the segments of the stream in order: the manifest as bytes, then the path of each file
+    sizes : list
+        a list of the number of bytes of each segment, as listed in the manifest
+    starts : list
+        a list of the offset of each segment in the stream
+    total_bytes : int
+        an integer representing the size of the stream, manifest included
+    files : int
+        an integer representing the number of files in the tree
+    position : int
+        an integer storing the offset of the stream read next by readinto()
+    fds : OrderedDict
+        an ordered dictionary storing the paths of recently read files with their file descriptors, at most TREE_FDS
+    lock : threading.Lock
+        a lock guarding the file descriptors, as the read-ahead thread and the send path read at once
+
+    Methods
+    -------
+    pread(size, offset)
+        Reads bytes of the stream at an offset
+    read_file(path, size, offset)
+        Reads bytes of a file of the tree, keeping it open for the next read
+    seek(offset)
+        Sets the offset of the stream read next
+    readinto(buf)
+        Reads into a buffer from the current offset
+    close()
+        Closes the open files
+    """
+    def __init__(self, root):
+        self.root = root
+        dirs = []
+        entries = []
+        paths = []
+        for path, subdirs, names in os.walk(root):
+            subdirs.sort() # Walked in a fixed order, so the stream only changes with the tree
+            rel = os.path.relpath(path, root).replace(os.sep, '/')
+            if not subdirs and not names and rel != '.':
+                dirs.append(rel) # Files create their own directories, so only empty ones are listed
+            for name in sorted(names):
+                full = os.path.join(path, name)
+                if not os.path.isfile(full):
+                    continue
+                stats = os.stat(full)
+                entries.append([os.path.relpath(full, root).replace(os.sep, '/'), stats.st_size, stats.st_mode & 0o777])
+                paths.append(full)
+        manifest = json.dumps({"dirs": dirs, "files": entries}).encode()
+        head = MANIFEST.pack(len(manifest)) + manifest
+        self.segments = [head] + paths
+        self.sizes = [len(head)] + [entry[1] for entry in entries]
+        self.starts = []
+        offset = 0
+        for size in self.sizes:
+            self.starts.append(offset)
+            offset += size
+        self.total_bytes = offset
+        self.files = len(entries)
+        self.position = 0
+        self.fds = OrderedDict()
+        self.lock = threading.Lock()
+
+    def pread(self, size, offset):
+        """
+        Reads bytes of the stream at an offset. A file that has shrunk since the manifest was made reads as zeros, so the
+        offsets of the files after it do not move.
+
+        Parameters
+        ----------
+        size : int
+            The number of bytes to read
+        offset : int
+            The offset in the stream to read from
+
+        Returns
+        -------
+        The bytes read, fewer than size at the end of the stream
+        """
+        data = bytearray()
+        i = bisect.bisect_right(self.starts, offset) - 1
+        while size > 0 and i < len(self.segments):
+            skip = offset - self.starts[i]
+            n = min(size, self.sizes[i] - skip)
+            if n > 0:
+                segment = self.segments[i]
+                if isinstance(segment, bytes):
+                    data += segment[skip:skip + n]
+                else:
+                    data += self.read_file(segment, n, skip).ljust(n, b'\0')
+                offset += n
+                size -= n
+            i += 1
+        return bytes(data)
+
+    def read_file(self, path, size, offset):
+        """
+        Reads bytes of a file of the tree, keeping the most recently read files open
+
+        Parameters
+        ----------
+        path : str
+            The path of the file
+        size : int
+            The number of bytes to read
+        offset : int
+            The offset in the file to read from
+        """
+        with self.lock: # Held while reading, as another thread may close the descriptor
+            if path in self.fds:
+                self.fds.move_to_end(path)
+            else:
+                self.fds[path] = os.open(path, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+                if len(self.fds) > TREE_FDS:
+                    os.close(self.fds.popitem(last=False)[1])
+            return os.pread(self.fds[path], size, offset)
+
+    def seek(self, offset):
+        """
+        Sets the offset of the stream read next by readinto()
+
+        Parameters
+        ----------
+        offset : int
+            The offset in the stream
+        """
+        self.position = offset
+
+    def readinto(self, buf):
+        """
+        Reads into a buffer from the current offset of the stream, moving the offset on
+
+        Parameters
+        ----------
+        buf : bytearray
+            The buffer to fill
+
+        Returns
+        -------
+        The number of bytes read, fewer than the buffer at the end of the stream
+        """
+        data = self.pread(len(buf), self.position)
+        buf[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+    def close(self):
+        """
+        Closes the files held open
+        """
+        with self.lock:
+            for fd in self.fds.values():
+                os.close(fd)
+            self.fds.clear()
+
+
+class TreeWriter(FileWriter):
+    """
+    Writes a directory tree transfer under the output directory. The stream of completed generations is split back into the
+    manifest and the files it lists, and each file is created as its byte range arrives and closed once it is complete.
+    ...
+    Attributes
+    ----------
+    root : str
+        the path of the output directory
+    head : bytearray
+        the start of the stream, held until the whole manifest has arrived
+    files : list
+        a list of [path, size, mode] entries from the manifest, in stream order, None until the manifest has arrived
+    index : int
+        an integer storing the position in files of the next file to create
+    fd : int
+        the file descriptor of the file being written, None between files
+    left : int
+        an integer storing the number of bytes of the file being written still to arrive
+    completed : int
+        an integer storing the number of files written
+
+    Methods
+    -------
+    open_output(path)
+        Creates the output directory
+    sync()
+        Syncs the file being written to disk
+    write_buffers(buffers)
+        Splits buffers of the stream between the manifest and the files of the tree
+    read_manifest(view)
+        Takes bytes of the manifest, creating the directories it lists once it is complete
+    check_manifest(manifest)
+        Checks the fields of a received manifest
+    next_file()
+        Creates the next file of the manifest that has data, creating empty files on the way
+    local(path)
+        Returns the path of a manifest entry under the output directory
+    close()
+        Waits for all queued generations to be written and closes the file being written
+    """
+    def __init__(self, path, total_bytes, fsync="none"):
+        self.root = path
+        self.head = bytearray()
+        self.files = None
+        self.index = 0
+        self.left = 0
+        self.completed = 0
+        FileWriter.__init__(self, path, total_bytes, fsync)
+
+    def open_output(self, path):
+        """
+        Creates the output directory. Files are opened as the stream reaches them.
+
+        Parameters
+        ----------
+        path : str
+            The path of the output directory
+        """
+        os.makedirs(path, exist_ok=True)
+        return None
+
+    def sync(self):
+        """
+        Syncs the file being written to disk. Completed files are synced as they are closed.
+        """
+        if self.fd is not None:
+            os.fsync(self.fd)
+
+    def write_buffers(self, buffers):
+        """
+        Splits a list of buffers of the stream between the manifest and the files of the tree, dropping any padding past the
+        end of the stream
+
+        Parameters
+        ----------
+        buffers : list
+            The bytes-like buffers to write, in order
+        """
+        for buf in buffers:
+            view = memoryview(buf)[:max(self.total_bytes - self.written, 0)]
+            while len(view):
+                if self.files is None:
+                    n = self.read_manifest(view)
+                elif self.fd is None: # Nothing left to write
+                    n = len(view)
+                else:
+                    n = os.write(self.fd, view[:self.left])
+                    self.left -= n
+                    if not self.left: # File complete
+                        if self.fsync != "none":
+                            os.fsync(self.fd)
+                        os.close(self.fd)
+                        self.fd = None
+                        self.completed += 1
+                        self.next_file()
+                view = view[n:]
+                self.written += n
+
+    def read_manifest(self, view):
+        """
+        Takes bytes of the manifest from the start of the stream. Once it is complete, the directories it lists are created
+        and the first file is opened.
+
+        Parameters
+        ----------
+        view : memoryview
+            The stream from the current offset
+
+        Returns
+        -------
+        The number of bytes taken
+        """
+        need = MANIFEST.size
+        if len(self.head) >= MANIFEST.size:
+            need += MANIFEST.unpack_from(self.head)[0]
+        n = min(len(view), need - len(self.head))
+        self.head += view[:n]
+        if len(self.head) == need and need > MANIFEST.size:
+            manifest = self.check_manifest(json.loads(bytes(self.head[MANIFEST.size:])))
+            for path in manifest["dirs"]:
+                os.makedirs(self.local(path), exist_ok=True)
+            self.files = manifest["files"]
+            self.next_file()
+        return n
+
+    def check_manifest(self, manifest):
+        """
+        Checks the fields of a received manifest: a list of directory paths, and a list of files each given as a path, a
+        size and a mode. A malformed manifest raises ValueError, which the writer reports when the file is closed.
+
+        Parameters
+        ----------
+        manifest : dict
+            The decoded manifest
+
+        Returns
+        -------
+        The manifest, once checked
+        """
+        if not isinstance(manifest, dict) or not isinstance(manifest.get("dirs"), list) or not isinstance(manifest.get("files"), list):
+            raise ValueError("Malformed tree manifest: no list of directories and files")
+        for path in manifest["dirs"]:
+            if not isinstance(path, str):
+                raise ValueError(f"Malformed tree manifest directory: {path!r}")
+        for entry in manifest["files"]:
+            if not isinstance(entry, list) or len(entry) != 3 or not isinstance(entry[0], str) \
+                    or not all(type(field) is int and field >= 0 for field in entry[1:]):
+                raise ValueError(f"Malformed tree manifest file: {entry!r}")
+        return manifest
+
+    def next_file(self):
+        """
+        Creates the next file of the manifest that has data and opens it for writing, creating any empty files before it
+        """
+        while self.index < len(self.files):
+            path, size, mode = self.files[self.index]
+            self.index += 1
+            local = self.local(path)
+            os.makedirs(os.path.dirname(local), exist_ok=True)
+            fd = os.open(local, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0), mode & 0o777 or 0o644)
+            if size:
+                self.fd, self.left = fd, size
+                return
+            os.close(fd)
+            self.completed += 1
+
+    def local(self, path):
+        """
+        Returns the path of a manifest entry under the output directory, refusing entries that would leave it
+
+        Parameters
+        ----------
+        path : str
+            The path of the entry relative to the root of the tree, with / separators
+        """
+        local = os.path.normpath(os.path.join(self.root, *path.split('/')))
+        if path.startswith('/') or os.path.relpath(local, self.root).split(os.sep)[0] == os.pardir:
+            raise ValueError(f"{path} is outside the output directory")
+        return local
+
+    def close(self):
+        """
+        Waits for all queued generations to be written and closes the file being written. Each file is synced to disk as it is
+        completed if syncing is set.
+        """
+        self.queue.put(None)
+        self.thread.join()
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+        if self.error is not None:
+            raise self.error
+        return True
+
+
+class RttEstimator:
+    """
+    A smoothed estimate of the time taken to hear back from the other end of the transfer, kept as in TCP (RFC 6298), from
+    which feedback deadlines and control packet re-transmissions are timed.
+    ...
+    Attributes
+    ----------
+    srtt : float
+        a float storing the smoothed round trip time in seconds, None until the first sample
+    rttvar : float
+        a float storing the smoothed round trip time variation in seconds
+
+    Methods
+    -------
+    update(sample)
+        Adds a round trip time sample to the estimate
+    timeout()
+        Returns the time to wait for a reply before re-sending
+    """
+    def __init__(self):
+        self.srtt = None
+        self.rttvar = None
+
+    def update(self, sample):
+        """
+        Adds a round trip time sample to the estimate
+
+        Parameters
+        ----------
+        sample : float
+            The time between sending a packet and receiving its reply, in seconds
+        """
+        if self.srtt is None:
+            self.srtt = sample
+            self.rttvar = sample / 2
+        else:
+            self.rttvar = (1 - RTT_BETA) * self.rttvar + RTT_BETA * abs(self.srtt - sample)
+            self.srtt = (1 - RTT_ALPHA) * self.srtt + RTT_ALPHA * sample
+
+    def timeout(self):
+        """
+        Returns the time to wait for a reply before re-sending, SRTT + 4 * RTTVAR bounded by MIN_RTO and MAX_RTO, or
+        INITIAL_RTO before the first sample
+        """
+        if self.srtt is None:
+            return INITIAL_RTO
+        return min(max(self.srtt + 4 * self.rttvar, MIN_RTO), MAX_RTO)
+
+
+class ParityCode:
+    """
+    A systematic parity code over a generation: the k source packets are sent as they are, followed by m parity packets from
+    which clients recover lost source packets without a NACK round trip. The XOR scheme splits the generation into m
+    interleaved stripes and recovers one loss per stripe, while the Reed-Solomon scheme uses a Cauchy matrix over GF(2^8)
+    and recovers any m losses. Reed-Solomon parity is computed with NumPy, which is only required for that scheme. A carousel
+    sends different Reed-Solomon rows every cycle, so clients gather more distinct parity the longer they listen.
+    ...
+    Attributes
+    ----------
+    scheme : int
+        an integer representing the parity scheme, a value of FEC_SCHEMES
+    k : int
+        an integer representing the number of source packets per generation
+    m : int
+        an integer representing the number of parity packets per generation
+    rows : int
+        an integer representing the number of distinct parity rows that can be sent, m unless rows are rotated by a carousel
+    packet_bytes : int
+        an integer representing the number of bytes per packet, to which short packets are padded
+    matrix : numpy.ndarray
+        the rows by k Cauchy matrix of Reed-Solomon parity coefficients
+
+    Methods
+    -------
+    block(packets)
+        Returns packets as the rows of a padded byte array
+    encode(packets, rows=None)
+        Returns the parity packets of a generation
+    excess(missing, rows)
+        Returns the missing packets the parity held cannot recover
+    recover(packets, parity)
+        Returns the source packets recovered from the parity packets
+    invert(a)
+        Inverts a square matrix over GF(2^8)
+    """
+    def __init__(self, scheme, k, m, packet_bytes, rotate=False):
+        self.scheme = scheme
+        self.k = k
+        self.m = min(m, k) if scheme == FEC_SCHEMES["xor"] else m # A stripe needs at least one packet
+        # Every row a Reed-Solomon carousel can rotate through, as the matrix has at most 256 columns and rows in all
+        self.rows = max(256 - k, m) if rotate and scheme == FEC_SCHEMES["rs"] else self.m
+        self.packet_bytes = packet_bytes
+        if scheme == FEC_SCHEMES["rs"]:
+            if np is None:
+                print("Reed-Solomon parity requires NumPy, which is not installed.")
+                sys.exit(1)
+            if k + m > 256:
+                print(f"Reed-Solomon parity needs at most 256 packets per generation, got {k} source and {m} parity.")
+                sys.exit(1)
+            self.exp, self.log, self.mul = gf_tables()
+            # Cauchy matrix: coefficient 1 / (x_j + y_i) with distinct x_j = k + j and y_i = i, so any m columns are invertible
+            x = np.arange(k, k + self.rows)
+            y = np.arange(k)
+            self.matrix = self.exp[255 - self.log[x[:, None] ^ y[None, :]]]
+
+    def block(self, packets):
+        """
+        Returns packets as the rows of a byte array, padding the short packets at the end of the file with zeros
+
+        Parameters
+        ----------
+        packets : list
+            The bytes-like packets
+
+        Returns
+        -------
+        A numpy array of one row of packet_bytes per packet
+        """
+        rows = np.zeros((len(packets), self.packet_bytes), dtype=np.uint8)
+        for i, packet in enumerate(packets):
+            rows[i, :len(packet)] = np.frombuffer(packet, dtype=np.uint8)
+        return rows
+
+    def encode(self, packets, rows=None):
+        """
+        Returns the parity packets of a generation
+
+        Parameters
+        ----------
+        packets : list
+            The k source packets of the generation, in order
+        rows : list, optional
+            The Reed-Solomon rows to encode. Defaults to the first m rows
+
+        Returns
+        -------
+        A list of the parity packets, in the order of their rows
+        """
+        if self.scheme == FEC_SCHEMES["xor"]:
+            stripes = [0] * self.m
+            for i, packet in enumerate(packets):
+                stripes[i % self.m] ^= int.from_bytes(packet, 'little')
+            return [stripe.to_bytes(self.packet_bytes, 'little') for stripe in stripes]
+        data = self.block(packets)
+        return [np.bitwise_xor.reduce(self.mul[self.matrix[j][:, None], data], axis=0).tobytes() for j in (rows or range(self.m))]
+
+    def excess(self, missing, rows):
+        """
+        Returns the missing packets that the parity packets held cannot recover, which must be requested from the server or
+        peers. Once they arrive, the rest are recovered from parity.
+
+        Parameters
+        ----------
+        missing : list
+            The positions of the missing source packets, in increasing order
+        rows : collection
+            The parity rows held
+
+        Returns
+        -------
+        A list of packet positions, in increasing order
+        """
+        if self.scheme == FEC_SCHEMES["xor"]:
+            stripes = {}
+            for index in missing:
+                stripes.setdefault(index % self.m, []).append(index)
+            excess = []
+            for stripe, indices in stripes.items():
+                excess.extend(indices[1:] if stripe in rows else indices)
+            return sorted(excess)
+        return missing[:max(len(missing) - len(rows), 0)]
+
+    def recover(self, packets, parity):
+        """
+        Returns the source packets of a generation that can be recovered from its parity packets
+
+        Parameters
+        ----------
+        packets : dict
+            A dictionary storing position keys with the source packets held
+        parity : dict
+            A dictionary storing parity row keys with the parity packets held
+
+        Returns
+        -------
+        A dictionary storing position keys with the recovered source packets, padded to packet_bytes
+        """
+        missing = [i for i in range(self.k) if i not in packets]
+        recovered = {}
+        if self.scheme == FEC_SCHEMES["xor"]:
+            for stripe, payload in parity.items():
+                lost = [i for i in missing if i % self.m == stripe]
+                if len(lost) == 1:
+                    value = int.from_bytes(payload, 'little')
+                    for i in range(stripe, self.k, self.m):
+                        if i != lost[0]:
+                            value ^= int.from_bytes(packets[i], 'little')
+                    recovered[lost[0]] = value.to_bytes(self.packet_bytes, 'little')
+            return recovered
+        if not missing or len(missing) > len(parity):
+            return recovered
+        rows = sorted(parity)[:len(missing)]
+        held = sorted(packets)
+        # Remove the held packets from each parity packet, leaving a combination of the missing packets only
+        syndromes = self.block([parity[row] for row in rows])
+        if held:
+            data = self.block([packets[i] for i in held])
+            for t, row in enumerate(rows):
+                syndromes[t] ^= np.bitwise_xor.reduce(self.mul[self.matrix[row, held][:, None], data], axis=0)
+        inverse = self.invert(self.matrix[np.ix_(rows, missing)])
+        for q, index in enumerate(missing):
+            recovered[index] = np.bitwise_xor.reduce(self.mul[inverse[q][:, None], syndromes], axis=0).tobytes()
+        return recovered
+
+    def invert(self, a):
+        """
+        Inverts a square matrix over GF(2^8) by Gauss-Jordan elimination. Square sub-matrices of a Cauchy matrix are always
+        invertible.
+
+        Parameters
+        ----------
+        a : numpy.ndarray
+            The matrix to invert
+
+        Returns
+        -------
+        The inverse matrix
+        """
+        n = len(a)
+        a = a.copy()
+        inverse = np.eye(n, dtype=np.uint8)
+        for col in range(n):
+            pivot = next(r for r in range(col, n) if a[r, col])
+            a[[col, pivot]] = a[[pivot, col]]
+            inverse[[col, pivot]] = inverse[[pivot, col]]
+            scale = self.exp[255 - self.log[a[col, col]]]
+            a[col] = self.mul[scale, a[col]]
+            inverse[col] = self.mul[scale, inverse[col]]
+            for r in range(n):
+                if r != col and a[r, col]:
+                    factor = a[r, col]
+                    a[r] ^= self.mul[factor, a[col]]
+                    inverse[r] ^= self.mul[factor, inverse[col]]
+        return inverse
+
+
+class Server(SmartUDP):
+    """
+    A class to enable a server to reliably transmitt data via multi-cast UDP socket to a client
+    ...
+    Attributes
+    ----------
+    clients : dict
+        a dictionary storing client hostname keys with state values
+    address : tuple
+        a tuple containing the IP address and port information for the multi-cast group
+    total_bytes : int
+        an integer representing the total number of bytes of data in the target file
+    packet_bytes : int
+        an integer representing the number of bytes per packet
+    total_packets : int
+        an integer representing the total number of packets of data to be transmitted
+    num_gens : int
+        an integer representing the total number of generations required to transmit the target file
+    tx : int
+        an integer storing the total number of data packets transmitted
+    mtu : int
+        an integer representing the path MTU the packet size is derived from
+    addresses : dict
+        a dictionary storing client hostname keys with the address their feedback was received from, for uni-cast repairs
+    repair_airtime : float
+        a float storing the estimated air time spent on repair packets in seconds
+    stragglers : dict
+        a dictionary storing the hostname keys of clients in the catch-up session with the generation each is on
+    catch_up_data : dict
+        a dictionary storing generation number keys with the packets of generations read again for the catch-up session
+    loss : dict
+        a dictionary storing client hostname keys with a moving estimate of their packet loss
+    holdouts : dict
+        a dictionary storing client hostname keys with the number of consecutive generations they held the group back
+    catch_up_tx : int
+        an integer storing the number of data packets sent in the catch-up session
+    repair_rounds : int
+        an integer storing the number of repair rounds sent to the group
+    reports : dict
+        a dictionary storing client hostname keys with the capabilities each client joined with
+    finished : bool
+        a boolean set once the group has received the whole file
+    reader : ReadAhead
+        the read-ahead stage supplying generations of the target file, started with the first generation
+
+    rtts : dict
+        a dictionary storing client hostname keys with the RttEstimator of their feedback
+    backoff : int
+        an integer multiplying the feedback timeout, doubled each time the control packet is re-sent without feedback
+    control_time : float
+        a float storing when the current control packet was sent, None once it has been re-sent
+    sampled : set
+        a set of the hostnames whose feedback to the current control packet has been timed
+    control_resends : int
+        an integer storing the number of control packets re-sent after a feedback timeout
+    awaiting : bool
+        a boolean set while the server waits for feedback on the current generation
+    waited : float
+        a float storing the time spent waiting for feedback on the current generation, in seconds
+    gen_waits : list
+        a list of the time spent waiting for feedback on each generation, in seconds
+    fec : ParityCode
+        the parity code sent after the source packets of each generation, None without --fec
+    parity_tx : int
+        an integer storing the number of parity packets transmitted
+    codec : int
+        an integer representing the codec generations are compressed with, 0 if compression is off
+    layouts : dict
+        a dictionary storing generation number keys with (packets, codec, compressed length) values
+    plan : list
+        a list of the generation numbers to send in order, every generation unless a delta transfer skips unchanged ones
+    signatures : dict
+        a dictionary storing client hostname keys with dictionaries of generation number keys and the signature of the
+        generation in the client's existing copy of the file
+    tree : TreeReader
+        the directory tree being sent, None when sending a single file
+    cycle : int
+        an integer storing the number of the carousel cycle being sent
+    send_time : float
+        a float storing when the next data packet of the carousel is due
+    expiry : float
+        a float storing when the playout deadline of the current generation passes, None without --deadline
+    expired : int
+        an integer storing the number of generations moved on from at their playout deadline
+    Methods
+    -------
+    discover_mtu()
+        Returns the MTU of the interface used to reach the multi-cast group
+    connection()
+        Creates UDP network socket
+    open_file()
+        Opens target file for reading
+    sample_compression()
+        Switches compression off if a sample of the file does not compress
+    add_signatures(hostname, first, payload)
+        Stores generation signatures reported by a client
+    plan_generations()
+        Selects the generations to send, skipping those every client already holds
+    skipped_from(gen)
+        Returns the first generation skipped before a generation
+    next_planned(gen)
+        Returns the next generation to send after a generation
+    get_data(seq)
+        Returns a packet size of data, taking the next generation from the read-ahead stage when needed
+    layout(gen)
+        Returns the number of packets, codec and compressed length of a generation
+    create_packet(packet_type, seq=0, payload=b'')
+        Creates a packet with header and data
+    create_parity(gen, cycle=0)
+        Creates the parity packets of a generation
+    pace()
+        Waits until the next data packet of the carousel is due
+    missing_packets(nack, gen=None)
+        Decodes a client missing packet bitmap into sequence numbers
+    airtime(rate)
+        Estimates the air time of one data packet at a link rate
+    unicast_clients()
+        Returns the clients that can be reached by uni-cast
+    plan_repairs(requests)
+        Splits a repair round between multi-cast and uni-cast
+    record_loss(hostname, missing)
+        Updates the loss estimate of a client
+    is_healthy(hostname)
+        Returns whether a client keeps pace with the group
+    lagging()
+        Returns the clients to move to the catch-up session
+    note_round()
+        Records the clients holding the group back at a repair round
+    end_generation()
+        Updates per client lag counts and releases the packets at the end of a generation
+    start_deadline()
+        Starts the playout deadline of the current generation
+    is_expired()
+        Returns whether the playout deadline of the current generation has passed
+    expire()
+        Moves every client on from the current generation at its playout deadline
+    create_join_ack(hostname)
+        Creates a join acknowledgement for a client
+    join(hostname, payload, rtt)
+        Adds a client and acknowledges its join
+    update_rtt(hostname, sample)
+        Adds a round trip time sample for a client
+    timeout()
+        Returns how long to wait for client feedback
+    transmit_control(resend=False)
+        Multi-casts the end generation control packet and times the feedback it prompts
+    demote(hostnames)
+        Moves clients to the catch-up session
+    catch_up_address(hostname)
+        Returns the address to send catch-up packets for a client to
+    prompt_stragglers()
+        Re-sends control packets to clients in the catch-up session
+    finish_catch_up(hostname)
+        Moves a client in the catch-up session on to its next generation
+    catch_up_packets(gen)
+        Returns the packets of a generation the group has moved on from
+    catch_up(packet_type, payload, hostname)
+        Serves feedback from a client in the catch-up session
+    transmit(packet, address=None)
+        Transmits packet via socket
+    receive()
+        Receives packets via socket
+    """
+
+    def __init__(self, args):
+        SmartUDP.__init__(self, args)
+        self.clients = {}
+        self.addresses = {}
+        self.repair_airtime = 0
+        self.stragglers = {}
+        self.catch_up_data = {}
+        self.loss = {}
+        self.holdouts = {}
+        self.reported = set()
+        self.round_holdouts = set()
+        self.catch_up_tx = 0
+        self.repair_rounds = 0
+        self.reports = {}
+        self.finished = False
+        self.reader = None
+        self.rtts = {}
+        self.backoff = 1
+        self.control_time = None
+        self.sampled = set()
+        self.control_resends = 0
+        self.awaiting = False
+        self.waited = 0
+        self.gen_waits = []
+        self.address = (self.mcast_grp, self.mcast_port)
+        # A directory is sent as one stream of its manifest and files, and a single file as it is
+        self.tree = TreeReader(self.args.file_path) if os.path.isdir(self.args.file_path) else None
+        self.total_bytes = self.tree.total_bytes if self.tree else os.stat(self.args.file_path).st_size
+        self.mtu = min(self.args.mtu or self.discover_mtu(), MAX_DATAGRAM + IP_UDP_HEADERS)
+        # Payload fills the MTU after the IP, UDP and protocol headers, unless a packet size is given
+        self.packet_bytes = self.args.packet_size or self.mtu - IP_UDP_HEADERS - SERVER_HEADER.size
+        self.total_packets = self.total_bytes // self.packet_bytes + 1
+        if self.total_packets < self.gen_size:
+            self.gen_size = self.total_packets
+        self.num_gens = (-(-self.total_packets // self.gen_size))
+        self.fec = ParityCode(FEC_SCHEMES[self.args.fec], self.gen_size, self.args.parity, self.packet_bytes, self.args.carousel) if self.args.fec != "none" else None
+        self.parity_tx = 0
+        self.codec = CODECS[self.args.compress]
+        if self.codec == CODECS["zstd"] and zstandard is None:
+            print("zstd compression requires the zstandard package, which is not installed.")
+            sys.exit(1)
+        self.layouts = {}
+        self.plan = []
+        self.signatures = {}
+        self.tx = 0
+        self.cycle = 0
+        self.send_time = 0
+        self.expiry = None
+        self.expired = 0
+        self.session = random.getrandbits(16)
+
+    def discover_mtu(self):
+        """
+        Discovers the MTU of the interface the multi-cast group is routed through, which includes jumbo frames on LANs that use them.
+        Falls back to DEFAULT_MTU where the platform does not support the query.
+
+        Returns
+        -------
+        The MTU in bytes
+        """
+        probe = socket.socket(family=socket.AF_INET, type=socket.SOCK_DGRAM)
+        try:
+            probe.connect((self.mcast_grp, self.mcast_port)) # Connecting a UDP socket only selects the route
+            return probe.getsockopt(socket.IPPROTO_IP, IP_MTU)
+        except OSError:
+            return DEFAULT_MTU
+        finally:
+            probe.close()
+
+    def connection(self):
+        """
+        Initialises a multi-cast UDP socket with the multi-cast IP and port provided
+        """
+        self.sock = socket.socket(
+            family=socket.AF_INET, type=socket.SOCK_DGRAM, proto=socket.IPPROTO_UDP)
+        self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 2)
+        self.sock.setblocking(0)
+        return True
+
+    def open_file(self):
+        """
+        Opens the target file to be read as bytes
+        """
+        if self.tree is not None: # Directory tree, read through its manifest
+            self.f = self.tree
+        elif not os.path.isfile(self.args.file_path):
+            print(f"{self.args.file_path} is not a valid file.")
+            sys.exit(1)
+        else:
+            self.f = open(os.path.expanduser(self.args.file_path), 'rb')
+            enc_file = os.path.expanduser(self.args.file_path).encode()
+            hash_obj = hashlib.sha1(enc_file)
+            self.hex_val = hash_obj.hexdigest()
+            return True
+
+    def sample_compression(self):
+        """
+        Compresses COMPRESS_SAMPLE generations spread through the target file, and switches compression off for the transfer if
+        none of them would be sent in fewer packets, so incompressible files are not compressed generation by generation
+
+        Returns
+        -------
+        True if compression stays on
+        """
+        if not self.codec:
+            return False
+        block_bytes = self.gen_size * self.packet_bytes
+        for gen in sorted({self.num_gens * i // COMPRESS_SAMPLE for i in range(COMPRESS_SAMPLE)}):
+            data = pread(self.f, block_bytes, gen * block_bytes)
+            buf = bytearray(block_bytes)
+            buf[:len(data)] = data
+            if pack_generation(buf, len(data), self.codec, self.packet_bytes)[1]:
+                return True
+        self.codec = 0
+        return False
+
+    def add_signatures(self, hostname, first, payload):
+        """
+        Stores a run of generation signatures of a client's existing copy of the file, sent ahead of its join
+
+        Parameters
+        ----------
+        hostname : int
+            The ID of the client
+        first : int
+            The generation number of the first signature
+        payload : bytes
+            The signatures, SIGNATURE_BYTES each
+        """
+        signatures = self.signatures.setdefault(hostname, {})
+        for i in range(len(payload) // SIGNATURE_BYTES):
+            signatures[first + i] = bytes(payload[i * SIGNATURE_BYTES:(i + 1) * SIGNATURE_BYTES])
+        return True
+
+    def plan_generations(self):
+        """
+        Selects the generations to send once the clients have joined. If every client joined with signatures of an existing
+        copy, each generation of the target file is signed and only those whose signature differs for at least one client
+        are sent, so a refresh costs air time in proportion to what changed. Generations a client has no signature for count
+        as changed. Otherwise every generation is sent.
+
+        Returns
+        -------
+        The list of generation numbers to send
+        """
+        block_bytes = self.gen_size * self.packet_bytes
+        signed = [h for h in self.clients if self.reports[h].get("signatures") == block_bytes and h in self.signatures]
+        if not self.clients or len(signed) < len(self.clients):
+            self.plan = list(range(self.num_gens))
+            return self.plan
+        self.plan = []
+        for gen in range(self.num_gens):
+            digest = signature(pread(self.f, block_bytes, gen * block_bytes), block_bytes)
+            if any(self.signatures[h].get(gen) != digest for h in signed):
+                self.plan.append(gen)
+        return self.plan
+
+    def skipped_from(self, gen):
+        """
+        Returns the first generation skipped by a delta transfer before a generation, which is the generation itself if the
+        generation before it is sent
+
+        Parameters
+        ----------
+        gen : int
+            The generation number
+        """
+        i = bisect.bisect_left(self.plan, gen)
+        return self.plan[i - 1] + 1 if i else 0
+
+    def next_planned(self, gen):
+        """
+        Returns the next generation to send after a generation, or the number of generations if there is none
+
+        Parameters
+        ----------
+        gen : int
+            The generation number
+        """
+        i = bisect.bisect_right(self.plan, gen)
+        return self.plan[i] if i < len(self.plan) else self.num_gens
+
+    def get_data(self, seq):
+        """
+        Returns a packet size of data from the target file. The first packet of each generation takes the generation from the
+        read-ahead stage and stores all of its packets in the data dictionary, so the buffer can be reused straight away.
+        A compressed generation is stored as the packets of its compressed data, fewer than the generation size.
+
+        Parameters
+        ----------
+        seq : int
+            The current sequence number
+
+        Returns
+        -------
+        The packet-length of data for the current sequence
+        """
+
+        if seq not in self.data:
+            if self.reader is None:
+                self.reader = ReadAhead(self.f, self.gen_size * self.packet_bytes, self.plan, self.args.read_ahead, self.codec, self.packet_bytes)
+            buf, length, codec = self.reader.next()
+            view = memoryview(buf)[:length]
+            base = seq - seq % self.gen_size
+            packets = -(-length // self.packet_bytes) if codec else self.gen_size
+            for index in range(packets):
+                self.data[base + index] = bytes(view[index * self.packet_bytes:(index + 1) * self.packet_bytes])
+            view.release()
+            self.reader.release(buf)
+            self.layouts[seq // self.gen_size] = (packets, codec, length)
+        return self.data[seq]
+
+    def layout(self, gen):
+        """
+        Returns the layout of a generation, taking it from the read-ahead stage if it has not been sent yet
+
+        Parameters
+        ----------
+        gen : int
+            The generation number
+
+        Returns
+        -------
+        packets : int
+            The number of packets of the generation, fewer than the generation size if it is compressed
+        codec : int
+            The codec the generation is compressed with, 0 if it is not compressed
+        length : int
+            The number of bytes of the generation as sent
+        """
+        if gen not in self.layouts:
+            self.get_data(gen * self.gen_size)
+        return self.layouts[gen]
+
+    def create_packet(self, packet_type, seq=0, payload=b'', flags=0, gen=None):
+        """
+        Creates a packet header containing:
+            version
+            packet_type
+            flags
+            session
+            generation
+            index (position of the packet within the generation)
+
+        Engineering packets carry the transfer parameters (total_bytes, packet_bytes, gen_size, parity scheme, number of
+        parity packets, codec and whether a tree is sent) as their payload, and the carousel cycle in the index field. End generation packets carry the layout of the generation, so clients
+        know how many packets a compressed generation has, and with file complete packets, the first generation skipped
+        before them by a delta transfer. If a payload (data) is included, this is appended to the header.
+
+        Parameters
+        ----------
+        packet_type : int
+            An integer to represent the packet type:
+                1: Engineering
+                2: Data
+                3: End generation
+                5: Moving to next generation
+                6: File transfer complete
+
+        seq : int, default=0
+            An integer to represent the sequence number of the data payload. Default is 0 if not a data packet
+
+        payload : bytes, default=b''
+            A byte stream of data representing a single packet of bytes. Default is empty if not a data packet
+
+        flags : int, default=0
+            Bit flags for the packet, such as FLAG_REPAIR
+
+        gen : int, optional
+            The generation number of a control packet, for clients in the catch-up session. Defaults to the current generation
+
+        Returns
+        -------
+        A packet containing header and payload
+        """
+
+        if packet_type == 2:
+            gen, index = divmod(seq, self.gen_size)
+        else:
+            gen, index = self.gen_number if gen is None else gen, self.cycle if packet_type == 1 else 0
+        if packet_type == 1:
+            payload = ENGINEERING.pack(self.total_bytes, self.packet_bytes, self.gen_size, FEC_SCHEMES[self.args.fec], self.fec.m if self.fec else 0, self.codec, 1 if self.tree else 0)
+        elif packet_type == 3:
+            payload = LAYOUT.pack(*self.layout(gen)) + SKIPPED.pack(self.skipped_from(gen))
+        elif packet_type == 6:
+            payload = SKIPPED.pack(self.skipped_from(self.num_gens))
+        header = SERVER_HEADER.pack( # Struct used to create the fixed length header
+            VERSION,
+            packet_type,
+            flags,
+            self.session,
+            gen,
+            index
+        )
+        packet = header + payload # Attaching payload to header is a simple concatenation
+        return packet
+
+    def create_parity(self, gen, cycle=0):
+        """
+        Creates the parity packets of a generation, sent after its source packets. The index field carries the parity row.
+        Each cycle of a Reed-Solomon carousel moves on to the next m rows, so no row is sent again until all have been sent.
+
+        Parameters
+        ----------
+        gen : int
+            The generation number
+        cycle : int, default=0
+            The carousel cycle the parity is sent in
+
+        Returns
+        -------
+        A list of packets containing header and parity payload
+        """
+        first = gen * self.gen_size
+        packets = self.layout(gen)[0]
+        rows = [(cycle * self.fec.m + j) % self.fec.rows for j in range(self.fec.m)]
+        payloads = self.fec.encode([self.get_data(seq) for seq in range(first, first + packets)] + [b''] * (self.gen_size - packets), rows)
+        return [SERVER_HEADER.pack(VERSION, 2, FLAG_PARITY, self.session, gen, row) + payload for row, payload in zip(rows, payloads)]
+
+    def pace(self):
+        """
+        Waits until the next data packet of the carousel is due, spacing packets by their air time at the multi-cast rate
+        (--mcast-rate) so the carousel sends at a fixed rate. A server that falls behind does not burst to catch up.
+        """
+        now = time.time()
+        if self.send_time > now:
+            time.sleep(self.send_time - now)
+        self.send_time = max(self.send_time, now) + self.airtime(self.args.mcast_rate)
+        return True
+
+    def missing_packets(self, nack, gen=None):
+        """
+        Decodes the missing packet bitmap sent by a client
+
+        Parameters
+        ----------
+        nack : bytes
+            The bitmap payload of a missing packets packet, one bit per packet of the generation
+
+        gen : int, optional
+            The generation the bitmap is for. Defaults to the current generation
+
+        Returns
+        -------
+        A list of the sequence numbers of the missing packets, past the end of a compressed generation dropped
+        """
+        gen = self.gen_number if gen is None else gen
+        packets = self.layout(gen)[0]
+        return [gen * self.gen_size + index for index in bitmap_indices(nack) if index < packets]
+
+    def airtime(self, rate):
+        """
+        Estimates the air time of one data packet at a link rate, including a fixed per frame overhead
+
+        Parameters
+        ----------
+        rate : float
+            The link rate in Mbit/s
+
+        Returns
+        -------
+        The air time in seconds
+        """
+        return (self.packet_bytes + SERVER_HEADER.size + IP_UDP_HEADERS) * 8 / (rate * 1e6) + FRAME_OVERHEAD
+
+    def unicast_clients(self):
+        """
+        Returns the clients that can be reached by uni-cast. Clients sharing an address with another client, such as several
+        clients on a single PC, can only be reached by multi-cast.
+
+        Returns
+        -------
+        A set of client hostnames
+        """
+        counts = Counter(self.addresses.values())
+        return {hostname for hostname, addr in self.addresses.items() if counts[addr] == 1}
+
+    def plan_repairs(self, requests):
+        """
+        Decides how each missing packet of a repair round is sent. Multi-cast is sent at the lowest basic rate, while uni-cast
+        gets link-layer ARQ and higher rates, so a packet missed by only one or two clients is usually cheaper to uni-cast to each.
+        With --repair-mode multicast every packet is multi-cast, and with unicast every packet is uni-cast where possible.
+
+        Parameters
+        ----------
+        requests : dict
+            A dictionary of client hostname keys with lists of the sequence numbers each client is missing
+
+        Returns
+        -------
+        multicast : list
+            The sequence numbers to multi-cast
+        unicast : dict
+            A dictionary of client hostname keys with lists of sequence numbers to uni-cast to that client
+        """
+        mcast_time = self.airtime(self.args.mcast_rate)
+        ucast_time = self.airtime(self.args.ucast_rate)
+        reachable = self.unicast_clients()
+        needed = {}
+        for hostname, seqs in requests.items():
+            for seq in seqs:
+                needed.setdefault(seq, []).append(hostname)
+        multicast = []
+        unicast = {}
+        for seq in sorted(needed):
+            hostnames = needed[seq]
+            if self.args.repair_mode != "multicast" and all(h in reachable for h in hostnames) \
+                    and (self.args.repair_mode == "unicast" or len(hostnames) * ucast_time < mcast_time):
+                for hostname in hostnames:
+                    unicast.setdefault(hostname, []).append(seq)
+            else:
+                multicast.append(seq)
+        self.repair_airtime += len(multicast) * mcast_time + sum(len(v) for v in unicast.values()) * ucast_time
+        return multicast, unicast
+
+    def record_loss(self, hostname, missing):
+        """
+        Updates the loss estimate of a client from its first missing packet report of a generation
+
+        Parameters
+        ----------
+        hostname : int
+            The hostname of the client
+        missing : int
+            The number of packets the client reported missing
+        """
+        if hostname in self.reported:
+            return
+        self.reported.add(hostname)
+        sample = missing / self.gen_size
+        self.loss[hostname] = sample if hostname not in self.loss else (1 - LOSS_GAIN) * self.loss[hostname] + LOSS_GAIN * sample
+
+    def is_healthy(self, hostname):
+        """
+        Returns whether a client keeps pace with the group: its loss estimate is within --straggler-loss and it has not
+        held the group back for more than --max-lag consecutive generations
+        """
+        return self.loss.get(hostname, 0) <= self.args.straggler_loss \
+            and (self.args.max_lag <= 0 or self.holdouts.get(hostname, 0) <= self.args.max_lag)
+
+    def lagging(self):
+        """
+        Returns the clients to move to the catch-up session: those still incomplete once every healthy client has completed
+        the generation. If no client is healthy, the group waits for all clients as before. No client is moved with
+        --deadline, as the playout deadline already bounds how long the group waits.
+
+        Returns
+        -------
+        A list of client hostnames
+        """
+        if self.expiry is not None:
+            return []
+        healthy = [h for h in self.clients if self.is_healthy(h)]
+        if not healthy or any(self.clients[h] != 4 for h in healthy):
+            return []
+        return [h for h, v in self.clients.items() if v != 4]
+
+    def note_round(self):
+        """
+        Records the clients holding the group back at a repair round, those still incomplete while others have completed,
+        and counts the round
+        """
+        self.repair_rounds += 1
+        incomplete = {h for h, v in self.clients.items() if v != 4}
+        if len(incomplete) < len(self.clients):
+            self.round_holdouts |= incomplete
+
+    def end_generation(self):
+        """
+        Updates the consecutive generation counts of clients holding the group back and resets per generation state. The
+        packets of the generation are released, as the group has moved on and the catch-up session reads its own copy.
+        """
+        first = self.gen_number * self.gen_size
+        for seq in range(first, first + self.gen_size):
+            self.data.pop(seq, None)
+        for hostname in self.clients:
+            self.holdouts[hostname] = self.holdouts.get(hostname, 0) + 1 if hostname in self.round_holdouts else 0
+        self.round_holdouts.clear()
+        self.reported.clear()
+        self.gen_waits.append(self.waited)
+        self.waited = 0
+        self.awaiting = False
+        self.expiry = None
+
+    def start_deadline(self):
+        """
+        Starts the playout deadline of the current generation, --deadline seconds from the start of its turn
+        """
+        self.expiry = time.time() + self.args.deadline if self.args.deadline > 0 else None
+        return True
+
+    def is_expired(self):
+        """
+        Returns whether the playout deadline of the current generation has passed, always False without --deadline
+        """
+        return self.expiry is not None and time.time() >= self.expiry
+
+    def expire(self):
+        """
+        Moves every client on from the current generation once its playout deadline has passed, without repairing it further.
+        The next generation packet carries FLAG_EXPIRED and is sent three times, as clients still missing packets wait for it
+        to deliver what they hold.
+        """
+        for _ in range(3):
+            self.transmit(self.create_packet(5, flags=FLAG_EXPIRED))
+        self.expired += 1
+        return True
+
+    def create_join_ack(self, hostname):
+        """
+        Creates a join acknowledgement for a client, with the client ID in the index field of the header
+
+        Parameters
+        ----------
+        hostname : int
+            The ID of the joining client
+
+        Returns
+        -------
+        A packet containing the header only
+        """
+        return SERVER_HEADER.pack(VERSION, 8, 0, self.session, 0, hostname)
+
+    def join(self, hostname, payload, rtt):
+        """
+        Adds a client to the 'client state matrix' with the capabilities it joined with, and acknowledges the join. The
+        acknowledgement is multi-cast, as clients on one host share an address and port, and carries the client ID.
+
+        Parameters
+        ----------
+        hostname : int
+            The ID of the joining client
+        payload : bytes
+            The capabilities of the client, packed as CAPABILITIES
+        rtt : float
+            The time from announcing the session to the join, in seconds
+        """
+        if len(payload) < CAPABILITIES.size: # Malformed join, dropped
+            return False
+        self.clients[hostname] = 1 # Adding client to state matrix by ID and default state of 1
+        self.reports[hostname] = dict(zip(("peer_repair", "loss", "signatures"), CAPABILITIES.unpack_from(payload)))
+        self.update_rtt(hostname, rtt) # Join round trip time
+        self.transmit(self.create_join_ack(hostname))
+        return True
+
+    def update_rtt(self, hostname, sample):
+        """
+        Adds a round trip time sample to the estimate for a client
+
+        Parameters
+        ----------
+        hostname : int
+            The hostname of the client
+        sample : float
+            The time from sending a packet to the client's reply, in seconds
+        """
+        self.rtts.setdefault(hostname, RttEstimator()).update(sample)
+
+    def timeout(self):
         """
-        Initialises a multi-cast UDP socket with the multi-cast IP and port provided
+        Returns how long to wait for client feedback: the longest retransmission timeout of the clients in the group, so the
+        slowest client is not taken for a lost packet, multiplied by the current back-off and bounded by MAX_RTO
         """
-        self.sock = socket.socket(
-            family=socket.AF_INET, type=socket.SOCK_DGRAM, proto=socket.IPPROTO_UDP)
-        self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 2)
-        self.sock.setblocking(0)
-        return True
+        group = [h for h in self.clients if h not in self.stragglers] or list(self.clients)
+        rto = max((self.rtts[h].timeout() for h in group if h in self.rtts), default=INITIAL_RTO)
+        return min(rto * self.backoff, MAX_RTO)
 
-    def open_file(self):
+    def transmit_control(self, resend=False):
         """
-        Opens the target file to be read as bytes
+        Multi-casts the end generation control packet and times the feedback it prompts. A re-sent control packet doubles the
+        back-off, and feedback after it is not sampled as it may answer either copy (Karn's algorithm).
+
+        Parameters
+        ----------
+        resend : bool, default=False
+            Whether the control packet is re-sent because feedback did not arrive in time
         """
-        if not os.path.isfile(self.args.file_path):
-            print(f"{self.args.file_path} is not a valid file.")
-            sys.exit(1)
+        self.transmit(self.create_packet(3))
+        self.awaiting = True
+        if resend:
+            self.control_resends += 1
+            self.control_time = None
+            if self.timeout() < MAX_RTO:
+                self.backoff *= 2
         else:
-            self.f = open(os.path.expanduser(self.args.file_path), 'rb')
-            enc_file = os.path.expanduser(self.args.file_path).encode()
-            hash_obj = hashlib.sha1(enc_file)
-            self.hex_val = hash_obj.hexdigest()
-            return True
+            self.control_time = time.time()
+            self.sampled.clear()
+        return True
 
-    def get_data(self, seq):
+    def demote(self, hostnames):
         """
-        Reads a packet size of data from the open target file
+        Moves clients from the group to the uni-cast catch-up session at the current generation, so the group no longer waits for them
 
         Parameters
         ----------
-        seq : int
-            The current sequence number
+        hostnames : list
+            The hostnames of the clients to move
+        """
+        for hostname in hostnames:
+            del self.clients[hostname]
+            self.stragglers[hostname] = self.gen_number
+            self.transmit(self.create_packet(3, gen=self.gen_number), self.catch_up_address(hostname)) # Prompt for its missing packets
 
-        Returns
-        -------
-        The packet-length of data for the current sequence
+    def catch_up_address(self, hostname):
         """
+        Returns the address to send catch-up packets for a client to: the client itself, or the multi-cast group if it shares
+        its address with another client. Clients in the group ignore packets of generations they have already completed.
 
-        self.data[seq] = self.f.read(self.packet_bytes)
-        return self.data[seq]
+        Parameters
+        ----------
+        hostname : int
+            The hostname of the client
+        """
+        return self.addresses[hostname] if hostname in self.unicast_clients() else None
 
-    def create_packet(self, packet_type, seq=0, payload=b''):
+    def prompt_stragglers(self):
         """
-        Creates a packet header containing:
-            packet_type
-            total_bytes
-            packet_bytes
-            total_packets
-            seq
-        
-        If a payload (data) is included, this is appended to the header.
+        Re-sends the end generation control packet to every client in the catch-up session, in case it was lost
+        """
+        for hostname, gen in self.stragglers.items():
+            self.transmit(self.create_packet(3, gen=gen), self.catch_up_address(hostname))
+
+    def finish_catch_up(self, hostname):
+        """
+        Moves a client in the catch-up session on to its next generation once it reports its generation complete. Rejoins the group
+        when it reaches the current generation, or leaves the catch-up session once it has the whole file.
 
         Parameters
         ----------
-        packet_type : int
-            An integer to represent the packet type:
-                1: Engineering
-                2: Data
-                3: End generation
-                5: Moving to next generation
-                6: File transfer complete
+        hostname : int
+            The hostname of the client
+        """
+        addr = self.catch_up_address(hostname)
+        gen = self.stragglers[hostname]
+        self.transmit(self.create_packet(5, gen=gen), addr)
+        gen = self.next_planned(gen)
+        if gen >= self.num_gens:
+            del self.stragglers[hostname]
+            return
+        if gen == self.gen_number and not self.finished:
+            del self.stragglers[hostname]
+            self.clients[hostname] = 1
+            self.holdouts[hostname] = 0
+        else:
+            self.stragglers[hostname] = gen
+        self.transmit(self.create_packet(3, gen=gen), addr)
 
-        seq : int, default=0
-            An integer to represent the sequence number of the data payload. Default is 0 if not a data packet
+    def catch_up_packets(self, gen):
+        """
+        Returns the packets of a generation for the catch-up session, held in the data dictionary while the group is still
+        on it and otherwise read again from the file and compressed as the read-ahead stage would. Generations no client in
+        the catch-up session is on are released.
 
-        payload : bytes, default=b''
-            A byte stream of data representing a single packet of bytes. Default is empty if not a data packet
+        Parameters
+        ----------
+        gen : int
+            The generation number
 
         Returns
         -------
-        A packet containing header and payload
+        A list of the packets of the generation, fewer than the generation size if it is compressed
         """
+        first = gen * self.gen_size
+        if first in self.data:
+            return [self.data[seq] for seq in range(first, first + self.layout(gen)[0])]
+        if gen not in self.catch_up_data:
+            block_bytes = self.gen_size * self.packet_bytes
+            read = pread(self.f, block_bytes, gen * block_bytes)
+            buf = bytearray(block_bytes)
+            buf[:len(read)] = read
+            length, codec = pack_generation(buf, len(read), self.codec, self.packet_bytes)
+            packets = -(-length // self.packet_bytes) if codec else self.gen_size
+            self.layouts.setdefault(gen, (packets, codec, length))
+            view = memoryview(buf)[:length]
+            self.catch_up_data[gen] = [bytes(view[index * self.packet_bytes:(index + 1) * self.packet_bytes]) for index in range(packets)]
+        for old in [g for g in self.catch_up_data if g != gen and g not in self.stragglers.values()]:
+            del self.catch_up_data[old] # No longer needed by a client in the catch-up session
+        return self.catch_up_data[gen]
+
+    def catch_up(self, packet_type, payload, hostname):
+        """
+        Serves feedback from a client in the catch-up session by uni-cast, at the client's own pace
 
-        header = bytearray(18)
-        struct.pack_into( # Struct used to create the fixed length header
-            '<HIIII',
-            header,
-            0,
-            packet_type,
-            self.total_bytes,
-            self.packet_bytes,
-            self.total_packets,
-            seq
-        )
-        packet = header + payload # Attaching payload to header is a simple concatenation
-        return packet
-
-    def transmit(self, packet):
+        Parameters
+        ----------
+        packet_type : int
+            The type of feedback packet, 3 for missing packets or 4 for generation complete
+        payload : bytes
+            The missing packet bitmap of a type 3 packet
+        hostname : int
+            The hostname of the client
+        """
+        gen = self.stragglers[hostname]
+        addr = self.catch_up_address(hostname)
+        if packet_type == 3:
+            packets = self.catch_up_packets(gen)
+            for seq in self.missing_packets(payload, gen):
+                self.transmit(self.create_packet(2, seq, packets[seq - gen * self.gen_size], FLAG_REPAIR), addr)
+                self.tx += 1
+                self.catch_up_tx += 1
+            self.transmit(self.create_packet(3, gen=gen), addr)
+        elif packet_type == 4:
+            self.finish_catch_up(hostname)
+
+    def transmit(self, packet, address=None):
         """
         Transmits a packet via the multi-cast socket
 
@@ -226,14 +2175,16 @@ class Server(SmartUDP):
         ----------
         packet : bytes
             Bytes representing a single packet from the create_packet method
+        address : tuple, optional
+            The address of a single client to uni-cast to. Defaults to the multi-cast group
         """
 
         ready = select.select([], [self.sock], [], 1)
         if ready[1]:
-            self.sock.sendto(packet, self.address)
+            self.sock.sendto(packet, address or self.address)
         return True
 
-    def receive(self):
+    def receive(self, timeout=None):
         """
         Receives and processes packets from clients
 
@@ -248,16 +2199,49 @@ class Server(SmartUDP):
         symbol : bytes
             The payload of the received packet
 
-        hostname : str
+        hostname : int
             The hostname of the source client, for updating the client dictionary
+
+        Feedback from another session, or for a generation other than the one the client is expected to be on, is dropped.
+        The first feedback from each client to a control packet is timed for its round trip time estimate.
+
+        Parameters
+        ----------
+        timeout : float, optional
+            The time to wait for a packet in seconds. Defaults to the adaptive feedback timeout. The wait never runs past
+            the playout deadline of the current generation
         """
 
+        start = time.time()
+        end = start + (self.timeout() if timeout is None else timeout)
+        if self.expiry is not None: # Return in time to move on at the playout deadline
+            end = min(end, max(self.expiry, start))
         while True:
-            ready = select.select([self.sock], [], [], 1)
+            ready = select.select([self.sock], [], [], max(end - time.time(), 0))
             if ready[0]:
-                packet = self.sock.recv(self.packet_bytes)
-                symbol = bytearray(packet[6:])
-                packet_type, hostname = struct.unpack_from('<HI', packet) # Struct unpacks the header
+                packet, addr = self.sock.recvfrom(MAX_DATAGRAM)
+                if len(packet) < CLIENT_HEADER.size:
+                    continue
+                symbol = bytearray(packet[CLIENT_HEADER.size:])
+                version, packet_type, session, hostname, gen = CLIENT_HEADER.unpack_from(packet) # Struct unpacks the header
+                if version != VERSION or session != self.session:
+                    continue
+                self.addresses[hostname] = addr
+                self.rx_gen = gen
+                expected = self.stragglers.get(hostname, self.gen_number)
+                if packet_type in (3, 4) and gen != expected: # Stale feedback for another generation
+                    continue
+                if packet_type == 9: # Signatures of the client's existing copy, sent ahead of its join
+                    self.add_signatures(hostname, gen, symbol)
+                    continue
+                if packet_type == 1 and hostname in self.clients: # Repeated join after a lost acknowledgement
+                    self.transmit(self.create_join_ack(hostname))
+                    continue
+                if packet_type in (3, 4) and hostname not in self.stragglers and hostname not in self.sampled:
+                    self.sampled.add(hostname)
+                    self.backoff = 1
+                    if self.control_time is not None:
+                        self.update_rtt(hostname, time.time() - self.control_time)
                 # Engineering packet
                 if packet_type == 1:
                     break
@@ -268,7 +2252,10 @@ class Server(SmartUDP):
                 elif packet_type == 4:
                     break
             else:
-                return 0, 0, 0
+                packet_type, symbol, hostname = 0, 0, 0
+                break
+        if self.awaiting:
+            self.waited += time.time() - start
         return packet_type, symbol, hostname
 
 
@@ -278,31 +2265,128 @@ class Client(SmartUDP):
     ...
     Attributes
     ----------
-    hostname : str
-        a string containing the client hostname
+    hostname : int
+        an integer ID identifying the client in feedback, random unless set with --hostname
     total_rx : int
         an integer to store the total number of received packets
     erased : int
         an integer to store the number of missed packets
-    missing : list
-        a list to store the sequence numbers of missed packets
+    received : bytearray
+        a bitmap with one bit per packet of the current generation, set when the packet is received
+    ahead : dict
+        a dictionary storing generation number keys with the received bitmaps of later generations, whose packets arrive
+        while this client is still catching up
+    server : tuple
+        the address of the server, learnt from the engineering packet
+    address : tuple
+        a tuple containing the IP address and port information for the multi-cast group, for peer repair
+    peer_timers : dict
+        a dictionary storing generation number keys with (deadline, bitmap) values for peer repair requests this client will answer
+    peer_tx : int
+        an integer storing the number of repair packets sent to peers
+    writer : FileWriter
+        the writer stage flushing completed generations to the output file
+    missing : int
+        an integer to store the number of packets of the current generation not yet received
     erasure : float
         a float representing the chance of packet erasure as a percentage
+    bad : bool
+        a boolean set while the burst loss model is in its bad state
     gen_size : int
         an integer representing the generation size
     num_gens : int
         an integer representing the number of generations to receive the file
-
+    rx_gen : int
+        an integer storing the generation number of the last packet received
+
+    rtt : RttEstimator
+        the estimate of the time the server takes to answer feedback, from which the receive timeout is set
+    backoff : int
+        an integer multiplying the receive timeout, doubled each time nothing is received in time
+    feedback_time : float
+        a float storing when unanswered feedback was first sent to the server, None once answered
+    feedback_resent : bool
+        a boolean set when unanswered feedback is sent again, so its answer is not timed (Karn's algorithm)
+    fec : ParityCode
+        the parity code advertised by the server, None if the server sends no parity
+    parity : dict
+        a dictionary storing generation number keys with dictionaries of parity row keys and parity packet values
+    recovered : int
+        an integer storing the number of packets recovered from parity
+    packets : int
+        an integer storing the number of packets of the current generation, fewer than the generation size if it is compressed
+    layouts : dict
+        a dictionary storing generation number keys with the (packets, codec, compressed length) layout from their control packet
+    basis : file
+        the existing copy of the file generations unchanged by a delta transfer are taken from, None without --basis
+    basis_path : str
+        the path the basis was moved to when it is the output file itself, removed once the transfer is complete
+    digests : bytes
+        the signatures of the generations of the basis, computed once the generation size is known
+    from_basis : int
+        an integer storing the number of generations taken from the basis
+    tree : bool
+        a boolean set when the server sends a directory tree, written under the output path as a directory
+    carousel : bool
+        a boolean set when the server runs a carousel, which this client listens to without joining or sending feedback
+    done : set
+        a set of the generations of a carousel written to the output file
+    cycle_start : int
+        an integer storing the position in the carousel, in generations, of the first announcement received
+    cycle_position : int
+        an integer storing the position in the carousel, in generations, of the latest announcement received
+    codec : int
+        an integer representing the codec the server compresses generations with, 0 if compression is off
+    expired : int
+        an integer storing the number of generations delivered with gaps at their playout deadline
+    gaps : int
+        an integer storing the number of packets replaced by zeros in generations delivered at their playout deadline
     Methods
     -------
     connection()
         Creates UDP network socket
+    erase()
+        Returns whether a received packet is simulated as lost
     create_packet(packet_type, seq=0, payload=b'')
         Creates a packet with header and data
+    signature_packets()
+        Returns the packets carrying the generation signatures of the basis
+    skip_to(gen)
+        Takes the generations skipped by a delta transfer from the basis
     set_generation()
-        Sets up the missing list for the next generation sequence numbers
+        Sets up the received bitmap for the next generation
+    mark(gen, index)
+        Marks a packet as received
+    set_layout(packets, codec, length)
+        Sets the layout of the current generation from its control packet
+    recover()
+        Recovers lost packets of the current generation from its parity packets
+    collect_generation(gen)
+        Writes a generation of a carousel once all of its packets are held
+    expire_generation()
+        Delivers the current generation with its gaps once its playout deadline has passed
+    cycles()
+        Returns the number of carousel cycles listened to
+    nack()
+        Encodes the missing packets of the current generation that parity cannot recover as a bitmap
+    capabilities()
+        Returns the serialised capabilities this client joins with
+    has_generation(gen)
+        Returns whether this client holds every packet of a generation
+    create_peer_packet(packet_type, gen, index, payload=b'', flags=0)
+        Creates a packet for peer clients with the server header layout
+    request_peers()
+        Multi-casts the missing packets of the current generation to peers and receives their repairs
+    schedule_peer_repair(gen, bitmap)
+        Schedules an answer to a peer repair request after a random backoff
+    answer_peers()
+        Sends the repairs for peer requests whose backoff has expired
+    open_file()
+        Opens the output file and starts the writer stage
+    flush_generation(gen)
+        Hands a completed generation to the writer stage and releases it
     save_file()
-        Opens the output file and writes all received data to it
+        Waits for all received data to be written and closes the output file
     transmit(packet)
         Transmits packet via socket
     receive()
@@ -311,13 +2395,53 @@ class Client(SmartUDP):
 
     def __init__(self, args):
         SmartUDP.__init__(self, args)
-        self.hostname = args.hostname
+        self.hostname = random.getrandbits(32) if args.hostname is None else args.hostname
         self.total_rx = 0
         self.erased = 0
-        self.missing = []
+        self.received = bytearray()
+        self.ahead = {}
+        self.server = None
+        self.address = (self.mcast_grp, self.mcast_port)
+        self.peer_timers = {}
+        self.peer_tx = 0
+        self.writer = None
+        self.rtt = RttEstimator()
+        self.backoff = 1
+        self.feedback_time = None
+        self.feedback_resent = False
+        self.fec = None
+        self.parity = {}
+        self.recovered = 0
+        self.packets = 0
+        self.layouts = {}
+        self.missing = 0
         self.erasure = random.uniform(args.erasurelow, args.erasurehigh)
+        self.bad = False
         self.gen_size = args.gen_size
         self.num_gens = 0
+        self.rx_gen = 0
+        self.packet_bytes = MAX_DATAGRAM - SERVER_HEADER.size # Replaced by the advertised value on the engineering packet
+        self.basis = None
+        self.basis_path = None
+        self.digests = b''
+        self.from_basis = 0
+        self.tree = False
+        self.carousel = False
+        self.done = set()
+        self.cycle_start = None
+        self.cycle_position = 0
+        self.codec = 0
+        self.expired = 0
+        self.gaps = 0
+        if args.basis:
+            if not os.path.isfile(args.basis):
+                print(f"{args.basis} is not a valid file.")
+                sys.exit(1)
+            path = args.basis
+            if os.path.abspath(path) == os.path.abspath(args.output_file): # Kept aside, as the output file is truncated
+                self.basis_path = path = args.output_file + ".basis"
+                os.replace(args.output_file, path)
+            self.basis = open(path, 'rb')
 
     def connection(self):
         """
@@ -334,11 +2458,29 @@ class Client(SmartUDP):
         self.sock.setblocking(0)
         return True
 
+    def erase(self):
+        """
+        Returns whether a received packet is simulated as lost. Losses are independent at the client's erasure rate, or with
+        --burst-length they follow a two-state Gilbert-Elliott model: every packet is lost in the bad state, which lasts
+        --burst-length packets on average, and the good state is left at the rate that keeps the mean loss at the erasure rate.
+        """
+        if self.args.burst_length <= 1:
+            return random.uniform(0, 100) <= self.erasure
+        loss = self.erasure / 100
+        if self.bad:
+            self.bad = random.random() >= 1 / self.args.burst_length
+        else:
+            self.bad = loss >= 1 or random.random() < loss / (self.args.burst_length * (1 - loss))
+        return self.bad
+
     def create_packet(self, packet_type, payload=b''):
         """
         Creates a packet header containing:
+            version
             packet_type
+            session
             hostname
+            generation
         
         If a payload (data) is included, this is appended to the header.
 
@@ -351,40 +2493,356 @@ class Client(SmartUDP):
                 4: Generation complete
 
         payload : bytes, default=b''
-            A byte stream of data representing a serialised version of missing packets list. Default is empty if not a data packet
+            A byte stream of data representing the bitmap of missing packets from nack(). Default is empty if not a data packet
 
         Returns
         -------
         A packet containing header and payload
         """
 
-        header = bytearray(6)
-        struct.pack_into(
-            '<HI',
-            header,
-            0,
+        header = CLIENT_HEADER.pack(
+            VERSION,
             packet_type,
-            self.hostname
+            self.session,
+            self.hostname,
+            self.gen_number
         )
         packet = header + payload
         return packet
 
+    def signature_packets(self):
+        """
+        Returns the packets carrying the signature of each generation of the basis, sent ahead of the join so the server
+        skips generations this client already holds. The basis is only signed once, as its generation size is advertised.
+
+        Returns
+        -------
+        A list of packets, with the first generation they sign in the generation field of the header
+        """
+        if self.basis is None or self.tree: # A tree is sent whole
+            return []
+        block_bytes = self.gen_size * self.packet_bytes
+        if len(self.digests) != self.num_gens * SIGNATURE_BYTES:
+            self.digests = b''.join(signature(os.pread(self.basis.fileno(), block_bytes, gen * block_bytes), block_bytes)
+                                    for gen in range(self.num_gens))
+        per_packet = self.packet_bytes // SIGNATURE_BYTES
+        return [CLIENT_HEADER.pack(VERSION, 9, self.session, self.hostname, first)
+                + self.digests[first * SIGNATURE_BYTES:(first + per_packet) * SIGNATURE_BYTES]
+                for first in range(0, self.num_gens, per_packet)]
+
+    def skip_to(self, gen):
+        """
+        Moves on to a later generation when the server has skipped the generations before it, as they are unchanged from
+        the basis. The skipped generations are read from the basis and handed to the writer stage.
+
+        Parameters
+        ----------
+        gen : int
+            The generation the server moved on to, or the number of generations if it skipped the rest of the file
+        """
+        block_bytes = self.gen_size * self.packet_bytes
+        for skipped in range(self.gen_number, gen):
+            self.writer.write(skipped, [os.pread(self.basis.fileno(), block_bytes, skipped * block_bytes).ljust(block_bytes, b'\0')])
+            self.from_basis += 1
+        self.gen_number = gen
+        if gen < self.num_gens:
+            self.set_generation()
+        else:
+            self.missing = 0
+        return True
+
     def set_generation(self):
         """
-        Configures the missing packet list with the sequence numbers of the next generation
+        Sets up the received bitmap and missing count for the next generation, keeping any of its packets already received
+        """
+        self.received = self.ahead.pop(self.gen_number, None) or bytearray(-(-self.gen_size // 8))
+        self.packets = self.gen_size
+        self.missing = self.gen_size - int.from_bytes(self.received, 'little').bit_count()
+        return True
+
+    def set_layout(self, packets, codec, length):
+        """
+        Sets the layout of the current generation from its control packet. A compressed generation has fewer packets than the
+        generation size, so the missing count is taken over its packets only.
+
+        Parameters
+        ----------
+        packets : int
+            The number of packets of the generation
+        codec : int
+            The codec the generation is compressed with, 0 if it is not compressed
+        length : int
+            The number of bytes of compressed data
+        """
+        self.layouts[self.gen_number] = (packets, codec, length)
+        if packets != self.packets:
+            self.packets = packets
+            self.missing = packets - (int.from_bytes(self.received, 'little') & ((1 << packets) - 1)).bit_count()
+        return True
+
+    def mark(self, gen, index):
+        """
+        Marks a packet as received in constant time
+
+        Parameters
+        ----------
+        gen : int
+            The generation of the packet, the current generation or a later one
+        index : int
+            The position of the packet within the generation
+
+        Returns
+        -------
+        True if the packet had not been received before
+        """
+        if gen == self.gen_number:
+            received = self.received
+        else:
+            received = self.ahead.setdefault(gen, bytearray(-(-self.gen_size // 8)))
+        byte, bit = index >> 3, 1 << (index & 7)
+        if received[byte] & bit:
+            return False
+        received[byte] |= bit
+        if gen == self.gen_number:
+            self.missing -= 1
+        return True
+
+    def recover(self):
+        """
+        Recovers lost packets of the current generation from its parity packets, marking them as received
+
+        Returns
+        -------
+        The number of packets recovered
+        """
+        parity = self.parity.get(self.gen_number)
+        if self.fec is None or not self.missing or not parity:
+            return 0
+        first = self.gen_number * self.gen_size
+        # Positions past the end of a compressed generation are held as empty packets, as the server encoded them
+        held = {i: self.data.get(first + i, b'') for i in range(self.gen_size) if i >= self.packets or first + i in self.data}
+        count = 0
+        for index, payload in self.fec.recover(held, parity).items():
+            if self.mark(self.gen_number, index):
+                self.data[first + index] = payload
+                count += 1
+        self.recovered += count
+        return count
+
+    def collect_generation(self, gen):
+        """
+        Writes a generation of a carousel to the output file once all of its packets are held, at the end of the generation
+        in any cycle. Lost packets are recovered from the parity packets held where possible, and anything still missing is
+        waited for in the next cycle, so generations complete in any order.
+
+        Parameters
+        ----------
+        gen : int
+            The generation number
+
+        Returns
+        -------
+        True if the generation was written
+        """
+        if gen in self.done or gen not in self.layouts:
+            return False
+        packets = self.layouts[gen][0]
+        first = gen * self.gen_size
+        # Positions past the end of a compressed generation are held as empty packets, as the server encoded them
+        held = {i: self.data.get(first + i, b'') for i in range(self.gen_size) if i >= packets or first + i in self.data}
+        if len(held) < self.gen_size and self.fec is not None and gen in self.parity:
+            for index, payload in self.fec.recover(held, self.parity[gen]).items():
+                self.data[first + index] = held[index] = payload
+                self.recovered += 1
+        if len(held) < self.gen_size:
+            return False
+        self.flush_generation(gen)
+        self.done.add(gen)
+        return True
+
+    def expire_generation(self):
+        """
+        Delivers the current generation once the server has moved on from it at its playout deadline. Lost packets that
+        parity cannot recover are replaced by zeros, so the output keeps its length and later data stays in place. A
+        compressed generation cannot be decompressed with packets missing, so it is delivered as zeros at its full size.
+        """
+        self.recover()
+        gen = self.gen_number
+        first = gen * self.gen_size
+        packets, codec, length = self.layouts.get(gen, (self.packets, self.codec, 0)) # Taken as compressed if unknown
+        if codec:
+            self.layouts[gen] = (self.gen_size, 0, 0)
+            for seq in range(first, first + self.gen_size):
+                self.data[seq] = bytes(self.packet_bytes)
+        else:
+            for seq in range(first, first + packets):
+                self.data.setdefault(seq, bytes(self.packet_bytes))
+        self.gaps += self.missing
+        self.expired += 1
+        self.flush_generation(gen)
+        self.gen_number += 1
+        if self.gen_number < self.num_gens:
+            self.set_generation()
+        else:
+            self.missing = 0
+        return True
+
+    def cycles(self):
+        """
+        Returns the number of carousel cycles this client listened to, from the generation it joined at to the last
+        generation announced
+
+        Returns
+        -------
+        The number of cycles as a float
+        """
+        return (self.cycle_position - self.cycle_start + 1) / max(self.num_gens, 1) if self.cycle_start is not None else 0
+
+    def nack(self):
+        """
+        Encodes the missing packets of the current generation as a bitmap, one bit per packet set when missing. Packets the
+        parity packets held can recover once the rest arrive are left out, so only the excess is re-sent.
+
+        Returns
+        -------
+        The bitmap as bytes, for the payload of a missing packets packet
+        """
+        mask = (1 << self.packets) - 1
+        missing = ~int.from_bytes(self.received, 'little') & mask
+        if self.fec is not None and missing:
+            indices = bitmap_indices(missing.to_bytes(len(self.received), 'little'))
+            missing = sum(1 << i for i in self.fec.excess(indices, self.parity.get(self.gen_number, {})))
+        return missing.to_bytes(len(self.received), 'little')
+
+    def capabilities(self):
+        """
+        Returns the capabilities this client joins with: its peer repair mode, its erasure rate, and the generation size in
+        bytes its basis was signed with, 0 without a basis
+
+        Returns
+        -------
+        The capabilities packed as CAPABILITIES
+        """
+        return CAPABILITIES.pack(self.args.peer_repair, self.erasure / 100, self.gen_size * self.packet_bytes if self.basis and not self.tree else 0)
+
+    def has_generation(self, gen):
+        """
+        Returns whether this client holds every packet of a generation, and so can answer peer repair requests for it
+
+        Parameters
+        ----------
+        gen : int
+            The generation number
+        """
+        if gen == self.gen_number:
+            return self.missing == 0
+        return self.gen_number - PEER_HISTORY <= gen < self.gen_number # Older generations have been released
+
+    def create_peer_packet(self, packet_type, gen, index, payload=b'', flags=0):
+        """
+        Creates a packet for peer clients, using the same header layout as packets from the server so peers handle them alike
+
+        Parameters
+        ----------
+        packet_type : int
+            An integer to represent the packet type:
+                2: Data (peer repair)
+                7: Peer repair request
+        gen : int
+            The generation number
+        index : int
+            The position of the packet within the generation, or the hostname of the requesting client for a repair request
+        payload : bytes, default=b''
+            The packet data, or the missing packet bitmap for a repair request
+        flags : int, default=0
+            Bit flags for the packet, such as FLAG_PEER
+
+        Returns
+        -------
+        A packet containing header and payload
+        """
+        return SERVER_HEADER.pack(VERSION, packet_type, flags, self.session, gen, index) + payload
+
+    def request_peers(self):
+        """
+        Multi-casts the missing packet bitmap of the current generation to peer clients, then receives their repairs for up to
+        PEER_WINDOW seconds, so only packets no peer could supply are reported to the server
+        """
+        self.transmit(self.create_peer_packet(7, self.gen_number, self.hostname, self.nack()), self.address)
+        end = time.time() + PEER_WINDOW
+        while self.missing and time.time() < end:
+            self.receive(end - time.time())
+        return True
+
+    def schedule_peer_repair(self, gen, bitmap):
+        """
+        Schedules an answer to a peer repair request after a random backoff, merging it with any pending request for the same
+        generation. The answer is suppressed if another peer is heard repairing the generation first.
+
+        Parameters
+        ----------
+        gen : int
+            The generation number
+        bitmap : bytes
+            The missing packet bitmap of the requesting peer
         """
-        self.missing = list(range(self.gen_number*self.gen_size,
-                            self.gen_number*self.gen_size+self.gen_size))
+        if not self.has_generation(gen):
+            return
+        deadline, pending = self.peer_timers.get(gen, (time.time() + random.uniform(0, PEER_BACKOFF), 0))
+        self.peer_timers[gen] = (deadline, pending | int.from_bytes(bitmap, 'little'))
+
+    def answer_peers(self):
+        """
+        Multi-casts the requested packets for every peer repair request whose backoff has expired
+        """
+        now = time.time()
+        for gen, (deadline, bits) in list(self.peer_timers.items()):
+            if deadline > now:
+                continue
+            del self.peer_timers[gen]
+            for index in bitmap_indices(bits.to_bytes(-(-self.gen_size // 8), 'little')):
+                payload = self.data.get(gen * self.gen_size + index)
+                if payload is not None:
+                    self.transmit(self.create_peer_packet(2, gen, index, payload, FLAG_PEER | FLAG_REPAIR), self.address)
+                    self.peer_tx += 1
+
+    def open_file(self):
+        """
+        Opens the output file, or the output directory of a tree, and starts the writer stage, once the file size is known
+        from the engineering packet
+        """
+        self.writer = (TreeWriter if self.tree else FileWriter)(self.args.output_file, self.total_bytes, self.args.fsync)
+        return True
+
+    def flush_generation(self, gen):
+        """
+        Hands the packets of a completed generation to the writer stage and releases them, keeping the last PEER_HISTORY
+        generations in peer repair mode to answer peers still receiving them
+
+        Parameters
+        ----------
+        gen : int
+            The generation number
+        """
+        first = gen * self.gen_size
+        packets, codec, length = self.layouts.pop(gen, (self.gen_size, 0, 0))
+        self.writer.write(gen, [self.data[seq] for seq in range(first, first + packets)], codec, length)
+        self.parity.pop(gen, None)
+        if self.args.peer_repair and not self.carousel: # Carousel generations complete out of order
+            gen -= PEER_HISTORY
+        for seq in range(gen * self.gen_size, (gen + 1) * self.gen_size):
+            self.data.pop(seq, None)
         return True
 
     def save_file(self):
         """
-        Opens the output file for writing bytes and writes all received data to the file before closing.
+        Waits for the writer stage to write all received data and closes the output file, removing a basis kept aside
         """
-        f = open(self.args.output_file, "wb")
-        for k in range(len(self.data)):
-            f.write(self.data[k])
-        f.close()
+        self.writer.close()
+        if self.basis is not None:
+            self.basis.close()
+            if self.basis_path:
+                os.remove(self.basis_path)
         enc_file = self.args.output_file.encode()
         hash_obj = hashlib.sha1(enc_file)
         self.hex_val = hash_obj.hexdigest()
@@ -392,13 +2850,18 @@ class Client(SmartUDP):
 
     def transmit(self, packet, address):
         """
-        Transmits a packet via uni-cast to the server
+        Transmits a packet via uni-cast to the server. Feedback is timed until the server answers it.
 
         Parameters
         ----------
         packet : bytes
             Bytes representing a single packet from the create_packet method
         """
+        if address == self.server and CLIENT_HEADER.unpack_from(packet)[1] in (3, 4):
+            if self.feedback_time is None:
+                self.feedback_time = time.time()
+            else:
+                self.feedback_resent = True
         while True:
             ready = select.select([], [self.sock], [], 1)
             if ready[1]:
@@ -406,9 +2869,16 @@ class Client(SmartUDP):
                 break
         return True
 
-    def receive(self):
+    def receive(self, timeout=None):
         """
-        Receives and processes packets from the server
+        Receives and processes packets from the server, and from peer clients in peer repair mode. Pending peer repair answers are
+        sent as their backoff expires.
+
+        Parameters
+        ----------
+        timeout : float, optional
+            The time to wait for a control packet in seconds. Defaults to the adaptive timeout, which backs off while nothing
+            is received
 
         Returns
         -------
@@ -422,40 +2892,107 @@ class Client(SmartUDP):
 
         addr : str
             The hostname of the server, for uni-cast responses
+
+        Packets of another wire format version or session are dropped, as are all packets before the engineering packet.
         """
 
+        adaptive = timeout is None
+        if adaptive:
+            timeout = min(self.rtt.timeout() * self.backoff, MAX_RTO)
+        end = time.time() + timeout
         while True:
-            ready = select.select([self.sock], [], [], 1)
+            self.answer_peers()
+            wait = end - time.time()
+            if self.peer_timers:
+                wait = min(wait, min(d for d, _ in self.peer_timers.values()) - time.time())
+            ready = select.select([self.sock], [], [], max(wait, 0))
             if ready[0]:
-                packet, addr = self.sock.recvfrom(self.packet_bytes + 18)
-                symbol = bytearray(packet[18:])
-                packet_type, self.total_bytes, self.packet_bytes, self.total_packets, seq = struct.unpack_from(
-                    '<HIIII', packet)
+                packet, addr = self.sock.recvfrom(self.packet_bytes + SERVER_HEADER.size)
+                if len(packet) < SERVER_HEADER.size:
+                    continue
+                version, packet_type, flags, session, self.rx_gen, index = SERVER_HEADER.unpack_from(packet)
+                if version != VERSION:
+                    continue
+                symbol = bytearray(packet[SERVER_HEADER.size:])
                 # Engineering packet
                 if packet_type == 1:
+                    self.session = session
+                    self.server = addr
+                    self.total_bytes, self.packet_bytes, self.gen_size, scheme, parity, codec, tree = ENGINEERING.unpack_from(symbol)
+                    self.tree = bool(tree)
+                    self.carousel = bool(flags & FLAG_CAROUSEL)
+                    self.codec = codec
+                    if codec == CODECS["zstd"] and zstandard is None:
+                        print("The server compresses with zstd, which requires the zstandard package.")
+                        sys.exit(1)
+                    self.total_packets = self.total_bytes // self.packet_bytes + 1
                     self.num_gens = (-(-self.total_packets // self.gen_size))
-                    if self.total_packets < self.gen_size:
-                        self.gen_size = self.total_packets
+                    if scheme and self.fec is None:
+                        self.fec = ParityCode(scheme, self.gen_size, parity, self.packet_bytes, self.carousel)
+                    if self.carousel: # Position in the carousel, from the cycle and generation announced
+                        self.cycle_position = index * self.num_gens + self.rx_gen
+                        if self.cycle_start is None:
+                            self.cycle_start = self.cycle_position
                     return packet_type, addr
+                elif session != self.session:
+                    continue
+                self.backoff = 1
+                # Time the answer to feedback: a repair or control packet from the server for the generation
+                if self.feedback_time is not None and self.rx_gen == self.gen_number and not flags & FLAG_PEER \
+                        and (packet_type in (3, 5) or flags & FLAG_REPAIR):
+                    if not self.feedback_resent:
+                        self.rtt.update(time.time() - self.feedback_time)
+                    self.feedback_time = None
+                    self.feedback_resent = False
                 # Data received
-                elif packet_type == 2:
+                if packet_type == 2:
+                    if flags & FLAG_PEER:
+                        self.peer_timers.pop(self.rx_gen, None) # Another peer is repairing this generation
                     self.total_rx += 1
-                    if random.uniform(0, 100) > self.erasure:
-                        if seq in self.missing:
-                            self.data[seq] = symbol
-                            self.missing.remove(seq)
+                    if not self.erase():
+                        if flags & FLAG_PARITY: # Parity packet, kept to recover losses at the end of the generation
+                            if (self.rx_gen not in self.done if self.carousel else self.received and self.rx_gen >= self.gen_number) \
+                                    and self.fec is not None and index < self.fec.rows:
+                                self.parity.setdefault(self.rx_gen, {})[index] = symbol
+                        elif self.carousel: # Kept until the generation is complete, in this cycle or a later one
+                            if self.rx_gen not in self.done and index < self.gen_size:
+                                self.data.setdefault(self.rx_gen * self.gen_size + index, symbol)
+                        elif self.received and self.rx_gen >= self.gen_number and index < self.gen_size and self.mark(self.rx_gen, index):
+                            self.data[self.rx_gen * self.gen_size + index] = symbol
                     else:
                         self.erased += 1
 
+                # Join acknowledgement
+                elif packet_type == 8:
+                    if index == self.hostname:
+                        break
+                # Peer repair request
+                elif packet_type == 7:
+                    if self.args.peer_repair and index != self.hostname:
+                        self.schedule_peer_repair(self.rx_gen, symbol)
             # Initial send complete, request re-send
                 elif packet_type == 3:
+                    if self.basis and self.received and self.gen_number < self.rx_gen \
+                            and SKIPPED.unpack_from(symbol, LAYOUT.size)[0] <= self.gen_number:
+                        self.skip_to(self.rx_gen) # Generations unchanged from the basis were skipped
+                    if self.received and self.rx_gen == self.gen_number:
+                        self.set_layout(*LAYOUT.unpack_from(symbol))
+                    elif self.carousel and self.rx_gen not in self.done:
+                        self.layouts[self.rx_gen] = LAYOUT.unpack_from(symbol)
                     break
-                # File complete
+                # Generation complete, or its playout deadline passed while packets are still missing
                 elif packet_type == 5:
+                    if flags & FLAG_EXPIRED and self.received and self.rx_gen == self.gen_number and self.missing:
+                        self.expire_generation()
                     break
                 elif packet_type == 6:
+                    if self.basis and self.received and self.gen_number < self.num_gens \
+                            and SKIPPED.unpack_from(symbol)[0] <= self.gen_number:
+                        self.skip_to(self.num_gens)
                     break
-            else:
+            elif time.time() >= end:
+                if adaptive and timeout < MAX_RTO:
+                    self.backoff *= 2
                 return 0, 0
         return packet_type, addr
 
@@ -467,10 +3004,17 @@ def arguments():
     Parameters
     ----------
     --file-path : str
-        The path to the file which should be sent
+        The path to the file which should be sent, or a directory whose whole tree is sent. A tree is sent as a manifest
+        followed by its files packed back to back, so small files share generations
 
     --output-file : str
-        The path to where the received file should be saved
+        The path to where the received file should be saved, or the directory a tree is written to. A named pipe is
+        written as it is read, and "-" writes the received data to stdout, with progress and statistics on stderr
+
+    --basis : str
+        The path to an existing copy of the file, such as the previous version, for a delta transfer. Its generation
+        signatures are sent when joining, the server only sends generations that differ, and the others are taken from the
+        basis. It may be the output file itself
 
     --ip : str
         The multi-cast group IP address
@@ -479,14 +3023,23 @@ def arguments():
         The multi-cast port
 
     --packet-size : int
-        The desired packet size in bytes
+        The desired packet payload size in bytes
+        Default is derived from the MTU
+
+    --mtu : int
+        The path MTU in bytes
+        Default is discovered from the interface used to reach the multi-cast group
 
     --gen-size : int
         The desired number of packets per generation
 
-    --hostname : str
-        The hostname of the client
-        Default is the actual hostname, but in virtual environments a unique hostname must be assigned per client
+    --hostname : int
+        The 32-bit ID of the client
+        Default is a random ID chosen when the client starts
+
+    --expect-clients : int
+        The number of clients the server waits for before starting the transfer
+        Default is to start after a join window timed from the round trip times of the clients that joined
 
     --erasurelow : int
         The lower bound on erasure probability setting (%)
@@ -494,6 +3047,64 @@ def arguments():
     --erasurehigh : int
         The upper bound on erasure probability setting (%)
 
+    --burst-length : float
+        The mean number of packets lost in a row, following a Gilbert-Elliott model, or 0 for independent losses
+
+    --fsync : str
+        When received data is synced to disk: "none" (the default), after every "generation", or once at the "end"
+
+    --compress : str
+        The codec generations are compressed with: "none" (the default), "zlib", or "zstd" (requires the zstandard package).
+        Generations that would not be sent in fewer packets are sent as they are, and compression is switched off if a
+        sample of the file does not compress
+
+    --fec : str
+        The parity sent after each generation: "none" (the default), "xor" to recover one loss per stripe, or "rs" for
+        Reed-Solomon parity that recovers any --parity losses (requires NumPy)
+
+    --parity : int
+        The number of parity packets sent per generation
+
+    --read-ahead : int
+        The number of generations the server reads from the target file ahead of the send path
+
+    --interleave : int
+        The number of generations whose initial transmissions are interleaved packet by packet, so a burst of losses is
+        spread across them, 1 to send each generation in turn
+
+    --straggler-loss : float
+        The loss rate above which a client is moved to the catch-up session rather than holding the group back, 1 to disable
+
+    --max-lag : int
+        The number of consecutive generations a client may hold the group back before it is moved to the catch-up session, 0 to disable
+
+    --peer-repair : bool
+        Clients that hold a generation answer the repair requests of peer clients before they are sent to the server
+
+    --repair-mode : str
+        How repair packets are sent: multicast, unicast where possible, or auto to choose from the missing packet reports
+
+    --mcast-rate : float
+        The expected multi-cast (basic) link rate in Mbit/s, used when choosing how to send repairs, and the rate a carousel
+        sends at
+
+    --ucast-rate : float
+        The expected uni-cast link rate in Mbit/s, used when choosing how to send repairs
+
+    --carousel : bool
+        The server loops over the file at --mcast-rate without joins or feedback, and clients listen from any generation and
+        leave once they hold the whole file
+
+    --cycles : int
+        The number of cycles a carousel sends, 0 to send until interrupted
+
+    --carousel-loss : int
+        The packet loss rate (%) the expected number of carousel cycles is reported for
+
+    --deadline : float
+        The playout deadline of each generation in seconds from the start of its turn, after which it is no longer repaired
+        and clients deliver it with any lost packets replaced by zeros, 0 to repair every generation until every client holds it
+
     Returns
     -------
     args : list
@@ -501,7 +3112,6 @@ def arguments():
     
     """
     parser = argparse.ArgumentParser()
-    ip = socket.gethostbyname(socket.gethostname())
 
     parser.add_argument(
         "--file-path",
@@ -515,6 +3125,9 @@ def arguments():
         help="Path to the file which should be received.",
         default="output_file",
     )
+    parser.add_argument(
+        "--basis", type=str, help="Existing copy of the file for a delta transfer", default=None
+    )
     parser.add_argument(
         "--ip", type=str, help="The IP address to send to.", default=MCAST_GRP
     )
@@ -522,13 +3135,19 @@ def arguments():
         "--port", type=int, help="The port to send to.", default=MCAST_PORT
     )
     parser.add_argument(
-        "--packet-size", type=int, help="Packet size in bytes.", default=1400
+        "--packet-size", type=int, help="Packet payload size in bytes, derived from the MTU by default.", default=None
+    )
+    parser.add_argument(
+        "--mtu", type=int, help="Path MTU in bytes, discovered by default.", default=None
     )
     parser.add_argument(
         "--gen-size", type=int, help="Number of packets per generation.", default=20
     )
     parser.add_argument(
-        "--hostname", type=int, help="Client hostname", default=ip
+        "--hostname", type=int, help="Client ID, random by default", default=None
+    )
+    parser.add_argument(
+        "--expect-clients", type=int, help="Start as soon as this many clients have joined", default=0
     )
     parser.add_argument(
         "--erasurelow", type=int, help="Erasure low percentage", default=0
@@ -536,5 +3155,56 @@ def arguments():
     parser.add_argument(
         "--erasurehigh", type=int, help="Erasure high percentage", default=0
     )
+    parser.add_argument(
+        "--burst-length", type=float, help="Mean packets per loss burst, 0 for independent losses", default=0
+    )
+    parser.add_argument(
+        "--fsync", type=str, help="When to sync received data to disk", default="none", choices=["none", "generation", "end"]
+    )
+    parser.add_argument(
+        "--compress", type=str, help="Generation compression", default="none", choices=list(CODECS)
+    )
+    parser.add_argument(
+        "--fec", type=str, help="Parity sent per generation", default="none", choices=list(FEC_SCHEMES)
+    )
+    parser.add_argument(
+        "--parity", type=int, help="Parity packets per generation", default=2
+    )
+    parser.add_argument(
+        "--read-ahead", type=int, help="Generations read ahead of sending", default=4
+    )
+    parser.add_argument(
+        "--interleave", type=int, help="Generations interleaved in the initial transmission", default=1
+    )
+    parser.add_argument(
+        "--straggler-loss", type=float, help="Loss rate that moves a client to catch-up", default=0.2
+    )
+    parser.add_argument(
+        "--max-lag", type=int, help="Generations a client may hold the group back", default=3
+    )
+    parser.add_argument(
+        "--peer-repair", action="store_true", help="Clients repair each other before asking the server"
+    )
+    parser.add_argument(
+        "--repair-mode", type=str, help="Repair delivery", default="auto", choices=["multicast", "unicast", "auto"]
+    )
+    parser.add_argument(
+        "--mcast-rate", type=float, help="Multi-cast link rate in Mbit/s", default=6
+    )
+    parser.add_argument(
+        "--ucast-rate", type=float, help="Uni-cast link rate in Mbit/s", default=54
+    )
+    parser.add_argument(
+        "--carousel", action="store_true", help="Loop over the file without feedback"
+    )
+    parser.add_argument(
+        "--cycles", type=int, help="Carousel cycles, 0 until interrupted", default=0
+    )
+    parser.add_argument(
+        "--carousel-loss", type=int, help="Loss percentage for the expected carousel cycles", default=10
+    )
+    parser.add_argument(
+        "--deadline", type=float, help="Playout deadline per generation in seconds, 0 for none", default=0
+    )
     args = parser.parse_args()
     return args